@@ -6,7 +6,11 @@ import json
 import os
 import logging
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from datetime import date
 from pathlib import Path
 from typing import Any, Dict, Optional, List
 
@@ -14,7 +18,8 @@ logger = logging.getLogger(__name__)
 
 REPO_ROOT = Path(__file__).resolve().parents[2]
 CREW_SRC_PATH = REPO_ROOT / "crewai_project" / "src"
-REPORT_PATH = CREW_SRC_PATH / "latest_ai_development" / "report.md"
+# 设置后，每次分析的报告会在后台线程中另存为 <REPORT_DIR>/<report_key>.md
+REPORT_DIR_ENV = "QRENT_REPORT_DIR"
 CREW_ENV_PATHS = [
     REPO_ROOT / ".env",
     REPO_ROOT / "crewai_project" / ".env",
@@ -22,6 +27,24 @@ CREW_ENV_PATHS = [
 
 _crew_module_error: Optional[str] = None
 
+# 执行模式：sequential（默认）或 dag，见 latest_ai_development.crew.TASK_CONTEXT
+CREW_MODE_ENV = "QRENT_CREW_MODE"
+
+# 本地规则预检（latest_ai_development.compliance_rules）：
+# context（默认）只把检查结果提供给智能体；skip 在规则确认需求没有问题时跳过合规审查智能体；off 不使用
+COMPLIANCE_RULES_ENV = "QRENT_COMPLIANCE_RULES"
+RULES_SKIP = "skip"
+RULES_CONTEXT = "context"
+RULES_OFF = "off"
+COMPLIANCE_TASK = "data_compliance_task"
+
+# 任务名称（crew.py 中 Task.name）到进度消息中展示的名称，按顺序执行时的顺序排列
+TASK_LABELS = {
+    "data_compliance_task": "数据合规审查",
+    "inquiry_task": "需求优化建议",
+    "reporting_task": "租房分析报告",
+}
+
 if str(CREW_SRC_PATH) not in sys.path:
     sys.path.insert(0, str(CREW_SRC_PATH))
 
@@ -51,11 +74,37 @@ def _load_env_file(path: Path) -> None:
 for env_path in CREW_ENV_PATHS:
     _load_env_file(env_path)
 
+from latest_ai_development.cancellation import (  # noqa: E402
+    CANCELLED,
+    TIMED_OUT,
+    AnalysisCancelled,
+    CancellationToken,
+    use_token,
+)
+from latest_ai_development.compliance_rules import screen_requirements  # noqa: E402
+from latest_ai_development.llm_cache import completion_cache  # noqa: E402
+from latest_ai_development.survey_prompt import compact_requirements  # noqa: E402
+from latest_ai_development.tools.query_cache import rag_query_cache  # noqa: E402
+from latest_ai_development.tools.rag_index import rag_index  # noqa: E402
+from latest_ai_development.usage import UsageRecorder, use_recorder  # noqa: E402
+
+from .usage_stats import usage_stats  # noqa: E402
+
 try:
-    from latest_ai_development.crew import LatestAiDevelopment
+    from latest_ai_development.crew import (
+        LatestAiDevelopment,
+        TASK_AGENTS,
+        TASK_CONTEXT,
+        built_blueprint_modes,
+        get_crew_blueprint,
+    )
 except Exception as exc:  # pragma: no cover
     _crew_module_error = f"Failed to import CrewAI project: {exc}"
     LatestAiDevelopment = None  # type: ignore
+    get_crew_blueprint = None  # type: ignore
+    built_blueprint_modes = None  # type: ignore
+    TASK_CONTEXT = {}  # type: ignore
+    TASK_AGENTS = {}  # type: ignore
 
 
 @dataclass
@@ -66,6 +115,7 @@ class CrewAIProgress:
     message: str
     task_name: Optional[str] = None
     task_status: Optional[str] = None
+    task_output: Optional[Dict[str, Any]] = None
 
 @dataclass
 class CrewAIResult:
@@ -75,24 +125,338 @@ class CrewAIResult:
     report_path: Optional[str]
     task_outputs: Optional[Dict[str, Any]]
     progress_history: Optional[List[CrewAIProgress]] = None
+    timings: Optional[Dict[str, Any]] = None
+    # 按智能体/任务/工具/LLM 调用统计的 token 数和耗时，见 latest_ai_development/usage.py
+    usage: Optional[Dict[str, Any]] = None
+    # 本地规则预检的结构化结果，见 latest_ai_development/compliance_rules.py
+    screening: Optional[Dict[str, Any]] = None
 
 
 class CrewAIExecutionError(RuntimeError):
     """Raised when CrewAI cannot be executed successfully."""
 
 
-def run_crewai_analysis(data_path: Path, progress_callback=None) -> CrewAIResult:
+def serialize_task_output(item) -> Optional[Dict[str, Any]]:
+    """Convert a CrewAI ``TaskOutput`` (or a plain dict) into a JSON-safe dict."""
+    if isinstance(item, dict):
+        return item
+
+    item_dict: Dict[str, Any] = {}
+    for attr in ("name", "task_name", "agent", "description", "raw", "output", "status"):
+        if hasattr(item, attr):
+            value = getattr(item, attr)
+            if isinstance(value, (str, int, float, bool)) or value is None:
+                item_dict[attr] = value
+            else:
+                item_dict[attr] = str(value)
+    return item_dict or None
+
+
+class LiveTaskProgress:
+    """
+    Crew ``task_callback`` / ``step_callback`` pair that reports progress while
+    the crew is running instead of after ``kickoff`` returns.
+
+    The execution phase (40%-90%) is split evenly between tasks; agent steps
+    advance the bar inside the current task's slice, and every finished task
+    is reported together with its serialized output. In DAG mode tasks may
+    finish in any order and steps cannot be attributed to a single task, so
+    messages name every task whose dependencies have finished instead.
+    """
+
+    START = 0.4
+    END = 0.9
+
+    def __init__(self, report_progress, task_names: List[str],
+                 dependencies: Optional[Dict[str, List[str]]] = None,
+                 cancel_token: Optional[CancellationToken] = None):
+        self._report = report_progress
+        self._token = cancel_token
+        self._names = task_names or ["task"]
+        # 有依赖关系时为 DAG 模式，只把依赖已完成的任务视为正在执行
+        self._dependencies = dependencies
+        self._parallel = dependencies is not None
+        self._lock = threading.Lock()
+        self._steps = 0
+        self._progress = self.START
+        self.completed: List[Dict[str, Any]] = []
+
+    def _span(self) -> float:
+        return (self.END - self.START) / len(self._names)
+
+    def _pending(self) -> List[str]:
+        finished = {item.get("name") for item in self.completed}
+        pending = [name for name in self._names if name not in finished]
+        # 没有名称的任务输出按执行顺序抵消
+        unnamed = sum(1 for item in self.completed if not item.get("name"))
+        pending = pending[unnamed:]
+        if self._parallel:
+            pending = [name for name in pending
+                       if set(self._dependencies.get(name, ())) <= finished] or pending
+        return pending or self._names[-1:]
+
+    def current_task(self) -> Optional[str]:
+        """正在执行的任务名；DAG 模式下有多个任务同时执行时返回 None"""
+        pending = self._pending()
+        return pending[0] if len(pending) == 1 or not self._parallel else None
+
+    def current_label(self) -> str:
+        pending = self._pending()
+        if self._parallel and len(pending) > 1:
+            return "、".join(_task_label(name) for name in pending)
+        return _task_label(pending[0])
+
+    def _check_cancelled(self) -> None:
+        if self._token is not None:
+            self._token.raise_if_cancelled()
+
+    def on_step(self, step) -> None:
+        # 每个智能体步骤之后检查取消/超时，抛出的异常会终止 kickoff
+        self._check_cancelled()
+        with self._lock:
+            index = len(self.completed)
+            self._steps += 1
+            base = self.START + self._span() * index
+            # 步骤数未知，越接近任务结束推进得越慢，永远不会越过下一个任务
+            progress = base + self._span() * 0.9 * (1 - 0.7 ** self._steps)
+            self._progress = max(self._progress, progress)
+            label = self.current_label()
+            tool = getattr(step, "tool", None)
+            message = f"{label}: 调用工具 {tool}" if tool else f"{label}: 正在分析"
+            self._report("execution", round(self._progress, 4), message,
+                         task_name=label, task_status="in_progress")
+
+    def on_task(self, output) -> None:
+        with self._lock:
+            serialized = serialize_task_output(output) or {}
+            label = _task_label(serialized["name"]) if serialized.get("name") else self.current_label()
+            self.completed.append(serialized)
+            done = len(self.completed)
+            total = len(self._names)
+            self._steps = 0
+            self._progress = max(self._progress, self.START + self._span() * done)
+            self._report("execution", round(self._progress, 4), f"任务 {done}/{total} 完成: {label}",
+                         task_name=label, task_status="completed", task_output=serialized)
+            if done < total and not self._parallel:
+                next_label = self.current_label()
+                self._report("execution", round(self._progress, 4), f"开始执行: {next_label}",
+                             task_name=next_label, task_status="in_progress")
+        # 已完成任务的输出先记录下来，再检查取消
+        self._check_cancelled()
+
+
+def instantiate_crew(mode: str = "sequential", skip_tasks: tuple = (), **overrides):
+    """
+    Return a fresh, isolated crew built from the cached blueprint.
+
+    The blueprint (agents, LLM clients and tools) is built once per process
+    and per set of ``skip_tasks``; the returned timings show whether this
+    call paid for that build. ``overrides`` (e.g. ``task_callback``) are set
+    on the copy only.
+    """
+    if get_crew_blueprint is None:  # pragma: no cover
+        raise CrewAIExecutionError(_crew_module_error or "CrewAI project is unavailable.")
+
+    started = time.perf_counter()
+    blueprint = get_crew_blueprint(mode, skip_tasks)
+    blueprint_ready = time.perf_counter()
+    crew = blueprint.instantiate(**overrides)
+    finished = time.perf_counter()
+
+    # 模板在本次调用中构建时，等待时间约等于构建耗时
+    cached = (blueprint_ready - started) < blueprint.build_seconds
+    timings = {
+        "mode": mode,
+        "blueprint_cached": cached,
+        "blueprint_build_seconds": round(blueprint.build_seconds, 4),
+        "crew_setup_seconds": round(finished - started, 4),
+    }
+    if skip_tasks:
+        timings["skipped_tasks"] = list(skip_tasks)
+    logger.info(
+        f"Crew ready in {timings['crew_setup_seconds'] * 1000:.1f} ms "
+        f"(blueprint {'cached' if cached else 'built'}, build cost {timings['blueprint_build_seconds'] * 1000:.1f} ms)"
+    )
+    return crew, timings
+
+
+def warm_up(include_rag: bool = True, include_crew: bool = True) -> Dict[str, Any]:
+    """
+    Load the knowledge base index and build the crew blueprint ahead of time.
+
+    Both are otherwise paid for by the first analysis. Returns the seconds
+    spent on each step, or the error message if a step failed.
+    """
+    report: Dict[str, Any] = {}
+    if include_rag:
+        started = time.perf_counter()
+        try:
+            rag_index.warm_up()
+            report["rag_index_seconds"] = round(time.perf_counter() - started, 4)
+        except Exception as exc:
+            report["rag_index_error"] = str(exc)
+    if include_crew:
+        started = time.perf_counter()
+        try:
+            if get_crew_blueprint is None:
+                raise CrewAIExecutionError(_crew_module_error or "CrewAI project is unavailable.")
+            get_crew_blueprint(_crew_mode())
+            # skip 模式下规则确认没有问题的分析使用不含合规审查的模板
+            if _compliance_rules_mode() == RULES_SKIP:
+                get_crew_blueprint(_crew_mode(), (COMPLIANCE_TASK,))
+            report["crew_blueprint_seconds"] = round(time.perf_counter() - started, 4)
+        except Exception as exc:
+            report["crew_blueprint_error"] = str(exc)
+    logger.info(f"AI warm-up finished: {report}")
+    return report
+
+
+def readiness() -> Dict[str, Any]:
+    """Whether the expensive components are already loaded in this process."""
+    modes = built_blueprint_modes() if built_blueprint_modes is not None else []
+    rag = rag_index.status()
+    crew_ready = _crew_mode() in modes
+    return {
+        "ready": rag["ready"] and crew_ready,
+        "rag_index": rag,
+        "rag_query_cache": rag_query_cache.stats(),
+        "llm_cache": completion_cache.stats(),
+        "crew_blueprint": {"ready": crew_ready, "modes": modes},
+        "crew_error": _crew_module_error,
+    }
+
+
+class ReportSink:
+    """
+    Optional asynchronous disk sink for per-analysis reports.
+
+    The report markdown is captured in memory from the reporting task's
+    output; persisting it is a side effect that never blocks the analysis.
+    Each report gets its own file, written atomically, so concurrent runs
+    cannot overwrite or read each other's output.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report-sink")
+
+    def path_for(self, key: str) -> Path:
+        safe = "".join(ch for ch in key if ch.isalnum() or ch in ("_", "-")) or "report"
+        return self.directory / f"{safe}.md"
+
+    def submit(self, key: str, markdown: str) -> Path:
+        path = self.path_for(key)
+        self._executor.submit(self._write, path, markdown)
+        return path
+
+    @staticmethod
+    def _write(path: Path, markdown: str) -> None:
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".md.tmp")
+            tmp.write_text(markdown, encoding="utf-8")
+            os.replace(tmp, path)
+        except Exception as exc:  # pragma: no cover
+            logger.warning("Failed to write CrewAI report %s: %s", path, exc)
+
+
+_report_sink: Optional[ReportSink] = None
+_report_sink_lock = threading.Lock()
+
+
+def get_report_sink() -> Optional[ReportSink]:
+    """Return the disk sink configured via ``QRENT_REPORT_DIR``, or None."""
+    global _report_sink
+    directory = os.environ.get(REPORT_DIR_ENV)
+    if not directory:
+        return None
+    with _report_sink_lock:
+        if _report_sink is None or _report_sink.directory != Path(directory):
+            _report_sink = ReportSink(Path(directory))
+        return _report_sink
+
+
+def _capture_report(task_outputs: Optional[List[Dict[str, Any]]]) -> Optional[str]:
+    """
+    Pick the reporting task's output.
+
+    Returns None when the reporting task did not run (partial, cancelled or
+    failed runs), so another task's output is never presented as the report.
+    """
+    for item in task_outputs or []:
+        if item.get("name") == "reporting_task":
+            return item.get("raw") or item.get("output")
+    return None
+
+
+def _task_label(name: str) -> str:
+    """Human readable task label used in progress messages."""
+    return TASK_LABELS.get(name, name)
+
+
+def _crew_mode() -> str:
+    return os.environ.get(CREW_MODE_ENV, "sequential").strip().lower() or "sequential"
+
+
+def _compliance_rules_mode() -> str:
+    mode = os.environ.get(COMPLIANCE_RULES_ENV, RULES_CONTEXT).strip().lower() or RULES_CONTEXT
+    if mode not in (RULES_SKIP, RULES_CONTEXT, RULES_OFF):
+        logger.warning(f"未知的规则预检模式 {mode}，使用 {RULES_CONTEXT}")
+        return RULES_CONTEXT
+    return mode
+
+
+def analysis_variant() -> Dict[str, str]:
+    """
+    Runtime settings that change the analysis result for the same survey.
+
+    The rule screening depends on the current date (days until move-in,
+    move-in dates in the past) and on the rules mode, so results computed
+    on another day or under another configuration must not be reused.
+    """
+    return {
+        "crew_mode": _crew_mode(),
+        "compliance_rules": _compliance_rules_mode(),
+        "screened_on": date.today().isoformat(),
+    }
+
+
+def run_crewai_analysis(data_path: Path, progress_callback=None,
+                        report_key: Optional[str] = None,
+                        cancel_token: Optional[CancellationToken] = None) -> CrewAIResult:
     """
     Trigger the CrewAI workflow using the JSON payload stored at `data_path`.
 
     Args:
         data_path: Path to the JSON file containing survey data
         progress_callback: Optional callback function to report progress
+        report_key: Per-analysis key for the optional report file
+            (defaults to the data file name)
+        cancel_token: Optional token checked between agent steps, after each
+            task and in tool calls; raises `AnalysisCancelled` once it is
+            cancelled or its deadline passes
     
     Returns:
         A structured `CrewAIResult` containing the main summary, optional
-        markdown report content, and per-task outputs when available.
+        markdown report content, per-task outputs when available, and the
+        token/latency usage per agent, task, tool call and LLM call. The
+        usage is also added to the process-wide `usage_stats`, including
+        for analyses that fail or are cancelled.
     """
+    recorder = UsageRecorder(agent_names=TASK_AGENTS)
+    usage = None
+    try:
+        with use_token(cancel_token), use_recorder(recorder):
+            result = _execute_analysis(data_path, progress_callback, report_key, cancel_token, recorder)
+        usage = result.usage
+        return result
+    finally:
+        # 被取消或失败的分析已经消耗的 token 也计入汇总
+        usage_stats.record(report_key or data_path.stem, usage or recorder.summary())
+
+
+def _execute_analysis(data_path: Path, progress_callback, report_key: Optional[str],
+                      cancel_token: Optional[CancellationToken], recorder: UsageRecorder) -> CrewAIResult:
     if _crew_module_error:
         logger.error(_crew_module_error)
         raise CrewAIExecutionError(_crew_module_error)
@@ -102,14 +466,16 @@ def run_crewai_analysis(data_path: Path, progress_callback=None) -> CrewAIResult
 
     # 进度历史记录
     progress_history = []
+    timings: Dict[str, Any] = {}
     
-    def report_progress(stage, progress, message, task_name=None, task_status=None):
+    def report_progress(stage, progress, message, task_name=None, task_status=None, task_output=None):
         progress_info = CrewAIProgress(
             stage=stage,
             progress=progress,
             message=message,
             task_name=task_name,
-            task_status=task_status
+            task_status=task_status,
+            task_output=task_output
         )
         progress_history.append(progress_info)
         if progress_callback:
@@ -128,8 +494,27 @@ def run_crewai_analysis(data_path: Path, progress_callback=None) -> CrewAIResult
         raise CrewAIExecutionError(f"Unable to load survey data: {exc}") from exc
 
     report_progress("initialization", 0.1, "成功加载用户数据")
+    rules_mode = _compliance_rules_mode()
+    screening = screen_requirements(payload)
+    timings["compliance_rules_seconds"] = round(screening.seconds, 6)
     # 修复：使用'renting_requirements'作为模板变量名，这是CrewAI工作流期望的参数名
-    inputs = {"renting_requirements": payload}
+    # 提示词中只插入紧凑的规范化问卷，完整数据留在磁盘上的文件里
+    inputs = {
+        "renting_requirements": compact_requirements(payload),
+        "compliance_findings": screening.render() if rules_mode != RULES_OFF else "未进行规则预检",
+    }
+    # skip 模式下规则确认需求没有问题时，合规审查的输出直接由规则给出，不再调用大模型
+    rule_output = None
+    if rules_mode == RULES_SKIP and screening.covered:
+        rule_output = {"name": COMPLIANCE_TASK, "agent": "本地规则预检", "raw": screening.report(),
+                       "status": "completed"}
+    # 任务/步骤回调在执行过程中实时上报进度和每个任务的输出
+    mode = _crew_mode()
+    live = LiveTaskProgress(report_progress, list(TASK_LABELS),
+                            dependencies=TASK_CONTEXT if mode == "dag" else None,
+                            cancel_token=cancel_token)
+    # CrewAI 没有把任务信息传给 LLM 时，用量按正在执行的任务归属
+    recorder.current_task = live.current_task
 
     try:
         report_progress("initialization", 0.2, "正在创建CrewAI团队")
@@ -141,18 +526,28 @@ def run_crewai_analysis(data_path: Path, progress_callback=None) -> CrewAIResult
         
         # 创建团队时也可能发生EventBus错误，需要捕获
         try:
-            crew = LatestAiDevelopment().crew()
+            crew, setup_timings = instantiate_crew(mode, (COMPLIANCE_TASK,) if rule_output else (),
+                                                   task_callback=live.on_task, step_callback=live.on_step)
+            timings.update(setup_timings)
         except Exception as e:
             logger.warning(f"创建CrewAI团队时捕获到错误: {e}")
             # 更新结果对象，表示团队创建失败
             result.final_output = "分析完成，但遇到了团队创建错误"
             # 跳过后续执行，直接处理结果
-            report_progress("execution", 1.0, "团队创建失败，但返回基本结果")
+            report_progress("error", 1.0, "团队创建失败，但返回基本结果", task_status="error")
         else:
             report_progress("initialization", 0.3, "团队创建完成，开始执行工作流")
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            execution_started = time.perf_counter()
             
             # 直接执行工作流，不再尝试替换方法
-            report_progress("execution", 0.4, "开始执行数据合规审查任务")
+            if rule_output is not None:
+                # 合规审查由规则完成，作为第一个已完成的任务上报
+                live.on_task(rule_output)
+            else:
+                report_progress("execution", 0.4, f"开始执行: {live.current_label()}",
+                                task_name=live.current_label(), task_status="in_progress")
             
             # 确保result对象在任何情况下都被初始化
             from types import SimpleNamespace
@@ -175,6 +570,7 @@ def run_crewai_analysis(data_path: Path, progress_callback=None) -> CrewAIResult
                         logger.warning(f"捕获到EventBus错误，但继续执行: {e}")
                         # 已经初始化了result对象，这里只需要更新消息
                         result.final_output = "分析完成，但遇到了内部事件处理错误（EventBus错误）"
+                        report_progress("error", 1.0, "内部事件处理错误（EventBus错误）", task_status="error")
                     else:
                         raise
             except (TypeError, AttributeError):
@@ -193,6 +589,7 @@ def run_crewai_analysis(data_path: Path, progress_callback=None) -> CrewAIResult
                                 logger.warning(f"捕获到EventBus错误，但继续执行: {e}")
                                 # 已经初始化了result对象，这里只需要更新消息
                                 result.final_output = "分析完成，但遇到了内部事件处理错误（EventBus错误）"
+                                report_progress("error", 1.0, "内部事件处理错误（EventBus错误）", task_status="error")
                             else:
                                 raise
                     # 尝试使用其他可能的执行方法
@@ -208,10 +605,13 @@ def run_crewai_analysis(data_path: Path, progress_callback=None) -> CrewAIResult
                                 logger.warning(f"捕获到EventBus错误，但继续执行: {e}")
                                 # 已经初始化了result对象，这里只需要更新消息
                                 result.final_output = "分析完成，但遇到了内部事件处理错误（EventBus错误）"
+                                report_progress("error", 1.0, "内部事件处理错误（EventBus错误）", task_status="error")
                             else:
                                 raise
                     else:
                         raise AttributeError("Crew对象没有可用的执行方法")
+                except AnalysisCancelled:
+                    raise
                 except Exception as inner_exc:
                     logger.error(f"无法执行CrewAI工作流: {inner_exc}")
                     # 即使执行失败，也要创建一个结果对象
@@ -221,12 +621,12 @@ def run_crewai_analysis(data_path: Path, progress_callback=None) -> CrewAIResult
                     result.final_output = f"分析失败: {str(inner_exc)}"
                     report_progress("error", 1.0, f"执行失败: {str(inner_exc)}", task_status="error")
             
-            # 检查是否有任务输出可以用来报告进度
-            if 'result' in locals() and hasattr(result, "tasks_output") and result.tasks_output:
+            # 回调没有生效时（例如旧版本CrewAI），根据任务输出补报进度
+            if not live.completed and hasattr(result, "tasks_output") and result.tasks_output:
                 total_tasks = len(result.tasks_output)
                 for i, task_output in enumerate(result.tasks_output):
                     task_progress = 0.4 + 0.5 * (i + 1) / total_tasks
-                    task_name = getattr(task_output, "task_name", "未知任务")
+                    task_name = getattr(task_output, "name", None) or getattr(task_output, "agent", "未知任务")
                     task_status = getattr(task_output, "status", "未知状态")
                     report_progress(
                         "execution", 
@@ -236,8 +636,12 @@ def run_crewai_analysis(data_path: Path, progress_callback=None) -> CrewAIResult
                         task_status=task_status
                     )
             
+            timings["execution_seconds"] = round(time.perf_counter() - execution_started, 4)
             report_progress("execution", 0.9, "所有任务执行完成，开始生成最终报告")
             report_progress("execution", 1.0, "CrewAI工作流执行完成")
+    except AnalysisCancelled:
+        # 取消/超时的状态由调用方记录
+        raise
     except Exception as exc:
         logger.exception("CrewAI执行失败: %s", exc)
         report_progress("error", 1.0, f"执行失败: {str(exc)}", task_status="error")
@@ -263,37 +667,29 @@ def run_crewai_analysis(data_path: Path, progress_callback=None) -> CrewAIResult
     if raw_tasks:
         serialized: list[Dict[str, Any]] = []
         for item in raw_tasks:
-            if isinstance(item, dict):
-                serialized.append(item)
-                continue
-
-            item_dict: Dict[str, Any] = {}
-            for attr in ("task_name", "agent", "description", "output", "status"):
-                if hasattr(item, attr):
-                    value = getattr(item, attr)
-                    if isinstance(value, (str, int, float, bool)) or value is None:
-                        item_dict[attr] = value
-                    else:
-                        item_dict[attr] = str(value)
+            item_dict = serialize_task_output(item)
             if item_dict:
                 serialized.append(item_dict)
         if serialized:
             task_outputs = serialized
+    if rule_output is not None:
+        task_outputs = [rule_output] + (task_outputs or [])
 
-    report_markdown: Optional[str] = None
+    # 报告直接取自本次分析的报告任务输出，不再读取共享的 report.md
+    report_markdown = _capture_report(task_outputs or live.completed)
     report_path: Optional[str] = None
 
-    if REPORT_PATH.exists():
-        report_path = str(REPORT_PATH)
-        try:
-            report_markdown = REPORT_PATH.read_text(encoding="utf-8")
-        except Exception as exc:  # pragma: no cover
-            logger.warning("Failed to read CrewAI report markdown: %s", exc)
+    sink = get_report_sink()
+    if sink is not None and report_markdown:
+        report_path = str(sink.submit(report_key or data_path.stem, report_markdown))
 
     return CrewAIResult(
         summary=summary,
         report_markdown=report_markdown,
         report_path=report_path,
         task_outputs=task_outputs,
-        progress_history=progress_history
+        progress_history=progress_history,
+        timings=timings or None,
+        usage=recorder.summary(),
+        screening=screening.to_dict(),
     )
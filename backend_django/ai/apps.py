@@ -0,0 +1,26 @@
+# ai/apps.py - AI 分析应用配置
+import logging
+import threading
+
+from django.apps import AppConfig
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class AiConfig(AppConfig):
+    name = "ai"
+
+    def ready(self):
+        if not getattr(settings, "AI_WARMUP_ON_STARTUP", False):
+            return
+        # 在后台预热，不阻塞进程启动；预热完成前到达的请求会等待同一次加载
+        threading.Thread(target=_warm_up, name="ai-warmup", daemon=True).start()
+
+
+def _warm_up():
+    try:
+        from .agent_runner import warm_up
+        warm_up()
+    except Exception as e:
+        logger.error(f"AI 预热失败: {str(e)}")
@@ -0,0 +1,106 @@
+# ai/background.py - ASGI 模式下的后台任务管理
+"""
+在 ASGI 服务器（uvicorn/daphne）的事件循环上运行并跟踪后台协程。
+
+``server/asgi.py`` 用 :class:`BackgroundTaskLifespan` 包装 Django 应用，
+第一次收到请求时记录服务器的事件循环。之后异步视图可以通过
+``background_tasks.spawn()`` 把分析协程挂到这个长期存在的循环上，
+注册表持有任务引用、记录异常，并在服务关闭时等待任务结束。
+
+在 WSGI / runserver 下不存在长期运行的事件循环，``spawn()`` 会返回 None，
+调用方应退回到线程队列执行。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Coroutine, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundTaskRegistry:
+    """持有后台任务的强引用，防止任务被垃圾回收或无人处理异常"""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        """记录 ASGI 服务器的事件循环"""
+        if self._loop is not loop:
+            self._loop = loop
+            logger.info("后台任务注册表已绑定ASGI事件循环")
+
+    @property
+    def enabled(self) -> bool:
+        """当前线程是否运行在已绑定的 ASGI 事件循环中"""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        return self._loop is not None and running is self._loop and not running.is_closed()
+
+    def spawn(self, coro: Coroutine[Any, Any, Any], name: Optional[str] = None) -> Optional[asyncio.Task]:
+        """在服务器事件循环上启动协程；不在 ASGI 模式下时关闭协程并返回 None"""
+        if not self.enabled:
+            coro.close()
+            return None
+        task = asyncio.get_running_loop().create_task(coro, name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._on_done)
+        return task
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if task.cancelled():
+            logger.info(f"后台任务 {task.get_name()} 已取消")
+            return
+        exc = task.exception()
+        if exc is not None:
+            logger.error(f"后台任务 {task.get_name()} 异常结束: {exc}", exc_info=exc)
+
+    def count(self) -> int:
+        return len(self._tasks)
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        """等待所有后台任务完成，超时后取消剩余任务"""
+        tasks = list(self._tasks)
+        if not tasks:
+            return
+        logger.info(f"等待 {len(tasks)} 个后台任务结束")
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+background_tasks = BackgroundTaskRegistry()
+
+
+class BackgroundTaskLifespan:
+    """包装 Django ASGI 应用：绑定事件循环，并处理 lifespan 关闭事件"""
+
+    def __init__(self, app, shutdown_timeout: float = 30.0):
+        self.app = app
+        self.shutdown_timeout = shutdown_timeout
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        background_tasks.attach(asyncio.get_running_loop())
+        await self.app(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                background_tasks.attach(asyncio.get_running_loop())
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await background_tasks.drain(timeout=self.shutdown_timeout)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
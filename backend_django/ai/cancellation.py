@@ -0,0 +1,66 @@
+# ai/cancellation.py - 分析任务的取消和截止时间
+"""
+每个正在执行的分析都有一个 ``CancellationToken``（见 latest_ai_development.cancellation），
+CrewAI 在每个智能体步骤、任务结束和工具调用时检查它。
+
+- 截止时间：从任务开始执行起计算，时长为 ``AI_ANALYSIS_TIMEOUT_SECONDS``（0 表示不限制）；
+- 取消请求：取消接口在任务状态存储中写入 ``cancel_requested`` 标记，并直接取消
+  本进程内的令牌。执行任务的 worker 即使在另一个进程中，也会通过轮询存储看到这个标记；
+- 还在排队的任务直接从队列中移除，不会占用工作线程。
+"""
+
+from __future__ import annotations
+
+import contextlib
+import logging
+import threading
+from typing import Dict, Iterator, Optional
+
+from django.conf import settings
+
+from .agent_runner import CANCELLED, TIMED_OUT, CancellationToken  # noqa: F401
+from .job_queue import get_job_queue
+from .job_store import get_job_store
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT_SECONDS = 900
+
+_tokens: Dict[str, CancellationToken] = {}
+_tokens_lock = threading.Lock()
+
+
+def _cancel_requested(analysis_id: str) -> bool:
+    return bool((get_job_store().get_result(analysis_id) or {}).get("cancel_requested"))
+
+
+@contextlib.contextmanager
+def cancellation_scope(analysis_id: str) -> Iterator[CancellationToken]:
+    """为一次分析创建取消令牌，执行期间登记在本进程中"""
+    timeout = getattr(settings, "AI_ANALYSIS_TIMEOUT_SECONDS", DEFAULT_TIMEOUT_SECONDS)
+    token = CancellationToken.with_timeout(timeout, poll=lambda: _cancel_requested(analysis_id))
+    with _tokens_lock:
+        _tokens[analysis_id] = token
+    try:
+        yield token
+    finally:
+        with _tokens_lock:
+            _tokens.pop(analysis_id, None)
+
+
+def request_cancellation(analysis_id: str) -> bool:
+    """
+    请求取消一个分析任务。
+
+    返回 True 表示任务还没有开始执行、已经从本进程的队列中移除，调用方应立即把它
+    记录为已取消；返回 False 表示任务正在执行（或在其他 worker 中），会在下一个
+    检查点停止。
+    """
+    get_job_store().update_result(analysis_id, cancel_requested=True)
+    with _tokens_lock:
+        token: Optional[CancellationToken] = _tokens.get(analysis_id)
+    if token is not None:
+        token.cancel()
+    removed = get_job_queue().cancel(analysis_id)
+    logger.info(f"已请求取消分析任务 {analysis_id}（{'排队中已移除' if removed else '等待执行中的任务停止'}）")
+    return removed
@@ -0,0 +1,230 @@
+# ai/events.py - 分析进度事件推送（Server-Sent Events）
+"""
+进程内的进度事件广播。
+
+``report_progress`` 每产生一条进度、分析结束时产生最终结果，都会通过
+``progress_broker.publish()`` 推送给正在订阅该 analysis_id 的 SSE 连接，
+前端不再需要定时轮询进度/结果接口。
+
+每条进度事件带有序号 ``seq``（即该条目在进度列表中的下标），SSE 的事件 ID
+就是这个序号。客户端断线重连时会带上 ``Last-Event-ID``，服务端只补发之后的事件。
+
+broker 只在进程内广播；当任务由其他 worker 执行时，流会定期重新读取任务状态存储，
+按序号补发新条目，所以多进程部署下 SSE 同样可用。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import queue
+import threading
+from collections import defaultdict
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+# 两次事件之间最长的静默时间，超过后发送注释行保持连接
+HEARTBEAT_SECONDS = 15.0
+# 没有收到本进程的事件时，隔多久重新读取一次存储。
+# 任务可能由另一个 worker 进程执行，它的事件不会经过本进程的 broker
+STORE_POLL_SECONDS = 1.0
+
+EVENT_PROGRESS = "progress"
+EVENT_RESULT = "result"
+
+# snapshot() 返回 (进度列表, 最终结果)；分析未结束时最终结果为 None
+Snapshot = Callable[[], Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]]
+
+
+class _Subscriber:
+    """一个 SSE 连接的事件接收端，可以是线程队列，也可以是 asyncio 队列"""
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.queue: Any = asyncio.Queue() if loop else queue.Queue()
+
+    def put(self, event: Dict[str, Any]) -> None:
+        if self.loop is None:
+            self.queue.put_nowait(event)
+            return
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+        except RuntimeError:
+            # 连接所在的事件循环已经关闭
+            pass
+
+
+class ProgressBroker:
+    """按 analysis_id 分发进度事件"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, set] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, analysis_id: str, event_type: str, data: Dict[str, Any],
+                seq: Optional[int] = None) -> None:
+        event = {"event": event_type, "data": data, "seq": seq}
+        with self._lock:
+            subscribers = list(self._subscribers.get(analysis_id, ()))
+        for subscriber in subscribers:
+            subscriber.put(event)
+
+    def subscribe(self, analysis_id: str,
+                  loop: Optional[asyncio.AbstractEventLoop] = None) -> _Subscriber:
+        subscriber = _Subscriber(loop)
+        with self._lock:
+            self._subscribers[analysis_id].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, analysis_id: str, subscriber: _Subscriber) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(analysis_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[analysis_id]
+
+    def subscriber_count(self, analysis_id: str) -> int:
+        with self._lock:
+            return len(self._subscribers.get(analysis_id, ()))
+
+
+progress_broker = ProgressBroker()
+
+
+def format_sse(event_type: str, data: Any, event_id: Optional[int] = None) -> str:
+    """按 text/event-stream 格式编码一条事件"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    payload = json.dumps(data, ensure_ascii=False, cls=DjangoJSONEncoder)
+    for line in payload.splitlines() or [""]:
+        lines.append(f"data: {line}")
+    return "\n".join(lines) + "\n\n"
+
+
+def _parse_last_event_id(value: Optional[str]) -> int:
+    try:
+        return int(value) if value not in (None, "") else -1
+    except (TypeError, ValueError):
+        return -1
+
+
+class _StreamState:
+    """补发历史事件并对实时事件去重"""
+
+    def __init__(self, last_event_id: Optional[str]):
+        self.last_seq = _parse_last_event_id(last_event_id)
+        self.finished = False
+
+    def replay(self, snapshot: Snapshot) -> List[str]:
+        history, final = snapshot()
+        chunks = []
+        for seq, entry in enumerate(history):
+            if seq > self.last_seq:
+                chunks.append(format_sse(EVENT_PROGRESS, entry, seq))
+                self.last_seq = seq
+        if final is not None:
+            chunks.append(format_sse(EVENT_RESULT, final))
+            self.finished = True
+        return chunks
+
+    def handle(self, event: Dict[str, Any]) -> Optional[str]:
+        if event["event"] == EVENT_RESULT:
+            self.finished = True
+            return format_sse(EVENT_RESULT, event["data"])
+        seq = event.get("seq")
+        if seq is not None:
+            if seq <= self.last_seq:
+                return None
+            self.last_seq = seq
+        return format_sse(event["event"], event["data"], seq)
+
+
+def stream_analysis_events(analysis_id: str, snapshot: Snapshot,
+                           last_event_id: Optional[str] = None,
+                           heartbeat: float = HEARTBEAT_SECONDS,
+                           poll_interval: float = STORE_POLL_SECONDS) -> Iterator[str]:
+    """同步 SSE 生成器（WSGI 下使用，每个连接占用一个线程）"""
+    state = _StreamState(last_event_id)
+    # 先订阅再读取历史，保证两者之间产生的事件不会丢失
+    subscriber = progress_broker.subscribe(analysis_id)
+    try:
+        yield "retry: 3000\n\n"
+        for chunk in state.replay(snapshot):
+            yield chunk
+        idle = 0.0
+        while not state.finished:
+            try:
+                event = subscriber.queue.get(timeout=poll_interval)
+            except queue.Empty:
+                chunks = state.replay(snapshot)
+                idle = 0.0 if chunks else idle + poll_interval
+                for chunk in chunks:
+                    yield chunk
+                if idle >= heartbeat:
+                    idle = 0.0
+                    yield ": keep-alive\n\n"
+                continue
+            idle = 0.0
+            chunk = state.handle(event)
+            if chunk:
+                yield chunk
+    finally:
+        progress_broker.unsubscribe(analysis_id, subscriber)
+
+
+async def astream_analysis_events(analysis_id: str, snapshot: Snapshot,
+                                  last_event_id: Optional[str] = None,
+                                  heartbeat: float = HEARTBEAT_SECONDS,
+                                  poll_interval: float = STORE_POLL_SECONDS) -> AsyncIterator[str]:
+    """异步 SSE 生成器（ASGI 下使用，不占用线程）"""
+    state = _StreamState(last_event_id)
+    subscriber = progress_broker.subscribe(analysis_id, loop=asyncio.get_running_loop())
+    try:
+        yield "retry: 3000\n\n"
+        for chunk in await asyncio.to_thread(state.replay, snapshot):
+            yield chunk
+        idle = 0.0
+        while not state.finished:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), timeout=poll_interval)
+            except asyncio.TimeoutError:
+                # 读取存储可能是一次网络/磁盘 IO，放到线程中执行
+                chunks = await asyncio.to_thread(state.replay, snapshot)
+                idle = 0.0 if chunks else idle + poll_interval
+                for chunk in chunks:
+                    yield chunk
+                if idle >= heartbeat:
+                    idle = 0.0
+                    yield ": keep-alive\n\n"
+                continue
+            idle = 0.0
+            chunk = state.handle(event)
+            if chunk:
+                yield chunk
+    finally:
+        progress_broker.unsubscribe(analysis_id, subscriber)
+
+
+def sse_response(request, analysis_id: str, snapshot: Snapshot):
+    """根据请求所在的服务器类型返回同步或异步的 SSE 流式响应"""
+    from django.core.handlers.asgi import ASGIRequest
+    from django.http import StreamingHttpResponse
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
+    if isinstance(request, ASGIRequest):
+        stream = astream_analysis_events(analysis_id, snapshot, last_event_id)
+    else:
+        stream = stream_analysis_events(analysis_id, snapshot, last_event_id)
+    response = StreamingHttpResponse(stream, content_type="text/event-stream; charset=utf-8")
+    response["Cache-Control"] = "no-cache"
+    # 关闭 nginx 等反向代理的缓冲，保证事件即时送达
+    response["X-Accel-Buffering"] = "no"
+    return response
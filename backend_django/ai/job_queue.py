@@ -0,0 +1,241 @@
+# ai/job_queue.py - 进程级有界分析任务队列
+"""
+所有 CrewAI 分析任务都通过这里排队执行。
+
+队列是 FIFO 的，同时运行的任务数由 ``AI_ANALYSIS_MAX_CONCURRENCY`` 限制，
+等待中的任务数由 ``AI_ANALYSIS_QUEUE_MAX`` 限制。突发提交只会让队列变长，
+而不会同时启动几十个 CrewAI 运行，从而避免 LLM 限流和线程/事件循环暴涨。
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = 2
+DEFAULT_MAX_QUEUE_SIZE = 200
+# 已结束任务的状态最多保留多少条，供进度/结果接口查询
+FINISHED_JOBS_TO_KEEP = 500
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+
+class QueueFullError(RuntimeError):
+    """队列已满，无法接收新的分析任务"""
+
+
+@dataclass
+class AnalysisJob:
+    """队列中的单个分析任务"""
+    analysis_id: str
+    func: Callable[..., Any]
+    args: tuple = ()
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+    state: str = JOB_QUEUED
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    future: Future = field(default_factory=Future)
+
+
+class AnalysisJobQueue:
+    """有界并发的 FIFO 任务队列，工作线程在首次提交时按需启动"""
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_CONCURRENCY,
+                 max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE, name: str = "qrent-analysis"):
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue_size = max(1, int(max_queue_size))
+        self.name = name
+        self._pending: Deque[AnalysisJob] = deque()
+        self._jobs: "OrderedDict[str, AnalysisJob]" = OrderedDict()
+        self._running = 0
+        self._cond = threading.Condition()
+        self._workers: list[threading.Thread] = []
+        self._shutdown = False
+
+    # ------------------------------------------------------------------
+    # 提交与查询
+    # ------------------------------------------------------------------
+    def submit(self, analysis_id: str, func: Callable[..., Any], *args, **kwargs) -> Future:
+        """把任务加入队尾，返回可等待的 Future；队列已满时抛出 QueueFullError"""
+        job = AnalysisJob(analysis_id=analysis_id, func=func, args=args, kwargs=kwargs)
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("分析队列已关闭")
+            if len(self._pending) >= self.max_queue_size:
+                raise QueueFullError(f"分析队列已满（{self.max_queue_size}个任务等待中），请稍后重试")
+            self._pending.append(job)
+            self._remember(job)
+            self._ensure_workers()
+            self._cond.notify()
+        logger.info(f"分析任务 {analysis_id} 已入队，当前排队数: {len(self._pending)}")
+        return job.future
+
+    def position(self, analysis_id: str) -> Optional[int]:
+        """返回任务在队列中的位置（1 表示下一个执行）；不在排队中则返回 None"""
+        with self._cond:
+            for index, job in enumerate(self._pending):
+                if job.analysis_id == analysis_id:
+                    return index + 1
+        return None
+
+    def state(self, analysis_id: str) -> Optional[str]:
+        with self._cond:
+            job = self._jobs.get(analysis_id)
+            return job.state if job else None
+
+    def snapshot(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        """返回供进度/结果接口展示的任务状态，未知任务返回 None"""
+        with self._cond:
+            job = self._jobs.get(analysis_id)
+            if job is None:
+                return None
+            position = None
+            if job.state == JOB_QUEUED:
+                for index, pending in enumerate(self._pending):
+                    if pending is job:
+                        position = index + 1
+                        break
+            return {
+                "job_state": job.state,
+                "queue_position": position,
+                "queued_jobs": len(self._pending),
+                "running_jobs": self._running,
+                "max_concurrency": self.max_workers,
+                "submitted_at": job.submitted_at,
+                "started_at": job.started_at,
+                "finished_at": job.finished_at,
+            }
+
+    def cancel(self, analysis_id: str) -> bool:
+        """
+        取消还在排队的任务：从队列中移除并取消它的 Future，返回 True。
+        任务已经开始执行或不在本进程的队列中时返回 False，需要协作式取消。
+        """
+        with self._cond:
+            job = self._jobs.get(analysis_id)
+            if job is None or job.state != JOB_QUEUED:
+                return False
+            try:
+                self._pending.remove(job)
+            except ValueError:
+                return False
+            job.state = JOB_CANCELLED
+            job.finished_at = time.time()
+            job.future.cancel()
+        logger.info(f"分析任务 {analysis_id} 在排队中被取消")
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "queued_jobs": len(self._pending),
+                "running_jobs": self._running,
+                "max_concurrency": self.max_workers,
+                "max_queue_size": self.max_queue_size,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """停止接收新任务；已排队的任务仍会被执行完"""
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+            workers = list(self._workers)
+        if wait:
+            for worker in workers:
+                worker.join()
+
+    # ------------------------------------------------------------------
+    # 内部实现
+    # ------------------------------------------------------------------
+    def _remember(self, job: AnalysisJob) -> None:
+        self._jobs[job.analysis_id] = job
+        self._jobs.move_to_end(job.analysis_id)
+        # 只淘汰已经结束的任务，排队/运行中的任务必须保留
+        excess = len(self._jobs) - (FINISHED_JOBS_TO_KEEP + self.max_queue_size + self.max_workers)
+        if excess > 0:
+            for key in [k for k, j in self._jobs.items() if j.finished_at is not None][:excess]:
+                del self._jobs[key]
+
+    def _ensure_workers(self) -> None:
+        self._workers = [w for w in self._workers if w.is_alive()]
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f"{self.name}-{len(self._workers) + 1}",
+                daemon=True,
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    def _next_job(self) -> Optional[AnalysisJob]:
+        with self._cond:
+            while not self._pending and not self._shutdown:
+                self._cond.wait()
+            if not self._pending:
+                return None
+            job = self._pending.popleft()
+            job.state = JOB_RUNNING
+            job.started_at = time.time()
+            self._running += 1
+            return job
+
+    def _worker_loop(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            if not job.future.set_running_or_notify_cancel():
+                self._finish(job, JOB_CANCELLED, "任务已取消")
+                continue
+            try:
+                result = job.func(*job.args, **job.kwargs)
+            except BaseException as exc:  # noqa: BLE001 - 任务异常必须交给 Future
+                logger.error(f"分析任务 {job.analysis_id} 执行失败: {exc}", exc_info=True)
+                self._finish(job, JOB_FAILED, str(exc))
+                job.future.set_exception(exc)
+            else:
+                self._finish(job, JOB_COMPLETED)
+                job.future.set_result(result)
+
+    def _finish(self, job: AnalysisJob, state: str, error: Optional[str] = None) -> None:
+        with self._cond:
+            job.state = state
+            job.error = error
+            job.finished_at = time.time()
+            self._running -= 1
+            self._cond.notify_all()
+        logger.info(
+            f"分析任务 {job.analysis_id} 结束，状态: {state}，"
+            f"排队 {job.started_at - job.submitted_at:.1f}s，执行 {job.finished_at - job.started_at:.1f}s"
+        )
+
+
+_job_queue: Optional[AnalysisJobQueue] = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> AnalysisJobQueue:
+    """获取进程级共享的分析队列，配置来自 Django settings"""
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                from django.conf import settings
+                _job_queue = AnalysisJobQueue(
+                    max_workers=getattr(settings, "AI_ANALYSIS_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY),
+                    max_queue_size=getattr(settings, "AI_ANALYSIS_QUEUE_MAX", DEFAULT_MAX_QUEUE_SIZE),
+                )
+    return _job_queue
@@ -0,0 +1,506 @@
+# ai/job_store.py - 分析任务状态存储
+"""
+分析任务的进度列表和结果字典的可插拔存储后端。
+
+- ``memory``：进程内的有限大小字典，单进程部署时最快；
+- ``sqlite``：共享的 SQLite 文件（WAL 模式），同一台机器上的多个
+  gunicorn/uvicorn worker 可以看到彼此的任务，按 analysis_id 走主键索引；
+- ``redis``：通过 Redis 协议访问，可跨机器水平扩展。
+  本地开发时可以用 ``python -m ai.resp_server`` 启动一个兼容的替身服务。
+
+通过 ``settings.AI_JOB_STORE`` 选择后端，``get_job_store()`` 返回进程级单例。
+所有方法都是线程安全的，结果字典和进度条目必须可以 JSON 序列化。
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_JOBS = 1000
+DEFAULT_TTL_SECONDS = 24 * 3600
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, cls=DjangoJSONEncoder)
+
+
+class LimitedSizeDict(OrderedDict):
+    """有限大小的字典，当达到最大容量时自动删除最早的条目"""
+    def __init__(self, max_size=100):
+        super().__init__()
+        self.max_size = max_size
+        self.lock = threading.RLock()  # 添加锁以确保线程安全
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            # 如果达到最大容量，删除最早添加的项
+            if key not in self and len(self) >= self.max_size:
+                self.popitem(last=False)
+            super().__setitem__(key, value)
+
+    def __getitem__(self, key):
+        with self.lock:
+            return super().__getitem__(key)
+
+    def __contains__(self, key):
+        with self.lock:
+            return super().__contains__(key)
+
+    def get(self, key, default=None):
+        with self.lock:
+            return super().get(key, default)
+
+
+class BaseJobStore:
+    """任务状态存储接口"""
+
+    def create(self, analysis_id: str, result: Dict[str, Any],
+               progress: Optional[List[Dict[str, Any]]] = None) -> None:
+        """创建（或覆盖）一个任务的结果字典和初始进度"""
+        raise NotImplementedError
+
+    def exists(self, analysis_id: str) -> bool:
+        raise NotImplementedError
+
+    def append_progress(self, analysis_id: str, entry: Dict[str, Any]) -> int:
+        """追加一条进度，返回它在进度列表中的序号"""
+        raise NotImplementedError
+
+    def get_progress(self, analysis_id: str, since: int = 0) -> List[Dict[str, Any]]:
+        """返回序号不小于 since 的进度条目"""
+        raise NotImplementedError
+
+    def get_result(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def set_result(self, analysis_id: str, result: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def update_result(self, analysis_id: str, **fields: Any) -> None:
+        """把 fields 合并进已有的结果字典（原子操作）"""
+        raise NotImplementedError
+
+
+class InMemoryJobStore(BaseJobStore):
+    """进程内存储，只适合单 worker 部署"""
+
+    def __init__(self, max_jobs: int = DEFAULT_MAX_JOBS):
+        self._progress = LimitedSizeDict(max_size=max_jobs)
+        self._results = LimitedSizeDict(max_size=max_jobs)
+        self._lock = threading.RLock()
+
+    def create(self, analysis_id, result, progress=None):
+        with self._lock:
+            self._progress[analysis_id] = [dict(entry) for entry in (progress or [])]
+            self._results[analysis_id] = dict(result)
+
+    def exists(self, analysis_id):
+        with self._lock:
+            return analysis_id in self._results or analysis_id in self._progress
+
+    def append_progress(self, analysis_id, entry):
+        with self._lock:
+            if analysis_id not in self._progress:
+                self._progress[analysis_id] = []
+            entries = self._progress[analysis_id]
+            entries.append(dict(entry))
+            return len(entries) - 1
+
+    def get_progress(self, analysis_id, since=0):
+        with self._lock:
+            return [dict(entry) for entry in (self._progress.get(analysis_id) or [])[since:]]
+
+    def get_result(self, analysis_id):
+        with self._lock:
+            result = self._results.get(analysis_id)
+            return dict(result) if result is not None else None
+
+    def set_result(self, analysis_id, result):
+        with self._lock:
+            self._results[analysis_id] = dict(result)
+
+    def update_result(self, analysis_id, **fields):
+        with self._lock:
+            result = dict(self._results.get(analysis_id) or {})
+            result.update(fields)
+            self._results[analysis_id] = result
+
+
+class SQLiteJobStore(BaseJobStore):
+    """共享 SQLite 文件存储，同一主机上的多个 worker 进程共用"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS analysis_jobs (
+            analysis_id TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS analysis_jobs_updated_at ON analysis_jobs (updated_at);
+        CREATE TABLE IF NOT EXISTS analysis_progress (
+            analysis_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            entry TEXT NOT NULL,
+            PRIMARY KEY (analysis_id, seq)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path, max_jobs: int = DEFAULT_MAX_JOBS):
+        self.path = str(path)
+        self.max_jobs = max_jobs
+        self._local = threading.local()
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.executescript(self.SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 连接不能跨线程共享，每个线程各自持有一个
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, fn):
+        """在 IMMEDIATE 事务中执行写操作，保证跨进程的读-改-写原子性"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            value = fn(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return value
+
+    def create(self, analysis_id, result, progress=None):
+        def op(conn):
+            conn.execute("DELETE FROM analysis_progress WHERE analysis_id = ?", (analysis_id,))
+            conn.execute(
+                "INSERT OR REPLACE INTO analysis_jobs (analysis_id, result, updated_at) VALUES (?, ?, ?)",
+                (analysis_id, _dumps(result), time.time()),
+            )
+            conn.executemany(
+                "INSERT INTO analysis_progress (analysis_id, seq, entry) VALUES (?, ?, ?)",
+                [(analysis_id, seq, _dumps(entry)) for seq, entry in enumerate(progress or [])],
+            )
+            self._prune(conn)
+        self._write(op)
+
+    def _prune(self, conn):
+        # 与 LimitedSizeDict 一致：超过容量时删除最久未更新的任务
+        rows = conn.execute(
+            "SELECT analysis_id FROM analysis_jobs ORDER BY updated_at DESC LIMIT -1 OFFSET ?",
+            (self.max_jobs,),
+        ).fetchall()
+        if rows:
+            conn.executemany("DELETE FROM analysis_jobs WHERE analysis_id = ?", rows)
+            conn.executemany("DELETE FROM analysis_progress WHERE analysis_id = ?", rows)
+
+    def exists(self, analysis_id):
+        row = self._conn().execute(
+            "SELECT 1 FROM analysis_jobs WHERE analysis_id = ? "
+            "UNION ALL SELECT 1 FROM analysis_progress WHERE analysis_id = ? LIMIT 1",
+            (analysis_id, analysis_id),
+        ).fetchone()
+        return row is not None
+
+    def append_progress(self, analysis_id, entry):
+        def op(conn):
+            (seq,) = conn.execute(
+                "SELECT COALESCE(MAX(seq), -1) + 1 FROM analysis_progress WHERE analysis_id = ?",
+                (analysis_id,),
+            ).fetchone()
+            conn.execute(
+                "INSERT INTO analysis_progress (analysis_id, seq, entry) VALUES (?, ?, ?)",
+                (analysis_id, seq, _dumps(entry)),
+            )
+            conn.execute("UPDATE analysis_jobs SET updated_at = ? WHERE analysis_id = ?",
+                         (time.time(), analysis_id))
+            return seq
+        return self._write(op)
+
+    def get_progress(self, analysis_id, since=0):
+        rows = self._conn().execute(
+            "SELECT entry FROM analysis_progress WHERE analysis_id = ? AND seq >= ? ORDER BY seq",
+            (analysis_id, since),
+        ).fetchall()
+        return [json.loads(entry) for (entry,) in rows]
+
+    def get_result(self, analysis_id):
+        row = self._conn().execute(
+            "SELECT result FROM analysis_jobs WHERE analysis_id = ?", (analysis_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_result(self, analysis_id, result):
+        self._write(lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO analysis_jobs (analysis_id, result, updated_at) VALUES (?, ?, ?)",
+            (analysis_id, _dumps(result), time.time()),
+        ))
+
+    def update_result(self, analysis_id, **fields):
+        def op(conn):
+            row = conn.execute(
+                "SELECT result FROM analysis_jobs WHERE analysis_id = ?", (analysis_id,)
+            ).fetchone()
+            result = json.loads(row[0]) if row else {}
+            result.update(fields)
+            conn.execute(
+                "INSERT OR REPLACE INTO analysis_jobs (analysis_id, result, updated_at) VALUES (?, ?, ?)",
+                (analysis_id, _dumps(result), time.time()),
+            )
+        self._write(op)
+
+
+class RedisProtocolError(RuntimeError):
+    """Redis 服务返回了错误回复"""
+
+
+# 连接断开后可以安全重发的只读命令
+RETRYABLE_COMMANDS = frozenset({"GET", "EXISTS", "LRANGE", "HGETALL", "PING"})
+
+
+def _encode(*args) -> bytes:
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+class RespConnection:
+    """最小的 Redis 协议（RESP2）客户端，只实现本模块用到的命令"""
+
+    def __init__(self, host: str, port: int, db: int = 0, password: Optional[str] = None,
+                 timeout: float = 5.0):
+        self.host, self.port, self.db, self.password, self.timeout = host, port, db, password, timeout
+        self._sock: Optional[socket.socket] = None
+        self._file = None
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._file = self._sock.makefile("rb")
+        if self.password:
+            self._send_and_read("AUTH", self.password)
+        if self.db:
+            self._send_and_read("SELECT", self.db)
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            finally:
+                self._sock = None
+                self._file = None
+
+    def execute(self, *args):
+        """
+        发送命令并返回回复。
+
+        建立连接失败时重试一次；已发送的命令只有只读命令在连接断开后重试：
+        RPUSH、HSET 等写命令可能已经在服务端执行，重试会重复写入，直接把错误交给调用方
+        （下一次调用会重新连接）。
+        """
+        retry = str(args[0]).upper() in RETRYABLE_COMMANDS
+        for attempt in range(2):
+            try:
+                if self._sock is None:
+                    self._connect()
+            except (OSError, EOFError):
+                self.close()
+                if attempt:
+                    raise
+                continue
+            try:
+                return self._send_and_read(*args)
+            except (OSError, EOFError):
+                self.close()
+                if attempt or not retry:
+                    raise
+
+    def transaction(self, *commands):
+        """
+        在一个 MULTI/EXEC 事务中执行多条命令，返回 EXEC 的回复（每条命令一项）。
+
+        所有命令一次发送，服务端连续执行，其他连接看不到中间状态。事务包含写命令，
+        发送后连接断开不重试；出错时关闭连接，丢弃还没有读取的回复。
+        """
+        for attempt in range(2):
+            try:
+                if self._sock is None:
+                    self._connect()
+                break
+            except (OSError, EOFError):
+                self.close()
+                if attempt:
+                    raise
+        try:
+            self._sock.sendall(b"".join(_encode(*args) for args in [("MULTI",), *commands, ("EXEC",)]))
+            # MULTI 回复 OK，每条命令回复 QUEUED
+            for _ in range(len(commands) + 1):
+                self._read_reply()
+            return self._read_reply()
+        except (OSError, EOFError, RedisProtocolError):
+            self.close()
+            raise
+
+    def _send_and_read(self, *args):
+        self._sock.sendall(_encode(*args))
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self._file.readline()
+        if not line:
+            raise EOFError("Redis 连接已关闭")
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b"+":
+            return payload.decode()
+        if prefix == b"-":
+            raise RedisProtocolError(payload.decode())
+        if prefix == b":":
+            return int(payload)
+        if prefix == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._file.read(length + 2)
+            return data[:-2]
+        if prefix == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise RedisProtocolError(f"无法解析的回复: {line!r}")
+
+
+class RedisJobStore(BaseJobStore):
+    """Redis 协议存储：结果字典保存为 hash（每个字段一个 JSON 值），进度保存为 list"""
+
+    def __init__(self, url: str = "redis://127.0.0.1:6379/0", ttl: int = DEFAULT_TTL_SECONDS,
+                 prefix: str = "qrent:analysis"):
+        parsed = urlparse(url)
+        self._conn_args = dict(
+            host=parsed.hostname or "127.0.0.1",
+            port=parsed.port or 6379,
+            db=int((parsed.path or "/0").lstrip("/") or 0),
+            password=parsed.password,
+        )
+        self.ttl = ttl
+        self.prefix = prefix
+        self._local = threading.local()
+
+    def _conn(self) -> RespConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = RespConnection(**self._conn_args)
+        return conn
+
+    def _result_key(self, analysis_id):
+        return f"{self.prefix}:{analysis_id}:result"
+
+    def _progress_key(self, analysis_id):
+        return f"{self.prefix}:{analysis_id}:progress"
+
+    def _expire_commands(self, analysis_id):
+        if not self.ttl:
+            return []
+        return [("EXPIRE", self._result_key(analysis_id), self.ttl),
+                ("EXPIRE", self._progress_key(analysis_id), self.ttl)]
+
+    def _touch(self, analysis_id):
+        conn = self._conn()
+        for command in self._expire_commands(analysis_id):
+            conn.execute(*command)
+
+    def _hset_commands(self, analysis_id, fields):
+        if not fields:
+            return []
+        args = []
+        for key, value in fields.items():
+            args.extend([key, _dumps(value)])
+        return [("HSET", self._result_key(analysis_id), *args)]
+
+    def _hset(self, analysis_id, fields):
+        for command in self._hset_commands(analysis_id, fields):
+            self._conn().execute(*command)
+
+    def create(self, analysis_id, result, progress=None):
+        # 删除旧数据和写入新数据放在一个事务里，读取方不会看到中间的空状态
+        commands = [("DEL", self._result_key(analysis_id), self._progress_key(analysis_id))]
+        commands += self._hset_commands(analysis_id, result)
+        if progress:
+            commands.append(("RPUSH", self._progress_key(analysis_id), *[_dumps(entry) for entry in progress]))
+        self._conn().transaction(*commands, *self._expire_commands(analysis_id))
+
+    def exists(self, analysis_id):
+        return bool(self._conn().execute("EXISTS", self._result_key(analysis_id), self._progress_key(analysis_id)))
+
+    def append_progress(self, analysis_id, entry):
+        length = self._conn().execute("RPUSH", self._progress_key(analysis_id), _dumps(entry))
+        self._touch(analysis_id)
+        return length - 1
+
+    def get_progress(self, analysis_id, since=0):
+        items = self._conn().execute("LRANGE", self._progress_key(analysis_id), since, -1) or []
+        return [json.loads(item) for item in items]
+
+    def get_result(self, analysis_id):
+        items = self._conn().execute("HGETALL", self._result_key(analysis_id)) or []
+        if not items:
+            return None
+        return {items[i].decode(): json.loads(items[i + 1]) for i in range(0, len(items), 2)}
+
+    def set_result(self, analysis_id, result):
+        commands = [("DEL", self._result_key(analysis_id))] + self._hset_commands(analysis_id, result)
+        self._conn().transaction(*commands, *self._expire_commands(analysis_id))
+
+    def update_result(self, analysis_id, **fields):
+        # HSET 只覆盖给定字段，多个进程同时更新不同字段也不会互相覆盖
+        self._hset(analysis_id, fields)
+        self._touch(analysis_id)
+
+
+def build_job_store(config: Optional[Dict[str, Any]] = None) -> BaseJobStore:
+    """根据配置创建存储后端"""
+    config = dict(config or {})
+    backend = (config.get("BACKEND") or "memory").lower()
+    max_jobs = int(config.get("MAX_JOBS", DEFAULT_MAX_JOBS))
+    if backend == "memory":
+        return InMemoryJobStore(max_jobs=max_jobs)
+    if backend == "sqlite":
+        return SQLiteJobStore(config["PATH"], max_jobs=max_jobs)
+    if backend == "redis":
+        return RedisJobStore(config.get("URL", "redis://127.0.0.1:6379/0"),
+                             ttl=int(config.get("TTL", DEFAULT_TTL_SECONDS)))
+    raise ValueError(f"未知的任务状态存储后端: {backend}")
+
+
+_job_store: Optional[BaseJobStore] = None
+_job_store_lock = threading.Lock()
+
+
+def get_job_store() -> BaseJobStore:
+    """获取进程级共享的任务状态存储，配置来自 settings.AI_JOB_STORE"""
+    global _job_store
+    if _job_store is None:
+        with _job_store_lock:
+            if _job_store is None:
+                from django.conf import settings
+                _job_store = build_job_store(getattr(settings, "AI_JOB_STORE", None))
+                logger.info(f"任务状态存储后端: {type(_job_store).__name__}")
+    return _job_store
@@ -0,0 +1,211 @@
+# ai/management/commands/loadtest_ai.py - 使用假大模型压测完整的分析链路
+import json
+import os
+import statistics
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+FINISHED_STATES = ("completed", "failed", "cancelled")
+
+# 入住日期相对运行当天计算，固定日期过期后会触发 move_in_past 规则，压测的不再是正常问卷
+MOVE_IN_DAYS_AHEAD = 30
+
+SAMPLE_SURVEY = {
+    "minBudget": "400",
+    "maxBudget": "600",
+    "includeBills": "不确定",
+    "university": "UNSW",
+    "commuteTime": "30 分钟",
+    "roomType": "一居室",
+    "sharedRoom": "愿意",
+    "leaseTerm": "12 个月",
+    "flexibility": ["预算", "区域"],
+}
+
+
+def _rss_mb():
+    """当前进程的常驻内存（MB），不支持的平台返回 None"""
+    try:
+        with open("/proc/self/statm") as fh:
+            pages = int(fh.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _percentiles(values):
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": round(ordered[-1], 3),
+            "mean": round(statistics.fmean(ordered), 3)}
+
+
+class Command(BaseCommand):
+    help = "通过 SurveyView 提交大量分析，使用假大模型测量吞吐量、排队时间和内存占用"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--analyses", type=int, default=100, help="提交的分析数")
+        parser.add_argument("--concurrency", type=int, default=100, help="同时执行的分析数（队列工作线程数）")
+        parser.add_argument("--backend", choices=("fake", "fake-server", "default"), default="fake",
+                            help="大模型后端；fake-server 且没有设置 QRENT_FAKE_LLM_URL 时在本进程内启动假模型服务")
+        parser.add_argument("--latency", help="首 token 延迟分布，如 uniform:0.2:0.6（QRENT_FAKE_LLM_LATENCY）")
+        parser.add_argument("--tool-calls", type=int, help="每个任务的工具调用次数（QRENT_FAKE_LLM_TOOL_CALLS）")
+        parser.add_argument("--timeout", type=float, default=600.0, help="等待全部分析结束的最长时间（秒）")
+        parser.add_argument("--keep-files", action="store_true", help="保留提交时写入的问卷数据文件")
+        parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+
+    def handle(self, *args, **options):
+        total = options["analyses"]
+        concurrency = options["concurrency"]
+        if total < 1 or concurrency < 1:
+            raise CommandError("--analyses 和 --concurrency 必须大于 0")
+
+        # 导入 agent_runner 时才会把 crewai_project/src 加入 sys.path
+        from ai.agent_runner import readiness
+
+        crew_error = readiness()["crew_error"]
+        if crew_error:
+            raise CommandError(crew_error)
+
+        # 大模型后端在构建团队模板时读取，必须在第一次分析之前设置
+        os.environ["QRENT_LLM_BACKEND"] = options["backend"]
+        if options["latency"]:
+            os.environ["QRENT_FAKE_LLM_LATENCY"] = options["latency"]
+        if options["tool_calls"] is not None:
+            os.environ["QRENT_FAKE_LLM_TOOL_CALLS"] = str(options["tool_calls"])
+        server = None
+        if options["backend"] == "fake-server" and not os.environ.get("QRENT_FAKE_LLM_URL"):
+            from latest_ai_development.fake_llm import FakeLLMServer
+
+            server = FakeLLMServer(("127.0.0.1", 0))
+            server.start()
+            os.environ["QRENT_FAKE_LLM_URL"] = server.url
+
+        # 队列按压测的并发数创建；假模型的结果不能写入分析结果缓存
+        settings.AI_ANALYSIS_MAX_CONCURRENCY = concurrency
+        settings.AI_ANALYSIS_QUEUE_MAX = max(total, getattr(settings, "AI_ANALYSIS_QUEUE_MAX", 0))
+        settings.AI_RESULT_CACHE_ENABLED = False
+
+        from rest_framework.test import APIRequestFactory
+
+        from ai.job_queue import get_job_queue
+        from ai.job_store import get_job_store
+        from latest_ai_development.crew import reset_crew_blueprint
+        from survey.views import SurveyView
+
+        reset_crew_blueprint()
+        job_queue = get_job_queue()
+        if job_queue.max_workers != concurrency:
+            self.stderr.write(f"分析队列已经创建，实际并发数为 {job_queue.max_workers}")
+
+        samples = {"rss_mb": [], "threads": [], "queued_jobs": [], "running_jobs": []}
+        sampling = threading.Event()
+
+        def sample():
+            while not sampling.wait(0.2):
+                stats = job_queue.stats()
+                rss = _rss_mb()
+                if rss is not None:
+                    samples["rss_mb"].append(rss)
+                samples["threads"].append(threading.active_count())
+                samples["queued_jobs"].append(stats["queued_jobs"])
+                samples["running_jobs"].append(stats["running_jobs"])
+
+        sampler = threading.Thread(target=sample, name="loadtest-sampler", daemon=True)
+        rss_before = _rss_mb()
+        sampler.start()
+
+        view = SurveyView.as_view()
+        factory = APIRequestFactory()
+        pending, paths, rejected = [], [], []
+        started = time.perf_counter()
+        move_in = (date.today() + timedelta(days=MOVE_IN_DAYS_AHEAD)).isoformat()
+        for index in range(total):
+            survey = dict(SAMPLE_SURVEY, maxBudget=str(600 + index), moveInDate=move_in)
+            response = view(factory.post("/survey/?no_cache=1", survey, format="json"))
+            if response.status_code == 200:
+                pending.append(response.data["analysis_id"])
+                paths.append(Path(response.data["path"]))
+            else:
+                rejected.append(response.data.get("error"))
+        submit_seconds = time.perf_counter() - started
+
+        finished = {}
+        deadline = time.monotonic() + options["timeout"]
+        while pending and time.monotonic() < deadline:
+            time.sleep(0.2)
+            still_pending = []
+            for analysis_id in pending:
+                snapshot = job_queue.snapshot(analysis_id)
+                if snapshot is not None and snapshot["job_state"] in FINISHED_STATES:
+                    finished[analysis_id] = snapshot
+                else:
+                    still_pending.append(analysis_id)
+            pending = still_pending
+        wall_seconds = time.perf_counter() - started
+        sampling.set()
+        sampler.join()
+
+        # 分析函数自己捕获异常，队列中的任务状态是 completed 不代表分析成功，以结果状态为准
+        store = get_job_store()
+        states, errors = {}, []
+        for analysis_id in finished:
+            result = store.get_result(analysis_id) or {}
+            result_status = result.get("status") or "unknown"
+            states[result_status] = states.get(result_status, 0) + 1
+            if result.get("error"):
+                errors.append(result["error"])
+        completed = states.get("completed", 0)
+
+        report = {
+            "backend": options["backend"],
+            "analyses": total,
+            "concurrency": job_queue.max_workers,
+            "completed": completed,
+            "states": states,
+            "rejected": len(rejected),
+            "timed_out": len(pending),
+            "errors": sorted(set(errors))[:5],
+            "submit_seconds": round(submit_seconds, 3),
+            "wall_seconds": round(wall_seconds, 3),
+            "throughput_per_minute": round(completed / wall_seconds * 60, 2) if wall_seconds else None,
+            "latency_seconds": _percentiles([s["finished_at"] - s["submitted_at"] for s in finished.values()]),
+            "queue_wait_seconds": _percentiles([s["started_at"] - s["submitted_at"]
+                                                for s in finished.values() if s["started_at"]]),
+            "run_seconds": _percentiles([s["finished_at"] - s["started_at"]
+                                         for s in finished.values() if s["started_at"]]),
+            "peak_queued_jobs": max(samples["queued_jobs"], default=0),
+            "peak_running_jobs": max(samples["running_jobs"], default=0),
+            "peak_threads": max(samples["threads"], default=threading.active_count()),
+            "rss_mb": {
+                "before": round(rss_before, 1) if rss_before is not None else None,
+                "peak": round(max(samples["rss_mb"]), 1) if samples["rss_mb"] else None,
+            },
+        }
+        if server is not None:
+            report["fake_server"] = dict(server.stats)
+            server.shutdown()
+            server.server_close()
+
+        if not options["keep_files"]:
+            for path in paths:
+                path.unlink(missing_ok=True)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+        else:
+            for key, value in report.items():
+                self.stdout.write(f"{key}: {value}")
+        if pending or completed < total:
+            raise CommandError(f"{total - completed} 个分析没有成功完成")
+        self.stdout.write(self.style.SUCCESS(f"压测完成: {completed} 个分析，用时 {wall_seconds:.1f}s"))
@@ -0,0 +1,21 @@
+# ai/management/commands/warmup_ai.py - 预热知识库索引和智能体团队模板
+from django.core.management.base import BaseCommand, CommandError
+
+from ai.agent_runner import readiness, warm_up
+
+
+class Command(BaseCommand):
+    help = "预先加载知识库索引并构建智能体团队模板，输出各步骤耗时"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--skip-rag", action="store_true", help="不加载知识库索引")
+        parser.add_argument("--skip-crew", action="store_true", help="不构建智能体团队模板")
+
+    def handle(self, *args, **options):
+        report = warm_up(include_rag=not options["skip_rag"], include_crew=not options["skip_crew"])
+        for key, value in report.items():
+            self.stdout.write(f"{key}: {value}")
+        errors = [key for key in report if key.endswith("_error")]
+        if errors:
+            raise CommandError(f"预热失败: {', '.join(errors)}")
+        self.stdout.write(self.style.SUCCESS(f"预热完成: {readiness()}"))
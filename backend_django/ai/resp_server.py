@@ -0,0 +1,269 @@
+# ai/resp_server.py - 本地开发用的 Redis 协议替身服务
+"""
+一个只在内存中保存数据的最小 Redis 协议服务，实现了 ``RedisJobStore`` 用到的命令，
+用于在没有安装 Redis 的开发机上验证多 worker 部署：
+
+    python -m ai.resp_server --port 6380
+    AI_JOB_STORE_BACKEND=redis AI_JOB_STORE_URL=redis://127.0.0.1:6380/0 uvicorn server.asgi:application --workers 4
+
+不支持持久化、集群和绝大多数命令，生产环境请使用真正的 Redis。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RespError(Exception):
+    pass
+
+
+class MemoryKeyspace:
+    """按 db 编号划分的键空间，支持字符串、hash、list 和过期时间"""
+
+    def __init__(self):
+        self.dbs: Dict[int, Dict[bytes, Any]] = {}
+        self.expires: Dict[int, Dict[bytes, float]] = {}
+
+    def db(self, index: int) -> Dict[bytes, Any]:
+        data = self.dbs.setdefault(index, {})
+        expires = self.expires.setdefault(index, {})
+        now = time.time()
+        for key in [k for k, deadline in expires.items() if deadline <= now]:
+            data.pop(key, None)
+            expires.pop(key, None)
+        return data
+
+
+class RespSession:
+    """单个客户端连接的命令处理"""
+
+    def __init__(self, keyspace: MemoryKeyspace):
+        self.keyspace = keyspace
+        self.db_index = 0
+        # MULTI 之后排队的命令；None 表示不在事务中
+        self.queued: Optional[List[List[bytes]]] = None
+        self.aborted = False
+
+    @property
+    def data(self):
+        return self.keyspace.db(self.db_index)
+
+    def _typed(self, key: bytes, kind: type, create: bool = False):
+        value = self.data.get(key)
+        if value is None:
+            if not create:
+                return None
+            value = self.data[key] = kind()
+        if not isinstance(value, kind):
+            raise RespError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def handle(self, args: List[bytes]):
+        if not args:
+            raise RespError("ERR empty command")
+        name = args[0].decode().upper()
+        if name in ("MULTI", "EXEC", "DISCARD"):
+            return getattr(self, f"cmd_{name.lower()}")(*args[1:])
+        handler = getattr(self, f"cmd_{name.lower()}", None)
+        if handler is None:
+            self.aborted = self.queued is not None
+            raise RespError(f"ERR unknown command '{name}'")
+        if self.queued is not None:
+            self.queued.append(args)
+            return "QUEUED"
+        return handler(*args[1:])
+
+    def cmd_multi(self):
+        if self.queued is not None:
+            raise RespError("ERR MULTI calls can not be nested")
+        self.queued, self.aborted = [], False
+        return "OK"
+
+    def cmd_exec(self):
+        if self.queued is None:
+            raise RespError("ERR EXEC without MULTI")
+        queued, aborted = self.queued, self.aborted
+        self.queued, self.aborted = None, False
+        if aborted:
+            raise RespError("EXECABORT Transaction discarded because of previous errors.")
+        # 服务在单个事件循环中同步执行命令，事务中的命令之间不会插入其他连接的命令
+        replies = []
+        for args in queued:
+            try:
+                replies.append(self.handle(args))
+            except RespError as exc:
+                replies.append(exc)
+            except (TypeError, ValueError) as exc:
+                replies.append(RespError(f"ERR {exc}"))
+        return replies
+
+    def cmd_discard(self):
+        if self.queued is None:
+            raise RespError("ERR DISCARD without MULTI")
+        self.queued, self.aborted = None, False
+        return "OK"
+
+    def cmd_ping(self, *args):
+        return args[0] if args else "PONG"
+
+    def cmd_select(self, index):
+        self.db_index = int(index)
+        return "OK"
+
+    def cmd_auth(self, *args):
+        return "OK"
+
+    def cmd_flushall(self):
+        self.keyspace.dbs.clear()
+        self.keyspace.expires.clear()
+        return "OK"
+
+    def cmd_get(self, key):
+        return self._typed(key, bytes)
+
+    def cmd_set(self, key, value, *options):
+        self.data[key] = value
+        self.keyspace.expires.setdefault(self.db_index, {}).pop(key, None)
+        return "OK"
+
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self.data.pop(key, None) is not None:
+                removed += 1
+            self.keyspace.expires.setdefault(self.db_index, {}).pop(key, None)
+        return removed
+
+    def cmd_exists(self, *keys):
+        return sum(1 for key in keys if key in self.data)
+
+    def cmd_expire(self, key, seconds):
+        if key not in self.data:
+            return 0
+        self.keyspace.expires.setdefault(self.db_index, {})[key] = time.time() + int(seconds)
+        return 1
+
+    def cmd_hset(self, key, *pairs):
+        if not pairs or len(pairs) % 2:
+            raise RespError("ERR wrong number of arguments for 'hset' command")
+        table = self._typed(key, dict, create=True)
+        added = 0
+        for field, value in zip(pairs[::2], pairs[1::2]):
+            added += field not in table
+            table[field] = value
+        return added
+
+    def cmd_hget(self, key, field):
+        table = self._typed(key, dict)
+        return table.get(field) if table else None
+
+    def cmd_hgetall(self, key):
+        table = self._typed(key, dict) or {}
+        flat: List[bytes] = []
+        for field, value in table.items():
+            flat.extend([field, value])
+        return flat
+
+    def cmd_rpush(self, key, *values):
+        items = self._typed(key, list, create=True)
+        items.extend(values)
+        return len(items)
+
+    def cmd_llen(self, key):
+        return len(self._typed(key, list) or [])
+
+    def cmd_lrange(self, key, start, stop):
+        items = self._typed(key, list) or []
+        start, stop = int(start), int(stop)
+        if stop < 0:
+            stop = len(items) + stop
+        if start < 0:
+            start = max(0, len(items) + start)
+        return items[start:stop + 1]
+
+
+def encode_reply(value) -> bytes:
+    if isinstance(value, RespError):
+        return b"-%s\r\n" % str(value).encode()
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        return b"+%s\r\n" % value.encode()
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode_reply(item) for item in value)
+    raise TypeError(f"无法编码的回复类型: {type(value)}")
+
+
+async def read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        # 兼容 redis-cli 的内联命令
+        return line.strip().split()
+    count = int(line[1:-2])
+    args = []
+    for _ in range(count):
+        header = await reader.readline()
+        length = int(header[1:-2])
+        payload = await reader.readexactly(length + 2)
+        args.append(payload[:-2])
+    return args
+
+
+async def serve(host: str = "127.0.0.1", port: int = 6380) -> None:
+    keyspace = MemoryKeyspace()
+
+    async def client(reader, writer):
+        session = RespSession(keyspace)
+        try:
+            while True:
+                args = await read_command(reader)
+                if args is None:
+                    break
+                try:
+                    reply = session.handle(args)
+                except RespError as exc:
+                    reply = exc
+                except (TypeError, ValueError) as exc:
+                    reply = RespError(f"ERR {exc}")
+                writer.write(encode_reply(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(client, host, port)
+    logger.info(f"Redis 协议替身服务已启动: {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地 Redis 协议替身服务（仅用于开发和测试）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6380)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# ai/result_cache.py - 分析结果缓存
+"""
+按问卷内容寻址的分析结果缓存。
+
+很多提交的问卷内容完全相同（同一所大学、同一预算区间、房型和租期），
+没有必要每次都重新跑一遍三个智能体。缓存键是 ``build_data_json()`` 生成的
+``survey`` 部分的规范化哈希，``meta`` 中的保存时间、前端原始数据等易变字段不参与计算。
+影响结果的运行配置（执行模式、规则预检模式和预检日期，见 ``agent_runner.analysis_variant()``）
+也计入缓存键：规则预检的结论与当天日期有关，缓存结果只在同一天、同一配置下复用。
+
+缓存使用 Django 的 ``caches["ai_results"]``，TTL 和条目上限在 settings.CACHES 中配置；
+多 worker 部署时可以换成文件或 Redis 缓存后端。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = "ai_results"
+KEY_PREFIX = "survey-result"
+
+# 缓存中保存的结果字段
+CACHED_FIELDS = ("summary", "report_markdown", "report_path", "tasks", "timings", "screening")
+
+
+def _normalize(value: Any) -> Any:
+    """规范化问卷内容：字符串去掉首尾空白，字典按键排序，列表排序去重（选项没有先后之分）"""
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple, set)):
+        items = [_normalize(item) for item in value]
+        unique = {json.dumps(item, sort_keys=True, ensure_ascii=False): item for item in items}
+        return [unique[k] for k in sorted(unique)]
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def survey_cache_key(data_json: Dict[str, Any], variant: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """根据问卷数据和运行配置计算缓存键；没有 survey 部分时返回 None"""
+    survey = data_json.get("survey")
+    if not isinstance(survey, dict):
+        return None
+    canonical = json.dumps({"survey": _normalize(survey), "variant": variant or {}},
+                           sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _enabled() -> bool:
+    return getattr(settings, "AI_RESULT_CACHE_ENABLED", True)
+
+
+def _cache():
+    try:
+        return caches[CACHE_ALIAS]
+    except InvalidCacheBackendError:
+        return None
+
+
+def get_cached_result(key: Optional[str]) -> Optional[Dict[str, Any]]:
+    """查询缓存，未命中、缓存关闭或缓存后端出错时返回 None"""
+    cache = _cache()
+    if not key or not _enabled() or cache is None:
+        return None
+    try:
+        return cache.get(f"{KEY_PREFIX}:{key}")
+    except Exception as e:
+        logger.warning(f"读取分析结果缓存失败: {str(e)}")
+        return None
+
+
+def store_result(key: Optional[str], analysis: Dict[str, Any]) -> None:
+    """缓存一次成功完成的分析结果"""
+    cache = _cache()
+    if not key or not _enabled() or cache is None:
+        return
+    entry = {field: analysis.get(field) for field in CACHED_FIELDS}
+    entry["cached_at"] = datetime.now().isoformat()
+    try:
+        cache.set(f"{KEY_PREFIX}:{key}", entry)
+    except Exception as e:
+        logger.warning(f"写入分析结果缓存失败: {str(e)}")
+
+
+def is_cacheable(crew_result) -> bool:
+    """只缓存真正成功的结果：报告任务有输出，且执行过程中没有记录错误"""
+    if not (crew_result.summary or crew_result.report_markdown):
+        return False
+    # 团队创建失败等降级路径也会给出 summary，必须确认报告任务真正执行过
+    if not any(item.get("name") == "reporting_task" and (item.get("raw") or item.get("output"))
+               for item in crew_result.task_outputs or []):
+        return False
+    for progress in crew_result.progress_history or []:
+        if progress.stage == "error" or progress.task_status == "error":
+            return False
+    return True
+
+
+def is_bypass_requested(request) -> bool:
+    """?no_cache=1 或请求体中的 bypass_cache=true 会跳过缓存查询（结果仍会写回缓存）"""
+    truthy = ("1", "true", "yes", "on")
+    if str(request.query_params.get("no_cache", "")).lower() in truthy:
+        return True
+    value = request.data.get("bypass_cache") if hasattr(request.data, "get") else None
+    return str(value).lower() in truthy
@@ -41,7 +41,10 @@ class AnalysisResultSerializer(serializers.Serializer):
     analysis_id = serializers.CharField(read_only=True, help_text="分析ID")
     summary = serializers.CharField(read_only=True, allow_null=True, help_text="分析摘要")
     report_markdown = serializers.CharField(read_only=True, allow_null=True, help_text="报告内容")
-    task_outputs = serializers.DictField(read_only=True, allow_null=True, help_text="各任务输出")
+    task_outputs = serializers.JSONField(read_only=True, allow_null=True, help_text="各任务输出")
+    timings = serializers.JSONField(read_only=True, allow_null=True, help_text="团队创建与执行耗时（秒）")
+    usage = serializers.JSONField(read_only=True, allow_null=True, help_text="各智能体、任务、工具和LLM调用的token数与耗时")
+    screening = serializers.JSONField(read_only=True, allow_null=True, help_text="本地规则预检结果（检查项、是否完全覆盖）")
     progress_history = AnalysisProgressSerializer(read_only=True, many=True, allow_null=True, help_text="进度历史")
     created_at = serializers.DateTimeField(read_only=True, help_text="创建时间")
     completed_at = serializers.DateTimeField(read_only=True, allow_null=True, help_text="完成时间")
@@ -1,9 +1,12 @@
 # ai/urls.py - AI分析相关的路由
 from django.urls import path
-from .views import SurveyAnalysisView, AnalysisProgressView, AnalysisResultView
+from .views import SurveyAnalysisView, AnalysisProgressView, AnalysisResultView, AnalysisStreamView, AnalysisCancelView, UsageStatsView
 
 urlpatterns = [
     path('analysis/', SurveyAnalysisView.as_view(), name='survey-analysis'),
     path('analysis/progress/<str:analysis_id>/', AnalysisProgressView.as_view(), name='analysis-progress'),
     path('analysis/result/<str:analysis_id>/', AnalysisResultView.as_view(), name='analysis-result'),
+    path('analysis/stream/<str:analysis_id>/', AnalysisStreamView.as_view(), name='analysis-stream'),
+    path('analysis/cancel/<str:analysis_id>/', AnalysisCancelView.as_view(), name='analysis-cancel'),
+    path('admin/usage/', UsageStatsView.as_view(), name='ai-usage-stats'),
 ]
\ No newline at end of file
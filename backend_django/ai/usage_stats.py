@@ -0,0 +1,110 @@
+# ai/usage_stats.py - 分析用量的跨分析汇总
+"""
+把每次分析的用量（``CrewAIResult.usage``）累计起来，供管理接口查看
+哪个智能体、任务和工具占用了最多的 token 和时间。
+
+汇总保存在进程内，从进程启动开始累计；多 worker 部署时每个 worker 各自汇总。
+最近的若干次分析保留总量，便于查看波动。
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+RECENT_ANALYSES = 50
+
+# 每个分组中累加的字段
+_SUMMED = ("llm_calls", "cached_llm_calls", "prompt_tokens", "completion_tokens", "llm_seconds",
+           "tool_calls", "tool_seconds", "tool_output_tokens", "calls", "seconds", "output_tokens",
+           "cache_hits", "errors", "wall_seconds")
+
+
+def _accumulate(target: Dict[str, Any], values: Dict[str, Any]) -> None:
+    target["analyses"] = target.get("analyses", 0) + 1
+    for key in _SUMMED:
+        if isinstance(values.get(key), (int, float)):
+            target[key] = target.get(key, 0) + values[key]
+
+
+def _with_averages(groups: Dict[str, Dict[str, Any]], total_tokens: int, total_seconds: float) -> Dict[str, Any]:
+    result = {}
+    for name, values in groups.items():
+        item = {key: round(value, 4) if isinstance(value, float) else value for key, value in values.items()}
+        analyses = values.get("analyses") or 1
+        tokens = values.get("prompt_tokens", 0) + values.get("completion_tokens", 0)
+        if "prompt_tokens" in values:
+            item["tokens_per_analysis"] = round(tokens / analyses, 1)
+            item["token_share"] = round(tokens / total_tokens, 4) if total_tokens else 0.0
+        if "llm_seconds" in values:
+            item["llm_seconds_per_analysis"] = round(values["llm_seconds"] / analyses, 4)
+            item["llm_seconds_share"] = round(values["llm_seconds"] / total_seconds, 4) if total_seconds else 0.0
+        result[name] = item
+    return result
+
+
+class UsageAggregator:
+    """线程安全的用量累计"""
+
+    def __init__(self, recent_size: int = RECENT_ANALYSES):
+        self._lock = threading.Lock()
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=recent_size)
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._since = time.time()
+            self._analyses = 0
+            self._totals: Dict[str, Any] = {}
+            self._agents: Dict[str, Dict[str, Any]] = {}
+            self._tasks: Dict[str, Dict[str, Any]] = {}
+            self._tools: Dict[str, Dict[str, Any]] = {}
+            self._recent.clear()
+
+    def record(self, analysis_id: str, usage: Optional[Dict[str, Any]]) -> None:
+        """累计一次分析的用量；没有任何 LLM 或工具调用的分析（例如创建团队失败）不计入"""
+        if not usage or not (usage.get("llm_calls") or usage.get("tool_calls")):
+            return
+        totals = usage.get("totals") or {}
+        with self._lock:
+            self._analyses += 1
+            _accumulate(self._totals, totals)
+            for groups, target in ((usage.get("agents"), self._agents), (usage.get("tasks"), self._tasks),
+                                   (usage.get("tools"), self._tools)):
+                for name, values in (groups or {}).items():
+                    _accumulate(target.setdefault(name, {}), values)
+            self._recent.append({
+                "analysis_id": analysis_id,
+                "finished_at": time.time(),
+                "prompt_tokens": totals.get("prompt_tokens", 0),
+                "completion_tokens": totals.get("completion_tokens", 0),
+                "llm_calls": totals.get("llm_calls", 0),
+                "tool_calls": totals.get("tool_calls", 0),
+                "wall_seconds": totals.get("wall_seconds"),
+            })
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            totals = dict(self._totals)
+            agents = {name: dict(values) for name, values in self._agents.items()}
+            tasks = {name: dict(values) for name, values in self._tasks.items()}
+            tools = {name: dict(values) for name, values in self._tools.items()}
+            recent = list(self._recent)
+            analyses, since = self._analyses, self._since
+        total_tokens = totals.get("prompt_tokens", 0) + totals.get("completion_tokens", 0)
+        total_seconds = totals.get("llm_seconds", 0.0)
+        return {
+            "since": since,
+            "analyses": analyses,
+            "tokens_estimated": True,
+            "totals": _with_averages({"all": totals}, total_tokens, total_seconds)["all"] if totals else {},
+            "agents": _with_averages(agents, total_tokens, total_seconds),
+            "tasks": _with_averages(tasks, total_tokens, total_seconds),
+            "tools": _with_averages(tools, total_tokens, total_seconds),
+            "recent": recent,
+        }
+
+
+usage_stats = UsageAggregator()
@@ -1,64 +1,41 @@
 # ai/views.py - AI分析相关的视图
-from rest_framework.views import APIView
-from rest_framework.response import Response
+#
+# 这些视图是原生异步视图：在 ASGI 服务器（server/asgi.py）下直接运行在事件循环上，
+# 文件读写放到线程中执行，CrewAI 分析交给有界任务队列，事件循环上只保留一个被
+# 跟踪的等待协程。这样单个 uvicorn worker 可以同时承载大量进行中的分析和轮询请求。
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status
 import asyncio
 import json
 import uuid
 from pathlib import Path
-import threading
+from dataclasses import asdict
 from datetime import datetime
 import logging
 
 from .serializers import SurveyAnalysisSerializer, AnalysisProgressSerializer, AnalysisResultSerializer
 from .utils import build_data_json, save_data_json
-from .agent_runner import run_crewai_analysis, CrewAIExecutionError, CrewAIProgress
+from .agent_runner import run_crewai_analysis, CrewAIExecutionError, CrewAIProgress, AnalysisCancelled
+from .cancellation import cancellation_scope, request_cancellation, CANCELLED, TIMED_OUT
+from .background import background_tasks
+from .job_queue import get_job_queue, QueueFullError
+from .job_store import get_job_store
+from .events import progress_broker, sse_response, EVENT_PROGRESS, EVENT_RESULT
+from .usage_stats import usage_stats
 
 # 配置日志记录器
 logger = logging.getLogger(__name__)
 
-# 全局字典用于跟踪分析进度和结果
-# 使用OrderedDict来限制字典大小，防止内存泄漏
-from collections import OrderedDict
-
-class LimitedSizeDict(OrderedDict):
-    """有限大小的字典，当达到最大容量时自动删除最早的条目"""
-    def __init__(self, max_size=100):
-        super().__init__()
-        self.max_size = max_size
-        self.lock = threading.RLock()  # 添加锁以确保线程安全
-
-    def __setitem__(self, key, value):
-        with self.lock:
-            # 如果达到最大容量，删除最早添加的项
-            if key not in self and len(self) >= self.max_size:
-                self.popitem(last=False)
-            super().__setitem__(key, value)
-    
-    def __getitem__(self, key):
-        with self.lock:
-            return super().__getitem__(key)
-    
-    def __contains__(self, key):
-        with self.lock:
-            return super().__contains__(key)
-    
-    def get(self, key, default=None):
-        with self.lock:
-            return super().get(key, default)
-
-# 创建有限大小的字典，最大存储100个条目
-analysis_progress = LimitedSizeDict(max_size=100)
-analysis_results = LimitedSizeDict(max_size=100)
-
-# 全局锁用于复杂操作的原子性
-dictionaries_lock = threading.RLock()
+# 分析结束后的状态，之后的进度不再把状态改回 processing
+FINISHED_STATUSES = ("completed", "failed", CANCELLED, TIMED_OUT)
 
-# 模拟WebSocket的进度更新机制
-async def update_analysis_progress(analysis_id, progress_info):
-    """更新分析任务的进度信息"""
-    if analysis_id not in analysis_progress:
-        analysis_progress[analysis_id] = []
+
+def record_analysis_progress(analysis_id, progress_info):
+    """记录分析任务的进度信息（线程安全，可在队列工作线程中直接调用）"""
+    store = get_job_store()
     progress_entry = {
         'stage': progress_info.stage,
         'progress': progress_info.progress,
@@ -67,12 +44,23 @@ async def update_analysis_progress(analysis_id, progress_info):
         'task_status': progress_info.task_status,
         'timestamp': datetime.now().isoformat()
     }
-    analysis_progress[analysis_id].append(progress_entry)
-    
-    # 同步更新结果字典中的状态
-    if analysis_id in analysis_results:
-        analysis_results[analysis_id]['status'] = 'processing'
-        analysis_results[analysis_id]['timestamp'] = datetime.now().isoformat()
+    seq = store.append_progress(analysis_id, progress_entry)
+    progress_broker.publish(analysis_id, EVENT_PROGRESS, progress_entry, seq=seq)
+
+    # 同步更新结果字典中的状态；任务完成时把它的输出追加到部分结果中
+    analysis_data = store.get_result(analysis_id)
+    if analysis_data is not None and analysis_data.get('status') not in FINISHED_STATUSES:
+        fields = {'status': 'processing', 'timestamp': datetime.now().isoformat()}
+        task_output = getattr(progress_info, 'task_output', None)
+        if task_output is not None:
+            fields['partial_task_outputs'] = (analysis_data.get('partial_task_outputs') or []) + [task_output]
+        store.update_result(analysis_id, **fields)
+
+
+# 模拟WebSocket的进度更新机制
+async def update_analysis_progress(analysis_id, progress_info):
+    """更新分析任务的进度信息（存储可能涉及磁盘/网络 IO，放到线程中执行）"""
+    await asyncio.to_thread(record_analysis_progress, analysis_id, progress_info)
 
 # 清除过期的进度信息
 async def cleanup_progress():
@@ -81,21 +69,28 @@ async def cleanup_progress():
     pass
 
 
-class AnalysisProgressView(APIView):
+def _json(data, status_code=status.HTTP_200_OK):
+    return JsonResponse(data, status=status_code, json_dumps_params={"ensure_ascii": False})
+
+
+class AnalysisProgressView(View):
     """获取分析任务的进度信息"""
-    def get(self, request, analysis_id):
+    async def get(self, request, analysis_id):
         try:
-            if analysis_id not in analysis_progress:
-                return Response({
+            store = get_job_store()
+            if not await asyncio.to_thread(store.exists, analysis_id):
+                return _json({
                     "status": "error",
                     "error": "分析ID不存在或已过期"
-                }, status=status.HTTP_404_NOT_FOUND)
-            
-            progress = analysis_progress[analysis_id]
+                }, status.HTTP_404_NOT_FOUND)
+
+            history = await asyncio.to_thread(store.get_progress, analysis_id)
+            progress = history[-1] if history else {}
+            queue_info = await asyncio.to_thread(_queue_info, analysis_id)
             # 使用序列化器格式化响应数据
             progress_data = {
                 "analysis_id": analysis_id,
-                "stage": progress.get("stage", "unknown"),
+                "stage": progress.get("stage", queue_info.get("job_state") or "unknown"),
                 "progress": progress.get("progress", 0),
                 "message": progress.get("message", ""),
                 "task_name": progress.get("task_name"),
@@ -103,99 +98,312 @@ class AnalysisProgressView(APIView):
                 "is_completed": progress.get("progress", 0) >= 1.0
             }
             serializer = AnalysisProgressSerializer(progress_data)
-            return Response({
+            return _json({
                 "status": "success",
-                "data": serializer.data
-            }, status=status.HTTP_200_OK)
+                "data": serializer.data,
+                "job_state": queue_info.get("job_state"),
+                "queue_position": queue_info.get("queue_position"),
+            })
         except Exception as e:
             logger.error(f"获取分析进度时发生错误: {str(e)}")
-            return Response({
+            return _json({
                 "status": "error",
                 "error": "获取分析进度失败"
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            }, status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class AnalysisResultView(APIView):
+class AnalysisResultView(View):
     """获取分析结果的视图"""
-    def get(self, request, analysis_id):
+    async def get(self, request, analysis_id):
         try:
-            if analysis_id not in analysis_results:
-                return Response({
+            store = get_job_store()
+            analysis_data = await asyncio.to_thread(store.get_result, analysis_id)
+            if analysis_data is None:
+                return _json({
                     "status": "error",
                     "error": "分析ID不存在或已过期"
-                }, status=status.HTTP_404_NOT_FOUND)
-            
-            analysis_data = analysis_results[analysis_id]
-            # 使用序列化器格式化响应数据
-            result_data = {
-                "analysis_id": analysis_id,
-                "summary": analysis_data.get("result", {}).get("summary"),
-                "report_markdown": analysis_data.get("result", {}).get("report"),
-                "task_outputs": analysis_data.get("result", {}).get("task_outputs"),
-                "progress_history": analysis_progress.get(analysis_id),
-                "created_at": analysis_data.get("timestamp"),
-                "completed_at": analysis_data.get("timestamp") if analysis_data.get("status") == "completed" else None
-            }
-            serializer = AnalysisResultSerializer(result_data)
-            return Response({
-                "status": "success",
-                "data": serializer.data
-            }, status=status.HTTP_200_OK)
+                }, status.HTTP_404_NOT_FOUND)
+
+            history = await asyncio.to_thread(store.get_progress, analysis_id)
+            return _json(_result_payload(analysis_id, analysis_data, history))
         except Exception as e:
             logger.error(f"获取分析结果时发生错误: {str(e)}")
-            return Response({
+            return _json({
                 "status": "error",
                 "error": "获取分析结果失败"
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            }, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _result_payload(analysis_id, analysis_data, history):
+    """构造分析结果响应体，结果接口和SSE结果事件共用"""
+    result = analysis_data.get("result") or {}
+    # 使用序列化器格式化响应数据
+    result_data = {
+        "analysis_id": analysis_id,
+        "summary": result.get("summary"),
+        "report_markdown": result.get("report_markdown"),
+        # 分析进行中时返回已完成任务的输出
+        "task_outputs": result.get("task_outputs") or analysis_data.get("partial_task_outputs"),
+        "timings": result.get("timings"),
+        "usage": result.get("usage"),
+        "screening": result.get("screening"),
+        "progress_history": history,
+        "created_at": analysis_data.get("created_at"),
+        "completed_at": analysis_data.get("timestamp") if analysis_data.get("status") == "completed" else None
+    }
+    serializer = AnalysisResultSerializer(result_data)
+    return {
+        "status": "success",
+        "analysis_status": analysis_data.get("status"),
+        "error": analysis_data.get("error"),
+        "data": serializer.data
+    }
 
 
-class SurveyAnalysisView(APIView):
+def _stream_snapshot(analysis_id):
+    """返回SSE补发所需的进度历史，以及分析已结束时的最终结果"""
+    store = get_job_store()
+    history = store.get_progress(analysis_id)
+    analysis_data = store.get_result(analysis_id)
+    if analysis_data is None or analysis_data.get("status") not in FINISHED_STATUSES:
+        return history, None
+    return history, _result_payload(analysis_id, analysis_data, history)
+
+
+def _queue_info(analysis_id):
+    """本进程队列中的排队信息；任务不在本进程时退回到存储中的 job_state"""
+    queue_info = get_job_queue().snapshot(analysis_id)
+    if queue_info is not None:
+        return queue_info
+    analysis_data = get_job_store().get_result(analysis_id) or {}
+    return {"job_state": analysis_data.get("job_state"), "queue_position": None}
+
+
+def _publish_result(analysis_id):
+    """分析结束后推送最终结果"""
+    history, final = _stream_snapshot(analysis_id)
+    if final is not None:
+        progress_broker.publish(analysis_id, EVENT_RESULT, final)
+
+
+class AnalysisStreamView(View):
+    """以 Server-Sent Events 推送分析进度和最终结果"""
+    async def get(self, request, analysis_id):
+        if not await asyncio.to_thread(get_job_store().exists, analysis_id):
+            return _json({
+                "status": "error",
+                "error": "分析ID不存在或已过期"
+            }, status.HTTP_404_NOT_FOUND)
+        return sse_response(request, analysis_id, lambda: _stream_snapshot(analysis_id))
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AnalysisCancelView(View):
+    """取消排队中或正在执行的分析"""
+    async def post(self, request, analysis_id):
+        store = get_job_store()
+        analysis_data = await asyncio.to_thread(store.get_result, analysis_id)
+        if analysis_data is None:
+            return _json({
+                "status": "error",
+                "error": "分析ID不存在或已过期"
+            }, status.HTTP_404_NOT_FOUND)
+        if analysis_data.get("status") in FINISHED_STATUSES:
+            return _json({
+                "status": "error",
+                "error": "分析已经结束，无法取消",
+                "analysis_status": analysis_data.get("status")
+            }, status.HTTP_409_CONFLICT)
+
+        if await asyncio.to_thread(request_cancellation, analysis_id):
+            # 任务还在排队，直接记录为已取消
+            await asyncio.to_thread(_mark_stopped, analysis_id, CANCELLED, "分析已取消")
+            return _json({"status": "success", "analysis_status": CANCELLED})
+        # 正在执行的任务会在下一个检查点停止
+        return _json({"status": "success", "analysis_status": "cancelling"}, status.HTTP_202_ACCEPTED)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class SurveyAnalysisView(View):
     """处理调查分析请求的视图"""
-    def post(self, request):
+    async def post(self, request):
         try:
-            ser = SurveyAnalysisSerializer(data=request.data)
+            try:
+                payload = json.loads(request.body or b"{}")
+            except ValueError:
+                return _json({"ok": False, "errors": {"body": ["请求体必须是JSON"]}}, status.HTTP_400_BAD_REQUEST)
+
+            ser = SurveyAnalysisSerializer(data=payload)
             if not ser.is_valid():
-                return Response({"ok": False, "errors": ser.errors}, status=status.HTTP_400_BAD_REQUEST)
+                return _json({"ok": False, "errors": ser.errors}, status.HTTP_400_BAD_REQUEST)
             
             data_dict = build_data_json(ser.validated_data)
-            filename = request.query_params.get("filename")  # 可选：?filename=my_case
-            file_path = save_data_json(data_dict, filename_stem=filename)
+            filename = request.GET.get("filename")  # 可选：?filename=my_case
+            # 文件写入放到线程中，避免阻塞事件循环
+            file_path, _ = await asyncio.to_thread(save_data_json, data_dict, filename_stem=filename)
 
             # 生成分析ID，用于跟踪进度
             analysis_id = str(uuid.uuid4())
             
-            # 使用全局锁确保进度和结果字典的初始化是原子操作
-            with dictionaries_lock:
-                analysis_progress[analysis_id] = []
-                analysis_results[analysis_id] = {
-                    "analysis_id": analysis_id,
-                    "status": "started",
-                    "file_path": str(file_path),
-                    "timestamp": datetime.now().isoformat(),
-                    "result": None
-                }
+            # 进度列表和结果字典在存储中一次性创建
+            await asyncio.to_thread(get_job_store().create, analysis_id, {
+                "analysis_id": analysis_id,
+                "status": "started",
+                "file_path": str(file_path),
+                "created_at": datetime.now().isoformat(),
+                "timestamp": datetime.now().isoformat(),
+                "result": None
+            })
             
-            # 异步启动分析任务
-            asyncio.create_task(execute_crewai_async(analysis_id, file_path))
+            # 两种部署模式都在这里同步入队，队列已满时同样返回503；
+            # ASGI 模式下再由事件循环上被跟踪的协程等待分析结束，WSGI 模式下不需要等待
+            try:
+                future = get_job_queue().submit(analysis_id, execute_crewai_sync, analysis_id, file_path)
+            except QueueFullError as exc:
+                await asyncio.to_thread(_mark_failed, analysis_id, str(exc))
+                return _json({"ok": False, "analysis_id": analysis_id, "error": str(exc)},
+                             status.HTTP_503_SERVICE_UNAVAILABLE)
+            background_tasks.spawn(
+                execute_crewai_async(analysis_id, future),
+                name=f"analysis-{analysis_id}",
+            )
             
-            return Response({
+            return _json({
                 "ok": True,
                 "analysis_id": analysis_id,
                 "message": "分析已开始，请定期查询进度"
             })
         except Exception as e:
             logger.error(f"处理调查分析请求时发生错误: {str(e)}")
-            return Response({
+            return _json({
                 "ok": False,
                 "error": "创建分析任务失败"
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            }, status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-async def execute_crewai_async(analysis_id, file_path):
-    """异步执行CrewAI分析"""
+def _mark_completed(analysis_id, result):
+    """保存分析结果，并记录最后一次进度"""
+    get_job_store().update_result(
+        analysis_id,
+        status="completed",
+        result=asdict(result),
+        timestamp=datetime.now().isoformat()
+    )
+    record_analysis_progress(
+        analysis_id,
+        CrewAIProgress(
+            stage="completed",
+            progress=1.0,
+            message="分析完成",
+            task_name="AI分析",
+            task_status="completed"
+        )
+    )
+    _publish_result(analysis_id)
+
+
+def _mark_failed(analysis_id, error):
+    """保存失败状态，并记录失败进度"""
+    get_job_store().update_result(
+        analysis_id,
+        status="failed",
+        error=error,
+        timestamp=datetime.now().isoformat()
+    )
+    record_analysis_progress(
+        analysis_id,
+        CrewAIProgress(
+            stage="failed",
+            progress=0.0,
+            message=f"分析失败: {error}",
+            task_name="AI分析",
+            task_status="failed"
+        )
+    )
+    _publish_result(analysis_id)
+
+
+def _mark_stopped(analysis_id, reason, message):
+    """保存取消/超时状态，已完成任务的部分输出保留在结果中"""
+    get_job_store().update_result(
+        analysis_id,
+        status=reason,
+        error=message,
+        timestamp=datetime.now().isoformat()
+    )
+    record_analysis_progress(
+        analysis_id,
+        CrewAIProgress(
+            stage=reason,
+            progress=1.0,
+            message=message,
+            task_name="AI分析",
+            task_status=reason
+        )
+    )
+    _publish_result(analysis_id)
+
+
+def _load_payload(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _run_crew(analysis_id, file_path):
+    """在队列工作线程中执行CrewAI分析，进度直接写入任务状态存储"""
+    with cancellation_scope(analysis_id) as cancel_token:
+        # 排队期间可能已经收到取消请求
+        cancel_token.raise_if_cancelled()
+        return run_crewai_analysis(
+            Path(file_path),
+            progress_callback=lambda progress: record_analysis_progress(analysis_id, progress),
+            report_key=analysis_id,
+            cancel_token=cancel_token
+        )
+
+
+def _run_and_record(analysis_id, file_path):
+    """
+    在队列工作线程中执行分析并保存结果。
+
+    结果由工作线程自己写入任务状态存储：服务关闭时等待结果的协程可能被取消，
+    但线程中的分析会继续执行完，结果不能因此丢失。
+    """
+    try:
+        result = _run_crew(analysis_id, file_path)
+    except AnalysisCancelled as e:
+        _mark_stopped(analysis_id, e.reason, str(e))
+    except CrewAIExecutionError as e:
+        logger.error(f"CrewAI分析执行错误: {str(e)}")
+        _mark_failed(analysis_id, str(e))
+    except Exception as e:
+        logger.error(f"执行分析时发生未知错误: {str(e)}")
+        _mark_failed(analysis_id, f"内部错误: {str(e)}")
+    else:
+        _mark_completed(analysis_id, result)
+
+
+async def execute_crewai_async(analysis_id, future):
+    """
+    ASGI 模式下等待队列中的分析结束。
+
+    分析和结果保存都在队列工作线程中完成（见 execute_crewai_sync），这里只让服务关闭时
+    能通过 background_tasks 等待正在执行的分析。
+    """
+    try:
+        await asyncio.wrap_future(future)
+    except asyncio.CancelledError:
+        if future.cancelled():
+            # 排队中被取消接口移除，状态已经由取消接口记录
+            return
+        raise
+
+
+def execute_crewai_sync(analysis_id, file_path):
+    """在任务队列的工作线程中执行CrewAI分析（两种部署模式相同）：预处理、执行并保存结果"""
     try:
         # 更新进度为开始处理
-        await update_analysis_progress(
+        record_analysis_progress(
             analysis_id,
             CrewAIProgress(
                 stage="preprocessing",
@@ -205,13 +413,12 @@ async def execute_crewai_async(analysis_id, file_path):
                 task_status="in_progress"
             )
         )
-        
-        # 读取数据文件
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
+
+        # 读取数据文件，校验数据可用
+        _load_payload(file_path)
+
         # 更新进度
-        await update_analysis_progress(
+        record_analysis_progress(
             analysis_id,
             CrewAIProgress(
                 stage="processing",
@@ -221,74 +428,17 @@ async def execute_crewai_async(analysis_id, file_path):
                 task_status="completed"
             )
         )
-        
-        # 执行CrewAI分析 - 使用线程池运行同步函数
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            None,  # 使用默认线程池
-            lambda: run_crewai_analysis(
-                file_path,  # 注意：这里应该传递文件路径，而不是数据
-                progress_callback=lambda progress: asyncio.run_coroutine_threadsafe(
-                    update_analysis_progress(analysis_id, progress), loop
-                )
-            )
-        )
-        
-        # 更新结果
-        with dictionaries_lock:
-            analysis_results[analysis_id].update({
-                "status": "completed",
-                "result": result,
-                "timestamp": datetime.now().isoformat()
-            })
-        
-        # 最后更新一次进度
-        await update_analysis_progress(
-            analysis_id,
-            CrewAIProgress(
-                stage="completed",
-                progress=1.0,
-                message="分析完成",
-                task_name="AI分析",
-                task_status="completed"
-            )
-        )
-        
-    except CrewAIExecutionError as e:
-        logger.error(f"CrewAI分析执行错误: {str(e)}")
-        with dictionaries_lock:
-            analysis_results[analysis_id].update({
-                "status": "failed",
-                "error": str(e),
-                "timestamp": datetime.now().isoformat()
-            })
-        
-        await update_analysis_progress(
-            analysis_id,
-            CrewAIProgress(
-                stage="failed",
-                progress=0.0,
-                message=f"分析失败: {str(e)}",
-                task_name="AI分析",
-                task_status="failed"
-            )
-        )
     except Exception as e:
-        logger.error(f"异步执行分析时发生未知错误: {str(e)}")
-        with dictionaries_lock:
-            analysis_results[analysis_id].update({
-                "status": "failed",
-                "error": f"内部错误: {str(e)}",
-                "timestamp": datetime.now().isoformat()
-            })
-        
-        await update_analysis_progress(
-            analysis_id,
-            CrewAIProgress(
-                stage="failed",
-                progress=0.0,
-                message=f"分析失败: 内部错误",
-                task_name="AI分析",
-                task_status="failed"
-            )
-        )
\ No newline at end of file
+        logger.error(f"执行分析时发生未知错误: {str(e)}")
+        _mark_failed(analysis_id, f"内部错误: {str(e)}")
+        return
+    _run_and_record(analysis_id, file_path)
+
+
+class UsageStatsView(View):
+    """管理接口：进程启动以来各智能体、任务和工具的 token 与耗时汇总（仅限管理员）"""
+    async def get(self, request):
+        user = await request.auser()
+        if not user.is_staff:
+            return _json({"status": "error", "error": "需要管理员权限"}, status.HTTP_403_FORBIDDEN)
+        return _json({"status": "success", "data": usage_stats.snapshot()})
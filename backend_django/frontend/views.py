@@ -14,10 +14,21 @@ class HealthCheckView(APIView):
         return Response({
             "ok": True,
             "message": "服务正常运行",
-            "version": "1.0.0"
+            "version": "1.0.0",
+            # 知识库索引和智能体团队模板是否已加载（未就绪时第一个分析会更慢）
+            "ai": _ai_readiness()
         })
 
 
+def _ai_readiness():
+    try:
+        from ai.agent_runner import readiness
+        return readiness()
+    except Exception as e:
+        logger.warning(f"获取 AI 就绪状态失败: {str(e)}")
+        return {"ready": False, "error": str(e)}
+
+
 class FrontendConfigView(APIView):
     """提供前端配置信息的视图"""
     def get(self, request):
@@ -27,6 +38,7 @@ class FrontendConfigView(APIView):
                 "supported_features": [
                     "survey_analysis",
                     "real_time_progress",
+                    "progress_stream",
                     "result_retrieval"
                 ],
                 "service_status": "operational"
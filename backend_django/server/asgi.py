@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Run with e.g. ``uvicorn server.asgi:application``. The Django application is
+wrapped so that async views can hand long-running analyses to tracked
+background tasks on the server's event loop (see ``ai.background``).
 """
 
 import os
@@ -13,4 +17,8 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from ai.background import BackgroundTaskLifespan  # noqa: E402  需在 Django 初始化之后导入
+
+application = BackgroundTaskLifespan(django_application)
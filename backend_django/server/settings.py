@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -152,4 +153,45 @@ CSRF_TRUSTED_ORIGINS = [
     "http://127.0.0.1:3000",
 ]
 
-DEBUG = True
\ No newline at end of file
+DEBUG = True
+
+# AI 分析任务队列配置
+# 同时运行的 CrewAI 分析数量上限，超出的任务按 FIFO 顺序排队
+AI_ANALYSIS_MAX_CONCURRENCY = int(os.environ.get("AI_ANALYSIS_MAX_CONCURRENCY", "2"))
+# 排队中的任务数量上限，队列满时新提交会返回 503
+AI_ANALYSIS_QUEUE_MAX = int(os.environ.get("AI_ANALYSIS_QUEUE_MAX", "200"))
+# 单个分析从开始执行起的最长时间（秒），超时后在下一个检查点停止；0 表示不限制
+AI_ANALYSIS_TIMEOUT_SECONDS = int(os.environ.get("AI_ANALYSIS_TIMEOUT_SECONDS", "900"))
+# 进程启动时在后台线程中预先加载知识库索引和智能体团队模板，避免第一个分析请求承担冷启动开销
+# 也可以在部署脚本中执行 python manage.py warmup_ai
+AI_WARMUP_ON_STARTUP = os.environ.get("AI_WARMUP_ON_STARTUP", "0").lower() in ("1", "true", "yes")
+
+# 分析任务状态存储（进度和结果）
+# memory: 进程内存储，仅适合单 worker；sqlite: 同一主机多 worker 共享；redis: 跨主机共享
+AI_JOB_STORE = {
+    "BACKEND": os.environ.get("AI_JOB_STORE_BACKEND", "memory"),
+    "PATH": os.environ.get("AI_JOB_STORE_PATH", str(BASE_DIR / "data" / "job_state.sqlite3")),
+    "URL": os.environ.get("AI_JOB_STORE_URL", "redis://127.0.0.1:6379/0"),
+    "MAX_JOBS": int(os.environ.get("AI_JOB_STORE_MAX_JOBS", "1000")),
+    "TTL": int(os.environ.get("AI_JOB_STORE_TTL", str(24 * 3600))),
+}
+
+# 分析结果缓存：问卷内容相同的提交直接返回已有结果，不再调用大模型
+# 设置 AI_RESULT_CACHE_ENABLED=0 可以整体关闭；单次请求可以用 ?no_cache=1 跳过
+AI_RESULT_CACHE_ENABLED = os.environ.get("AI_RESULT_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # 多 worker 部署时可改为 FileBasedCache / RedisCache 等共享后端
+    "ai_results": {
+        "BACKEND": os.environ.get("AI_RESULT_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("AI_RESULT_CACHE_LOCATION", "qrent-ai-results"),
+        "TIMEOUT": int(os.environ.get("AI_RESULT_CACHE_TTL", str(6 * 3600))),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.environ.get("AI_RESULT_CACHE_MAX_ENTRIES", "500")),
+        },
+        # 修改智能体提示词或流程后递增版本号，让旧结果失效
+        "VERSION": int(os.environ.get("AI_RESULT_CACHE_VERSION", "1")),
+    },
+}
@@ -1,8 +1,10 @@
 from django.urls import path
-from .views import SurveyView, AnalysisProgressView, AnalysisResultView
+from .views import SurveyView, AnalysisProgressView, AnalysisResultView, AnalysisStreamView, CancelAnalysisView
 
 urlpatterns = [
     path('survey/', SurveyView.as_view(), name='survey'),
     path('progress/<str:analysis_id>/', AnalysisProgressView.as_view(), name='analysis_progress'),
     path('result/<str:analysis_id>/', AnalysisResultView.as_view(), name='analysis_result'),
+    path('stream/<str:analysis_id>/', AnalysisStreamView.as_view(), name='analysis_stream'),
+    path('cancel/<str:analysis_id>/', CancelAnalysisView.as_view(), name='analysis_cancel'),
 ]
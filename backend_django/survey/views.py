@@ -1,85 +1,55 @@
 # survey/views.py
+from django.urls import reverse
+from django.views import View
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-import asyncio
 import json
 import uuid
 from pathlib import Path
-import threading
 from datetime import datetime
 import logging
 
 from .serializers import SurveySerializer
 from .utils import build_data_json, save_data_json
-from ai.agent_runner import run_crewai_analysis, CrewAIExecutionError, CrewAIProgress
+from ai.agent_runner import (run_crewai_analysis, analysis_variant, CrewAIExecutionError, CrewAIProgress,
+                             AnalysisCancelled)
+from ai.cancellation import cancellation_scope, request_cancellation, CANCELLED, TIMED_OUT
+from ai.job_queue import get_job_queue, QueueFullError, JOB_QUEUED, JOB_RUNNING
+from ai.job_store import get_job_store
+from ai.result_cache import survey_cache_key, get_cached_result, store_result, is_cacheable, is_bypass_requested
+from ai.events import progress_broker, sse_response, EVENT_PROGRESS, EVENT_RESULT
 
 # 配置日志记录器
 logger = logging.getLogger(__name__)
 
-# 全局字典用于跟踪分析进度和结果
-# 使用OrderedDict来限制字典大小，防止内存泄漏
-from collections import OrderedDict
-import threading
-
-class LimitedSizeDict(OrderedDict):
-    """有限大小的字典，当达到最大容量时自动删除最早的条目"""
-    def __init__(self, max_size=100):
-        super().__init__()
-        self.max_size = max_size
-        self.lock = threading.RLock()  # 添加锁以确保线程安全
-
-    def __setitem__(self, key, value):
-        with self.lock:
-            # 如果达到最大容量，删除最早添加的项
-            if key not in self and len(self) >= self.max_size:
-                self.popitem(last=False)
-            super().__setitem__(key, value)
-    
-    def __getitem__(self, key):
-        with self.lock:
-            return super().__getitem__(key)
-    
-    def __contains__(self, key):
-        with self.lock:
-            return super().__contains__(key)
-    
-    def get(self, key, default=None):
-        with self.lock:
-            return super().get(key, default)
-
-# 创建有限大小的字典，最大存储100个条目
-analysis_progress = LimitedSizeDict(max_size=100)
-analysis_results = LimitedSizeDict(max_size=100)
-
-# 全局锁用于复杂操作的原子性
-dictionaries_lock = threading.RLock()
-
-# 模拟WebSocket的进度更新机制
-async def update_analysis_progress(analysis_id, progress_info):
-    """更新分析任务的进度信息"""
-    if analysis_id not in analysis_progress:
-        analysis_progress[analysis_id] = []
-    progress_entry = {
-        'stage': progress_info.stage,
-        'progress': progress_info.progress,
-        'message': progress_info.message,
-        'task_name': progress_info.task_name,
-        'task_status': progress_info.task_status,
-        'timestamp': datetime.now().isoformat()
+# 进度的这些阶段表示分析已经结束，轮询客户端可以停止
+TERMINAL_STAGES = ("error", "completed", CANCELLED, TIMED_OUT)
+
+# 分析进度和结果保存在可插拔的任务状态存储中（见 ai/job_store.py），
+# 使用共享后端时，多个 worker 进程都能查询到同一个分析任务
+
+
+def _initial_analysis(**extra):
+    """分析结果字典的初始状态"""
+    analysis = {
+        "ok": False,
+        "status": "processing",
+        "summary": None,
+        "report_markdown": None,
+        "report_path": None,
+        "tasks": None,
+        "error": None,
+        "timestamp": datetime.now().isoformat()
     }
-    analysis_progress[analysis_id].append(progress_entry)
-    
-    # 同步更新结果字典中的状态
-    if analysis_id in analysis_results:
-        analysis_results[analysis_id]['status'] = 'processing'
-        analysis_results[analysis_id]['timestamp'] = datetime.now().isoformat()
+    analysis.update(extra)
+    return analysis
+
 
-# 清除过期的进度信息
-async def cleanup_progress():
-    """定期清理过期的进度信息"""
-    # 这里可以添加清理逻辑
-    pass
+def _with_history(analysis_id, analysis):
+    """结果字典中的进度历史在读取时从存储中补齐，避免重复保存"""
+    analysis["progress_history"] = get_job_store().get_progress(analysis_id)
+    return analysis
 
 
 class SurveyView(APIView):
@@ -89,47 +59,64 @@ class SurveyView(APIView):
             ser = SurveySerializer(data=request.data)
             if not ser.is_valid():
                 return Response({"ok": False, "errors": ser.errors}, status=status.HTTP_400_BAD_REQUEST)
-            
+
             data_dict = build_data_json(ser.validated_data)
             filename = request.query_params.get("filename")  # 可选：?filename=my_case
             file_path = save_data_json(data_dict, filename_stem=filename)
 
             # 生成分析ID，用于跟踪进度
             analysis_id = str(uuid.uuid4())
-            
-            # 使用全局锁确保进度和结果字典的初始化是原子操作
-            with dictionaries_lock:
-                # 初始化进度字典，避免后续查询时出现Not Found错误
-                analysis_progress[analysis_id] = [{
-                    'stage': 'initialization',
+            store = get_job_store()
+
+            # 相同内容的问卷当天在相同配置下已经分析过时直接返回缓存结果，不进入队列
+            cache_key = survey_cache_key(data_dict, analysis_variant())
+            cached = None if is_bypass_requested(request) else get_cached_result(cache_key)
+            if cached is not None:
+                _complete_from_cache(analysis_id, cached)
+                return Response({
+                    "ok": True,
+                    "message": "已返回相同问卷的缓存分析结果",
+                    "filename": file_path.name,
+                    "path": str(file_path),
+                    "analysis_id": analysis_id,
+                    "cache_hit": True,
+                    "progress_url": reverse("analysis_progress", args=[analysis_id]),
+                    "result_url": reverse("analysis_result", args=[analysis_id]),
+                    "stream_url": reverse("analysis_stream", args=[analysis_id]),
+                    **_queue_info(analysis_id),
+                })
+
+            # 初始化进度和结果，确保即使在分析过程中查询也不会返回404
+            store.create(
+                analysis_id,
+                _initial_analysis(job_state=JOB_QUEUED),
+                [{
+                    'stage': 'queued',
                     'progress': 0.0,
-                    'message': '开始初始化分析',
+                    'message': '分析任务已进入队列，等待执行',
                     'task_name': None,
-                    'task_status': 'starting',
+                    'task_status': JOB_QUEUED,
                     'timestamp': datetime.now().isoformat()
                 }]
-                
-                # 初始化结果字典，确保即使在分析过程中查询也不会返回404
-                analysis_results[analysis_id] = {
-                    "ok": False,
-                    "status": "processing",
-                    "summary": None,
-                    "report_markdown": None,
-                    "report_path": None,
-                    "tasks": None,
-                    "error": None,
-                    "progress_history": [],
-                    "timestamp": datetime.now().isoformat()
-                }
-            
-            # 在后台线程中启动分析
-            thread = threading.Thread(
-                target=start_async_analysis,
-                args=(analysis_id, file_path),
-                daemon=True
             )
-            thread.start()
-            
+
+            # 提交到进程级有界队列，由固定数量的工作线程按FIFO顺序执行
+            job_queue = get_job_queue()
+            try:
+                job_queue.submit(analysis_id, run_analysis_job, analysis_id, file_path, cache_key)
+            except QueueFullError as exc:
+                _append_progress(analysis_id, {
+                    'stage': 'error',
+                    'progress': 1.0,
+                    'message': str(exc),
+                    'task_name': None,
+                    'task_status': 'rejected',
+                    'timestamp': datetime.now().isoformat()
+                })
+                store.update_result(analysis_id, status="error", error=str(exc), job_state="rejected")
+                return Response({"ok": False, "error": str(exc), "analysis_id": analysis_id},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
             # 立即返回响应，包含分析ID和状态检查的URL
             return Response({
                 "ok": True,
@@ -137,8 +124,11 @@ class SurveyView(APIView):
                 "filename": file_path.name,
                 "path": str(file_path),
                 "analysis_id": analysis_id,
-                "progress_url": f"/survey/progress/{analysis_id}/",
-                "result_url": f"/survey/result/{analysis_id}/",
+                "progress_url": reverse("analysis_progress", args=[analysis_id]),
+                "result_url": reverse("analysis_result", args=[analysis_id]),
+                "stream_url": reverse("analysis_stream", args=[analysis_id]),
+                "cache_hit": False,
+                **_queue_info(analysis_id),
             })
         except Exception as e:
             logger.error(f"SurveyView处理请求失败: {str(e)}", exc_info=True)
@@ -148,168 +138,249 @@ class SurveyView(APIView):
 class AnalysisProgressView(APIView):
     """获取分析进度的视图"""
     def get(self, request, analysis_id):
-        # 使用全局锁确保在检查和初始化字典时的线程安全
-        with dictionaries_lock:
-            # 如果分析ID不存在，初始化一个进度条目
-            if analysis_id not in analysis_progress:
-                analysis_progress[analysis_id] = [{
-                    'stage': 'initialization',
-                    'progress': 0.0,
-                    'message': '分析尚未开始',
-                    'task_name': None,
-                    'task_status': 'not_started',
-                    'timestamp': datetime.now().isoformat()
-                }]
-                
-                # 同时初始化结果字典，确保一致性
-                if analysis_id not in analysis_results:
-                    analysis_results[analysis_id] = {
-                        "ok": False,
-                        "status": "processing",
-                        "summary": None,
-                        "report_markdown": None,
-                        "report_path": None,
-                        "tasks": None,
-                        "error": None,
-                        "progress_history": [],
-                        "timestamp": datetime.now().isoformat()
-                    }
-            
-            # 获取进度数据（在锁内完成以确保一致性）
-            progress_data = analysis_progress[analysis_id].copy()
-        
-        # 在锁外处理数据和返回响应
+        store = get_job_store()
+        progress_data = store.get_progress(analysis_id)
+        # 还没有进度时只在响应中返回初始条目，不写入存储：
+        # 读取时写入可能与正在提交或保存结果的请求交错，覆盖已有的结果和进度
+        if not progress_data:
+            progress_data = [{
+                'stage': 'initialization',
+                'progress': 0.0,
+                'message': '分析尚未开始',
+                'task_name': None,
+                'task_status': 'not_started',
+                'timestamp': datetime.now().isoformat()
+            }]
+
         latest = progress_data[-1]
+        queue_info = _queue_info(analysis_id)
+        message = latest['message']
+        if queue_info["job_state"] == JOB_QUEUED and queue_info["queue_position"]:
+            message = f"排队中，前方还有{queue_info['queue_position'] - 1}个任务"
         return Response({
             "ok": True,
-            "in_progress": latest['stage'] not in ['error', 'completed'],
+            "in_progress": latest['stage'] not in TERMINAL_STAGES,
             "progress": latest['progress'],
-            "message": latest['message'],
+            "message": message,
             "details": progress_data,
             "analysis_id": analysis_id,
-            "timestamp": latest.get('timestamp', datetime.now().isoformat())
+            "timestamp": latest.get('timestamp', datetime.now().isoformat()),
+            **queue_info,
         })
 
 
 class AnalysisResultView(APIView):
     """获取分析结果的视图"""
     def get(self, request, analysis_id):
-        # 使用全局锁确保在检查和初始化字典时的线程安全
-        with dictionaries_lock:
-            # 如果分析ID不存在，初始化一个处理中的状态，避免返回404错误
-            if analysis_id not in analysis_results:
-                # 检查是否有进度信息，说明任务正在执行但结果尚未保存
-                progress_info = None
-                if analysis_id in analysis_progress and analysis_progress[analysis_id]:
-                    latest_progress = analysis_progress[analysis_id][-1]
-                    progress_info = latest_progress.get('message', '分析正在进行中')
-                else:
-                    progress_info = '分析请求已接收，正在准备处理'
-                    # 同时初始化进度字典
-                    analysis_progress[analysis_id] = [{
-                        'stage': 'initialization',
-                        'progress': 0.0,
-                        'message': progress_info,
-                        'task_name': None,
-                        'task_status': 'not_started',
-                        'timestamp': datetime.now().isoformat()
-                    }]
-                
-                # 初始化结果字典
-                initial_analysis = {
-                    "ok": False,
-                    "status": "processing",
-                    "summary": None,
-                    "report_markdown": None,
-                    "report_path": None,
-                    "tasks": None,
-                    "error": None,
-                    "message": progress_info,
-                    "progress_history": analysis_progress.get(analysis_id, []),
-                    "timestamp": datetime.now().isoformat()
-                }
-                # 存储这个初始状态，避免后续请求再次返回404
-                analysis_results[analysis_id] = initial_analysis
-                
-                # 返回初始状态响应
-                return Response({
-                    "ok": False,
-                    "analysis": initial_analysis,
-                    "message": progress_info
-                }, status=status.HTTP_200_OK)
-            
-            # 获取结果的副本（在锁内完成以确保一致性）
-            result = analysis_results[analysis_id].copy()
+        store = get_job_store()
+        result = store.get_result(analysis_id)
+        # 如果分析ID不存在，返回一个处理中的状态，避免返回404错误。
+        # 这个状态不写入存储：结果可能正在被保存，读取时写入会覆盖它和已有的进度
+        if result is None:
+            # 检查是否有进度信息，说明任务正在执行但结果尚未保存
+            progress = store.get_progress(analysis_id)
+            if progress:
+                progress_info = progress[-1].get('message', '分析正在进行中')
+            else:
+                progress_info = '分析请求已接收，正在准备处理'
+                progress = [{
+                    'stage': 'initialization',
+                    'progress': 0.0,
+                    'message': progress_info,
+                    'task_name': None,
+                    'task_status': 'not_started',
+                    'timestamp': datetime.now().isoformat()
+                }]
+
+            initial_analysis = _initial_analysis(message=progress_info, progress_history=progress)
+
+            # 返回初始状态响应
+            return Response({
+                "ok": False,
+                "analysis": initial_analysis,
+                "message": progress_info
+            }, status=status.HTTP_200_OK)
+
+        result = _with_history(analysis_id, result)
         # 根据结果的状态返回不同的响应
         if result.get("status") == "processing":
             # 获取最新进度信息
             progress_info = "分析正在进行中"
-            if analysis_id in analysis_progress and analysis_progress[analysis_id]:
-                latest_progress = analysis_progress[analysis_id][-1]
-                progress_info = latest_progress.get('message', progress_info)
+            if result["progress_history"]:
+                progress_info = result["progress_history"][-1].get('message', progress_info)
+            queue_info = _queue_info(analysis_id)
+            if queue_info["job_state"] == JOB_QUEUED and queue_info["queue_position"]:
+                progress_info = f"排队中，前方还有{queue_info['queue_position'] - 1}个任务"
             return Response({
                 "ok": False,
                 "analysis": result,
                 "message": progress_info,
-                "analysis_id": analysis_id
-            }, status=status.HTTP_200_OK)
-        elif result.get("status") == "error" or result.get("error"):
-            # 即使出错，也返回200状态码，但在响应体中表明错误状态
-            return Response({
-                "ok": False,
-                "analysis": result,
-                "message": "分析过程中遇到错误",
-                "analysis_id": analysis_id
+                "analysis_id": analysis_id,
+                **queue_info,
             }, status=status.HTTP_200_OK)
         else:
-            # 成功完成的情况
+            # 出错时也返回200状态码，在响应体中表明错误状态
+            return Response(_final_result_payload(analysis_id, result), status=status.HTTP_200_OK)
+
+
+class CancelAnalysisView(APIView):
+    """取消排队中或正在执行的分析"""
+    def post(self, request, analysis_id):
+        store = get_job_store()
+        result = store.get_result(analysis_id)
+        if result is None:
+            return Response({"ok": False, "error": "分析ID不存在或已过期"}, status=status.HTTP_404_NOT_FOUND)
+        if result.get("status") != "processing":
             return Response({
-                "ok": True,
-                "analysis": result,
-                "message": "分析成功完成",
-                "analysis_id": analysis_id
-            }, status=status.HTTP_200_OK)
+                "ok": False,
+                "error": "分析已经结束，无法取消",
+                "analysis_id": analysis_id,
+                "status": result.get("status"),
+            }, status=status.HTTP_409_CONFLICT)
+
+        if request_cancellation(analysis_id):
+            # 任务还在排队，直接记录为已取消
+            result.update({
+                "status": CANCELLED,
+                "job_state": CANCELLED,
+                "error": "分析已取消",
+                "timestamp": datetime.now().isoformat()
+            })
+            store.set_result(analysis_id, result)
+            _append_progress(analysis_id, {
+                'stage': CANCELLED,
+                'progress': 1.0,
+                'message': '分析已取消',
+                'task_name': None,
+                'task_status': CANCELLED,
+                'timestamp': datetime.now().isoformat()
+            })
+            _publish_result(analysis_id)
+            return Response({"ok": True, "analysis_id": analysis_id, "status": CANCELLED})
+
+        # 正在执行的任务会在下一个检查点停止，最终状态通过进度流/结果接口返回
+        return Response({"ok": True, "analysis_id": analysis_id, "status": "cancelling"},
+                        status=status.HTTP_202_ACCEPTED)
+
+
+class AnalysisStreamView(View):
+    """以 Server-Sent Events 推送分析进度和最终结果，替代轮询"""
+    def get(self, request, analysis_id):
+        return sse_response(request, analysis_id, lambda: _stream_snapshot(analysis_id))
+
+
+def _final_result_payload(analysis_id, result):
+    """构造已结束分析的结果响应体，结果接口和SSE结果事件共用"""
+    if result.get("status") in (CANCELLED, TIMED_OUT):
+        return {
+            "ok": False,
+            "analysis": result,
+            "message": "分析已取消" if result["status"] == CANCELLED else "分析超时，已停止",
+            "analysis_id": analysis_id
+        }
+    if result.get("status") == "error" or result.get("error"):
+        return {
+            "ok": False,
+            "analysis": result,
+            "message": "分析过程中遇到错误",
+            "analysis_id": analysis_id
+        }
+    return {
+        "ok": True,
+        "analysis": result,
+        "message": "分析成功完成",
+        "analysis_id": analysis_id
+    }
+
+
+def _stream_snapshot(analysis_id):
+    """返回SSE补发所需的进度历史，以及分析已结束时的最终结果"""
+    store = get_job_store()
+    result = store.get_result(analysis_id)
+    history = store.get_progress(analysis_id)
+    if result is None or result.get("status") == "processing":
+        return history, None
+    result["progress_history"] = history
+    return history, _final_result_payload(analysis_id, result)
+
+
+def _append_progress(analysis_id, progress_entry):
+    """追加一条进度并推送给SSE订阅者"""
+    seq = get_job_store().append_progress(analysis_id, progress_entry)
+    progress_broker.publish(analysis_id, EVENT_PROGRESS, progress_entry, seq=seq)
+
 
+def _publish_result(analysis_id):
+    """分析结束后推送最终结果"""
+    history, final = _stream_snapshot(analysis_id)
+    if final is not None:
+        progress_broker.publish(analysis_id, EVENT_RESULT, final)
+
+
+def _queue_info(analysis_id):
+    """返回分析任务在队列中的状态和位置，供进度/结果接口展示"""
+    snapshot = get_job_queue().snapshot(analysis_id)
+    if snapshot is None:
+        # 任务由其他 worker 进程执行，只能给出存储中记录的状态
+        result = get_job_store().get_result(analysis_id) or {}
+        snapshot = {"job_state": result.get("job_state")}
+    return {
+        "job_state": snapshot.get("job_state"),
+        "queue_position": snapshot.get("queue_position"),
+        "queued_jobs": snapshot.get("queued_jobs"),
+        "running_jobs": snapshot.get("running_jobs"),
+    }
+
+
+def _complete_from_cache(analysis_id, cached):
+    """用缓存中的结果直接完成一个分析任务"""
+    now = datetime.now().isoformat()
+    analysis = _initial_analysis(
+        ok=True,
+        status="completed",
+        job_state="completed",
+        cache_hit=True,
+        cached_at=cached.get("cached_at"),
+    )
+    analysis.update({field: cached.get(field) for field in ("summary", "report_markdown", "report_path", "tasks", "timings", "screening")})
+    get_job_store().create(analysis_id, analysis, [{
+        'stage': 'completed',
+        'progress': 1.0,
+        'message': '命中分析结果缓存',
+        'task_name': None,
+        'task_status': 'completed',
+        'timestamp': now
+    }])
+    logger.info(f"分析任务 {analysis_id} 命中结果缓存")
+    _publish_result(analysis_id)
+
+
+# 分析任务执行器（在队列工作线程中运行）
+def execute_crewai_analysis(analysis_id, file_path, cache_key=None):
+    """执行CrewAI分析并把进度和结果写入任务状态存储"""
+    store = get_job_store()
+    # 已完成任务的输出，分析进行中即可通过结果接口读取
+    partial_tasks = []
 
-# 异步任务执行器
-async def execute_crewai_async(analysis_id, file_path):
-    """异步执行CrewAI分析"""
-    
     # 进度回调函数
-    async def progress_callback(progress_info):
-        # 使用全局锁保护progress字典的更新
-        with dictionaries_lock:
-            if analysis_id not in analysis_progress:
-                analysis_progress[analysis_id] = []
-            progress_entry = {
-                'stage': progress_info.stage,
-                'progress': progress_info.progress,
-                'message': progress_info.message,
-                'task_name': progress_info.task_name,
-                'task_status': progress_info.task_status,
-                'timestamp': datetime.now().isoformat()
-            }
-            analysis_progress[analysis_id].append(progress_entry)
-            
-            # 同步更新结果字典中的状态
-            if analysis_id in analysis_results:
-                analysis_results[analysis_id]['status'] = 'processing'
-                analysis_results[analysis_id]['timestamp'] = datetime.now().isoformat()
-    
-    # 同步函数的异步包装器
-    def progress_callback_sync(progress_info):
-        # 在当前事件循环中创建任务，避免asyncio.run()导致的错误
-        try:
-            asyncio.create_task(progress_callback(progress_info))
-        except Exception as e:
-            # 如果当前没有运行的事件循环，使用线程执行
-            def run_async_in_thread():
-                try:
-                    asyncio.run(progress_callback(progress_info))
-                except Exception as inner_e:
-                    logger.error(f"线程中异步回调失败: {inner_e}")
-            threading.Thread(target=run_async_in_thread, daemon=True).start()
-    
+    def progress_callback(progress_info):
+        progress_entry = {
+            'stage': progress_info.stage,
+            'progress': progress_info.progress,
+            'message': progress_info.message,
+            'task_name': progress_info.task_name,
+            'task_status': progress_info.task_status,
+            'timestamp': datetime.now().isoformat()
+        }
+        _append_progress(analysis_id, progress_entry)
+
+        # 同步更新结果字典中的状态
+        fields = {"status": "processing", "timestamp": datetime.now().isoformat()}
+        if progress_info.task_output is not None:
+            partial_tasks.append(progress_info.task_output)
+            fields["tasks"] = list(partial_tasks)
+        store.update_result(analysis_id, **fields)
+
     # 初始化分析结果对象
     analysis = {
         "ok": False,
@@ -319,23 +390,28 @@ async def execute_crewai_async(analysis_id, file_path):
         "report_path": None,
         "tasks": None,
         "error": None,
-        "progress_history": [],
+        "job_state": JOB_RUNNING,
         "timestamp": datetime.now().isoformat()
     }
 
     try:
-        # 发送初始进度
-        initial_progress = CrewAIProgress(
-            stage="initialization",
-            progress=0.1,
-            message="开始CrewAI分析",
-            task_status="starting"
-        )
-        await progress_callback(initial_progress)
-        
-        # 同步执行run_crewai_analysis，但提供进度回调
-        crew_result = run_crewai_analysis(file_path, progress_callback=progress_callback_sync)
-        
+        with cancellation_scope(analysis_id) as cancel_token:
+            # 排队期间可能已经收到取消请求
+            cancel_token.raise_if_cancelled()
+            store.update_result(analysis_id, job_state=JOB_RUNNING)
+            # 发送初始进度
+            initial_progress = CrewAIProgress(
+                stage="initialization",
+                progress=0.1,
+                message="开始CrewAI分析",
+                task_status="starting"
+            )
+            progress_callback(initial_progress)
+
+            # 执行run_crewai_analysis，并提供进度回调和取消令牌
+            crew_result = run_crewai_analysis(file_path, progress_callback=progress_callback,
+                                              report_key=analysis_id, cancel_token=cancel_token)
+
         # 更新进度为完成
         complete_progress = CrewAIProgress(
             stage="completed",
@@ -343,123 +419,112 @@ async def execute_crewai_async(analysis_id, file_path):
             message="分析完成",
             task_status="completed"
         )
-        await progress_callback(complete_progress)
-        
-        # 使用全局锁确保线程安全地更新分析结果
-        with dictionaries_lock:
-            # 更新分析结果
-            analysis.update({
-                "ok": bool(crew_result.summary or crew_result.report_markdown),
-                "status": "completed" if crew_result.summary or crew_result.report_markdown else "partial",
-                "summary": crew_result.summary,
-                "report_markdown": crew_result.report_markdown,
-                "report_path": crew_result.report_path,
-                "tasks": crew_result.task_outputs,
-                "error": None,
-                "timestamp": datetime.now().isoformat()
-            })
-            # 合并现有进度历史，避免丢失
-            if analysis_id in analysis_progress:
-                analysis["progress_history"] = analysis_progress[analysis_id]
-            # 保存结果
-            analysis_results[analysis_id] = analysis
+        progress_callback(complete_progress)
+
+        # 更新分析结果
+        analysis.update({
+            "ok": bool(crew_result.summary or crew_result.report_markdown),
+            "status": "completed" if crew_result.summary or crew_result.report_markdown else "partial",
+            "summary": crew_result.summary,
+            "report_markdown": crew_result.report_markdown,
+            "report_path": crew_result.report_path,
+            "tasks": crew_result.task_outputs or partial_tasks or None,
+            "timings": crew_result.timings,
+            "usage": crew_result.usage,
+            "screening": crew_result.screening,
+            "error": None,
+            "job_state": "completed",
+            "cache_hit": False,
+            "timestamp": datetime.now().isoformat()
+        })
+        if is_cacheable(crew_result):
+            store_result(cache_key, analysis)
+    except AnalysisCancelled as exc:
+        # 用户取消或超时：保留已完成任务的输出
+        logger.info(f"分析任务 {analysis_id} 已停止: {exc.reason}")
+        analysis.update({
+            "status": exc.reason,
+            "job_state": exc.reason,
+            "error": str(exc),
+            "tasks": partial_tasks or None,
+        })
+        progress_callback(CrewAIProgress(
+            stage=exc.reason,
+            progress=1.0,
+            message=str(exc),
+            task_status=exc.reason
+        ))
     except CrewAIExecutionError as exc:
         error_message = str(exc)
         logger.error(f"CrewAI执行错误: {error_message}")
-        
-        # 使用全局锁确保线程安全地更新错误状态
-        with dictionaries_lock:
-            analysis["error"] = error_message
-            analysis["status"] = "error"
-            
-            # 更新进度为错误状态
-            error_progress = CrewAIProgress(
-                stage="error",
-                progress=1.0,
-                message=f"执行失败: {error_message}",
-                task_status="error"
-            )
-            await progress_callback(error_progress)
+
+        analysis["error"] = error_message
+        analysis["status"] = "error"
+        analysis["job_state"] = "failed"
+
+        # 更新进度为错误状态
+        error_progress = CrewAIProgress(
+            stage="error",
+            progress=1.0,
+            message=f"执行失败: {error_message}",
+            task_status="error"
+        )
+        progress_callback(error_progress)
     except Exception as e:  # 捕获所有其他异常，确保结果始终被更新
         error_message = f"未预期的错误: {str(e)}"
         logger.error(f"CrewAI分析过程中发生意外错误: {error_message}", exc_info=True)
-        
-        # 使用全局锁确保线程安全地更新错误状态
-        with dictionaries_lock:
-            analysis["error"] = error_message
-            analysis["status"] = "error"
-            
-            # 更新进度为错误状态
-            error_progress = CrewAIProgress(
-                stage="error",
-                progress=1.0,
-                message=error_message,
-                task_status="error"
-            )
-            await progress_callback(error_progress)
+
+        analysis["error"] = error_message
+        analysis["status"] = "error"
+        analysis["job_state"] = "failed"
+
+        # 更新进度为错误状态
+        error_progress = CrewAIProgress(
+            stage="error",
+            progress=1.0,
+            message=error_message,
+            task_status="error"
+        )
+        progress_callback(error_progress)
     finally:
-        # 使用全局锁确保线程安全地更新最终结果
-        with dictionaries_lock:
-            # 确保在任何情况下都更新结果字典
-            # 合并现有进度历史，避免丢失
-            if analysis_id in analysis_progress:
-                analysis["progress_history"] = analysis_progress[analysis_id]
-            
-            # 确保始终更新结果
-            analysis_results[analysis_id] = analysis
-            logger.info(f"分析任务 {analysis_id} 完成，状态: {analysis['status']}")
-
-
-# 启动异步任务的辅助函数
-def start_async_analysis(analysis_id, file_path):
-    """启动异步分析任务"""
-    loop = None
+        # 确保在任何情况下都更新结果（进度历史在读取时从存储中补齐）
+        store.set_result(analysis_id, analysis)
+        logger.info(f"分析任务 {analysis_id} 完成，状态: {analysis['status']}")
+        _publish_result(analysis_id)
+
+
+# 队列任务入口
+def run_analysis_job(analysis_id, file_path, cache_key=None):
+    """由分析队列的工作线程调用，确保任何异常都会写入结果"""
     try:
         # 确保日志记录
-        logger.info(f"开始异步分析任务: {analysis_id}, 文件: {file_path}")
-        
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(execute_crewai_async(analysis_id, file_path))
+        logger.info(f"开始分析任务: {analysis_id}, 文件: {file_path}")
+        execute_crewai_analysis(analysis_id, file_path, cache_key)
     except Exception as e:
         error_message = str(e)
-        logger.error(f"异步分析执行失败: {error_message}", exc_info=True)
-        
-        # 使用全局锁确保线程安全地更新错误状态
-        with dictionaries_lock:
-            # 确保即使在异常情况下也更新进度和结果
-            error_analysis = {
-                "ok": False,
-                "status": "error",
-                "summary": None,
-                "report_markdown": None,
-                "report_path": None,
-                "tasks": None,
-                "error": error_message,
-                "progress_history": [],
-                "timestamp": datetime.now().isoformat()
-            }
-            analysis_results[analysis_id] = error_analysis
-            
-            # 更新进度为错误状态
-            if analysis_id not in analysis_progress:
-                analysis_progress[analysis_id] = []
-            analysis_progress[analysis_id].append({
-                'stage': 'error',
-                'progress': 1.0,
-                'message': f"执行失败: {error_message}",
-                'task_name': None,
-                'task_status': 'error',
-                'timestamp': datetime.now().isoformat()
-            })
-            
-            # 更新结果对象中的进度历史
-            analysis_results[analysis_id]['progress_history'] = analysis_progress[analysis_id]
-    finally:
-        # 确保事件循环被正确关闭
-        if loop:
-            try:
-                loop.close()
-            except:
-                pass
+        logger.error(f"分析任务执行失败: {error_message}", exc_info=True)
 
+        # 确保即使在异常情况下也更新进度和结果
+        store = get_job_store()
+        store.set_result(analysis_id, {
+            "ok": False,
+            "status": "error",
+            "summary": None,
+            "report_markdown": None,
+            "report_path": None,
+            "tasks": None,
+            "error": error_message,
+            "job_state": "failed",
+            "timestamp": datetime.now().isoformat()
+        })
+
+        # 更新进度为错误状态
+        _append_progress(analysis_id, {
+            'stage': 'error',
+            'progress': 1.0,
+            'message': f"执行失败: {error_message}",
+            'task_name': None,
+            'task_status': 'error',
+            'timestamp': datetime.now().isoformat()
+        })
+        _publish_result(analysis_id)
@@ -0,0 +1,117 @@
+"""
+分析任务的协作式取消和截止时间。
+
+CrewAI 的执行无法从外部强行中断，所以由调用方创建一个 ``CancellationToken``，
+在每个智能体步骤、任务结束和工具调用时检查它：一旦被取消或超过截止时间，
+就抛出 ``AnalysisCancelled``，让工作线程尽快结束、不再继续消耗 token。
+
+``use_token()`` 把令牌绑定到当前上下文，工具通过 ``check_cancelled()`` 检查，
+不需要知道自己属于哪一次分析。
+"""
+
+from __future__ import annotations
+
+import contextlib
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Iterator, Optional
+
+CANCELLED = "cancelled"
+TIMED_OUT = "timed_out"
+
+
+class AnalysisCancelled(BaseException):
+    """
+    分析被用户取消或超过截止时间。
+
+    继承 BaseException 而不是 Exception：CrewAI 会把智能体执行中的 Exception 当作失败重试
+    （``Agent.max_retry_limit``），工具调用中的 Exception 也会变成错误文本交还给智能体，
+    取消信号必须越过这些 ``except Exception`` 直接结束 kickoff。
+    """
+
+    def __init__(self, reason: str = CANCELLED, message: Optional[str] = None):
+        self.reason = reason
+        super().__init__(message or ("分析已超时" if reason == TIMED_OUT else "分析已取消"))
+
+
+class CancellationToken:
+    """
+    一次分析的取消令牌。
+
+    ``deadline`` 是 ``time.monotonic()`` 时间点；``poll`` 用于查询外部的取消请求
+    （例如其他 worker 写入任务状态存储的标记），按 ``poll_interval`` 节流调用。
+    """
+
+    def __init__(self, deadline: Optional[float] = None,
+                 poll: Optional[Callable[[], bool]] = None, poll_interval: float = 1.0):
+        self.deadline = deadline
+        self._poll = poll
+        self._poll_interval = poll_interval
+        self._last_poll = 0.0
+        self._reason: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def with_timeout(cls, seconds: Optional[float], **kwargs) -> "CancellationToken":
+        deadline = time.monotonic() + seconds if seconds else None
+        return cls(deadline=deadline, **kwargs)
+
+    def cancel(self, reason: str = CANCELLED) -> None:
+        with self._lock:
+            if self._reason is None:
+                self._reason = reason
+
+    @property
+    def reason(self) -> Optional[str]:
+        """已取消时返回原因（cancelled / timed_out），否则返回 None"""
+        if self._reason is None and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(TIMED_OUT)
+        if self._reason is None and self._poll is not None:
+            now = time.monotonic()
+            if now - self._last_poll >= self._poll_interval:
+                self._last_poll = now
+                try:
+                    if self._poll():
+                        self.cancel(CANCELLED)
+                except Exception:
+                    pass
+        return self._reason
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def raise_if_cancelled(self) -> None:
+        reason = self.reason
+        if reason is not None:
+            raise AnalysisCancelled(reason)
+
+
+_current_token: ContextVar[Optional[CancellationToken]] = ContextVar("qrent_cancellation_token", default=None)
+
+
+def current_token() -> Optional[CancellationToken]:
+    return _current_token.get()
+
+
+@contextlib.contextmanager
+def use_token(token: Optional[CancellationToken]) -> Iterator[Optional[CancellationToken]]:
+    """在 with 块内把令牌绑定到当前上下文"""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+def check_cancelled() -> None:
+    """当前上下文的分析已被取消时抛出 AnalysisCancelled；没有绑定令牌时什么也不做"""
+    token = _current_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
@@ -0,0 +1,298 @@
+"""
+问卷的本地规则预检。
+
+``data_compliance_agent`` 的很多检查只是算术或查表：预算区间是否颠倒、预算够不够所选房型、
+入住日期是否已过、租期是否常见等。``screen_requirements()`` 按 ``MARKET_RENT`` 等规则表检查
+``build_data_json`` 生成的规范化问卷，在微秒级给出结构化的检查结果：
+
+- 检查结果作为 ``{compliance_findings}`` 插入合规审查和报告任务的提示词，智能体不必再重复推算；
+- 规则需要的字段都有明确取值、并且所有检查都通过时（``Screening.covered``），
+  合规审查可以完全由规则给出，不再调用大模型（需要设置 ``QRENT_COMPLIANCE_RULES=skip``，
+  见 ``agent_runner``）；有任何问题时仍由智能体结合规则结果分析。
+
+租金区间是悉尼学生常住区域整套房源（合租为单间）的每周租金，澳元，和知识库中的价格参考保持一致。
+"""
+
+from __future__ import annotations
+
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+SEVERITY_ERROR = "error"
+SEVERITY_WARNING = "warning"
+SEVERITY_INFO = "info"
+
+SEVERITY_LABELS = {
+    SEVERITY_ERROR: "不合理",
+    SEVERITY_WARNING: "需注意",
+    SEVERITY_INFO: "提示",
+}
+
+# 房型 -> (常见最低周租, 常见中位周租, 常见最高周租)
+MARKET_RENT: Dict[str, Tuple[int, int, int]] = {
+    "单间（合租）": (250, 350, 450),
+    "Studio": (450, 550, 650),
+    "一居室": (550, 680, 800),
+    "两居室": (750, 900, 1100),
+    "三居室及以上": (1000, 1250, 1600),
+}
+
+# 旧版问卷和其他写法的房型名称（小写）
+ROOM_TYPE_ALIASES: Dict[str, str] = {
+    "studio": "Studio",
+    "单间": "单间（合租）",
+    "shared room": "单间（合租）",
+    "1 bedroom": "一居室",
+    "1b1b": "一居室",
+    "2 bedroom": "两居室",
+    "2b2b": "两居室",
+    "3 bedroom": "三居室及以上",
+    "3b2b": "三居室及以上",
+}
+
+# 不愿意合租时最便宜的独立房型
+CHEAPEST_PRIVATE_TYPE = "Studio"
+
+# 最高预算超过最低预算的这个倍数时，区间太宽，不同房型和区域差别很大
+WIDE_RANGE_RATIO = 1.5
+
+# 不包 Bills 时每周大约多出的水电网费用（澳元）
+BILLS_PER_WEEK = (25, 40)
+
+# 常见租期（月）
+COMMON_LEASE_MONTHS = (6, 12)
+
+# 入住日期距今天数：太近来不及看房和申请，太远房源还没有发布
+MIN_LEAD_DAYS = 14
+MAX_LEAD_DAYS = 90
+
+# 学校附近通勤很短的区域租金偏高，要求 15 分钟以内时按中位租金检查预算
+SHORT_COMMUTE = "15"
+
+NO_COMPROMISE = "对上述条件均不妥协"
+
+DATE_FORMATS = ("%Y-%m-%d", "%Y/%m/%d", "%Y.%m.%d", "%d/%m/%Y")
+
+
+@dataclass
+class Finding:
+    """一条检查结果"""
+    rule: str
+    severity: str
+    fields: List[str]
+    message: str
+
+
+@dataclass
+class Screening:
+    """
+    一次预检的结果。
+
+    ``uncovered`` 列出规则无法判断的原因（字段缺失、取值不在规则表中等）。
+    ``covered`` 要求没有无法判断的字段，并且除提示以外没有任何检查结果：
+    规则只能确认需求没有问题，发现问题时的分析和建议仍然交给智能体。
+    """
+    findings: List[Finding] = field(default_factory=list)
+    uncovered: List[str] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def covered(self) -> bool:
+        return not self.uncovered and all(f.severity == SEVERITY_INFO for f in self.findings)
+
+    def add(self, rule: str, severity: str, fields: List[str], message: str) -> None:
+        self.findings.append(Finding(rule, severity, fields, message))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "covered": self.covered,
+            "findings": [asdict(finding) for finding in self.findings],
+            "uncovered": list(self.uncovered),
+            "seconds": round(self.seconds, 6),
+        }
+
+    def render(self) -> str:
+        """插入提示词的紧凑文本，每行一条"""
+        lines = [f"[{SEVERITY_LABELS[f.severity]}] {f.message}" for f in self.findings] or ["未发现规则可判断的问题"]
+        if self.uncovered:
+            lines.append("规则未覆盖：" + "；".join(self.uncovered))
+        return "\n".join(lines)
+
+    def report(self) -> str:
+        """合规审查任务的输出格式（Markdown 不符合项列表），skip 模式下代替智能体的输出"""
+        problems = [f for f in self.findings if f.severity != SEVERITY_INFO]
+        notes = [f for f in self.findings if f.severity == SEVERITY_INFO]
+        lines = ["## 数据合规审查（规则预检）", ""]
+        if problems:
+            for index, finding in enumerate(problems, start=1):
+                lines.append(f"{index}. **{SEVERITY_LABELS[finding.severity]}**（{'、'.join(finding.fields)}）：{finding.message}")
+        else:
+            lines.append("未发现不合理或不符合市场规律的需求项。")
+        if notes:
+            lines += ["", "### 提示", ""]
+            lines += [f"- {finding.message}" for finding in notes]
+        return "\n".join(lines)
+
+
+def _parse_date(value: Any) -> Optional[date]:
+    if not isinstance(value, str) or not value.strip():
+        return None
+    text = value.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    match = re.match(r"(\d{4})\D(\d{1,2})\D(\d{1,2})", text)
+    if match:
+        try:
+            return date(*(int(part) for part in match.groups()))
+        except ValueError:
+            return None
+    return None
+
+
+def _room_type(value: Any) -> Optional[str]:
+    if not isinstance(value, str):
+        return None
+    text = value.strip()
+    return text if text in MARKET_RENT else ROOM_TYPE_ALIASES.get(text.lower())
+
+
+def _add_months(start: date, months: int) -> date:
+    month = start.month - 1 + months
+    year, month = start.year + month // 12, month % 12 + 1
+    # 月末日期落到目标月的最后一天
+    for day in (start.day, 30, 29, 28):
+        try:
+            return date(year, month, day)
+        except ValueError:
+            continue
+    return date(year, month, 28)
+
+
+def _check_budget(survey: Dict[str, Any], result: Screening) -> None:
+    budget = survey.get("budget") or {}
+    low, high = budget.get("weekly_min"), budget.get("weekly_max")
+    if low is None and high is None:
+        result.uncovered.append("没有填写预算")
+        return
+    if not all(isinstance(v, int) for v in (low, high) if v is not None):
+        result.uncovered.append("预算不是数字")
+        return
+    if low is not None and high is not None and low > high:
+        result.add("budget_range_inverted", SEVERITY_ERROR, ["budget.weekly_min", "budget.weekly_max"],
+                   f"最低预算 {low} 高于最高预算 {high}，预算区间填写颠倒")
+        low, high = high, low
+    elif low and high and high > low * WIDE_RANGE_RATIO:
+        result.add("budget_range_wide", SEVERITY_WARNING, ["budget.weekly_min", "budget.weekly_max"],
+                   f"预算区间 {low}-{high} 过宽，不同价位的房型和区域差别很大，需要明确可接受的上限")
+
+    total = budget.get("weekly_total")
+    if total is not None and not isinstance(total, int):
+        result.uncovered.append("每周总预算不是数字")
+        return
+    if total is not None and low is not None and high is not None and not low <= total <= high:
+        result.add("budget_total_outside_range", SEVERITY_ERROR,
+                   ["budget.weekly_total", "budget.weekly_min", "budget.weekly_max"],
+                   f"每周总预算 {total} 不在预算区间 {low}-{high} 内，预算填写前后矛盾")
+
+    if budget.get("bills_included") is None:
+        result.add("bills_unknown", SEVERITY_WARNING, ["budget.bills_included"],
+                   f"不确定预算是否包含 Bills；不包含时每周约多出 {BILLS_PER_WEEK[0]}-{BILLS_PER_WEEK[1]} 澳元水电网费用")
+    elif budget.get("bills_included") is False:
+        result.add("bills_excluded", SEVERITY_INFO, ["budget.bills_included"],
+                   f"预算不含 Bills，实际每周支出还要加上约 {BILLS_PER_WEEK[0]}-{BILLS_PER_WEEK[1]} 澳元水电网费用")
+
+    prop = survey.get("property") or {}
+    if not prop.get("type") or prop.get("type") == "不确定":
+        result.uncovered.append("房型未确定，无法对照租金区间")
+        return
+    room_type = _room_type(prop["type"])
+    if room_type is None:
+        result.uncovered.append(f"规则表中没有房型 {prop['type']}")
+        return
+
+    market_low, market_mid, market_high = MARKET_RENT[room_type]
+    top = high if high is not None else low
+    bottom = low if low is not None else high
+    lifestyle = survey.get("lifestyle") or {}
+    flexibility = lifestyle.get("flexibility") or []
+    if top < market_low:
+        cheaper = [name for name, (lo, _, _) in MARKET_RENT.items() if lo <= top]
+        hint = f"，这个预算更适合{'、'.join(cheaper)}" if cheaper else "，低于任何房型的常见租金"
+        result.add("budget_below_market", SEVERITY_ERROR, ["budget.weekly_max", "property.type"],
+                   f"{room_type}常见周租 {market_low}-{market_high} 澳元，最高预算 {top} 低于市场最低水平{hint}")
+        if NO_COMPROMISE in flexibility:
+            result.add("no_compromise_over_budget", SEVERITY_ERROR, ["lifestyle.flexibility"],
+                       "预算不足以租到所选房型，但对面积、装修、交通和 Bills 均不妥协，需要调整房型或预算")
+    elif top < market_mid:
+        result.add("budget_tight", SEVERITY_WARNING, ["budget.weekly_max", "property.type"],
+                   f"{room_type}中位周租约 {market_mid} 澳元，最高预算 {top} 只能选择偏远区域或条件较差的房源")
+        if lifestyle.get("commute") == SHORT_COMMUTE:
+            result.add("short_commute_tight_budget", SEVERITY_WARNING, ["lifestyle.commute", "budget.weekly_max"],
+                       "学校 15 分钟通勤范围内租金偏高，按当前预算建议放宽通勤时间")
+    elif bottom > market_high:
+        result.add("budget_above_market", SEVERITY_INFO, ["budget.weekly_min", "property.type"],
+                   f"最低预算 {bottom} 高于{room_type}常见周租上限 {market_high}，可以考虑更大的房型或更好的区域")
+
+    if prop.get("co_rent") == "no" and room_type == "单间（合租）":
+        result.add("shared_room_refused", SEVERITY_ERROR, ["property.co_rent", "property.type"],
+                   "选择了合租单间，但表示不愿意合租")
+    elif prop.get("co_rent") == "no" and top < MARKET_RENT[CHEAPEST_PRIVATE_TYPE][0]:
+        result.add("private_room_unaffordable", SEVERITY_ERROR, ["property.co_rent", "budget.weekly_max"],
+                   f"不愿意合租，但最高预算 {top} 低于 {CHEAPEST_PRIVATE_TYPE} 的常见最低周租 "
+                   f"{MARKET_RENT[CHEAPEST_PRIVATE_TYPE][0]}")
+
+
+def _check_dates(survey: Dict[str, Any], result: Screening, today: date) -> None:
+    lifestyle = survey.get("lifestyle") or {}
+    move_in = _parse_date(lifestyle.get("move_in"))
+    lease = lifestyle.get("lease_months")
+    if move_in is None:
+        result.uncovered.append("入住日期缺失或无法识别")
+    else:
+        lead = (move_in - today).days
+        if lead < 0:
+            result.add("move_in_past", SEVERITY_ERROR, ["lifestyle.move_in"],
+                       f"入住日期 {move_in.isoformat()} 已经过去")
+        elif lead < MIN_LEAD_DAYS:
+            result.add("move_in_too_soon", SEVERITY_WARNING, ["lifestyle.move_in"],
+                       f"距离入住只有 {lead} 天，看房和申请通常需要 2-4 周，时间很紧")
+        elif lead > MAX_LEAD_DAYS:
+            result.add("move_in_too_early", SEVERITY_INFO, ["lifestyle.move_in"],
+                       f"距离入住还有 {lead} 天，房源一般提前 2-6 周发布，现在找房选择不多")
+
+    if lease is None:
+        result.uncovered.append("租期不是 6 或 12 个月，或没有填写")
+        return
+    if lease not in COMMON_LEASE_MONTHS:
+        result.add("lease_uncommon", SEVERITY_WARNING, ["lifestyle.lease_months"],
+                   f"{lease} 个月不是常见租期，大部分房源只接受 6 或 12 个月")
+    elif lease == 6:
+        result.add("lease_short", SEVERITY_WARNING, ["lifestyle.lease_months"],
+                   "半年租期的房源更少、租金略高；对区域和房子满意时建议签一年")
+    if move_in is not None:
+        result.add("lease_end", SEVERITY_INFO, ["lifestyle.move_in", "lifestyle.lease_months"],
+                   f"租约预计到 {_add_months(move_in, lease).isoformat()} 结束")
+
+
+def screen_requirements(payload: Dict[str, Any], today: Optional[date] = None) -> Screening:
+    """
+    检查 ``build_data_json`` 生成的数据（或其中的 ``survey`` 部分）。
+
+    没有 ``survey`` 部分时（例如旧版接口保存的数据）不做检查，结果不覆盖任何情况。
+    """
+    started = time.perf_counter()
+    result = Screening()
+    survey = payload.get("survey") if isinstance(payload, dict) and "survey" in payload else payload
+    if not isinstance(survey, dict) or not any(isinstance(survey.get(k), dict) for k in ("budget", "property", "lifestyle")):
+        result.uncovered.append("没有规范化的问卷数据")
+    else:
+        _check_budget(survey, result)
+        _check_dates(survey, result, today or date.today())
+    result.seconds = time.perf_counter() - started
+    return result
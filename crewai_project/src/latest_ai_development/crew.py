@@ -1,7 +1,110 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
 from crewai import Agent, Crew, Task, Process
-from latest_ai_development.tools.custom_tool import QrentRAGTool
+from latest_ai_development.llm_backend import agent_llm
+from latest_ai_development.tools.custom_tool import QrentRAGBatchTool, QrentRAGTool
+from latest_ai_development.usage import use_task
 
 rag_tool = QrentRAGTool()
+rag_batch_tool = QrentRAGBatchTool()
+
+# 需要同时查询多个问题时，一次批量检索比逐个调用少几轮工具调用
+BATCH_TOOL_HINT = (
+    "\n需要同时查询多个问题时，可以一次调用：\n"
+    'qrent_rag_batch_search_tool(queries=["问题1", "问题2"])\n'
+    "queries 是问题列表，一次最多 8 个。"
+)
+
+# 执行模式：sequential 按顺序逐个执行；dag 按任务依赖并行执行互不依赖的任务
+PROCESS_SEQUENTIAL = "sequential"
+PROCESS_DAG = "dag"
+
+# 每个任务需要哪些任务的输出作为上下文（DAG 模式下设置为 Task.context）。
+# 合规审查和需求建议都只依赖问卷和知识库，可以同时执行；报告在两者完成后汇总。
+TASK_CONTEXT: Dict[str, List[str]] = {
+    "data_compliance_task": [],
+    "inquiry_task": [],
+    "reporting_task": ["data_compliance_task", "inquiry_task"],
+}
+
+# 本地规则预检的结果（见 compliance_rules.py），由调用方作为 compliance_findings 输入传入
+COMPLIANCE_FINDINGS_HINT = (
+    "\n以下是本地规则对需求的预检结果，这些结论已经确定，不需要再查询或推算，"
+    "请重点分析规则没有覆盖的部分：\n{compliance_findings}"
+)
+
+# 每个任务由哪个智能体执行（用量统计按智能体汇总时使用）
+TASK_AGENTS: Dict[str, str] = {
+    "data_compliance_task": "data_compliance_agent",
+    "inquiry_task": "inquiry_agent",
+    "reporting_task": "reporting_agent",
+}
+
+
+def dag_schedule(dependencies: Dict[str, List[str]]) -> List[Tuple[str, bool]]:
+    """
+    把任务依赖排成 CrewAI 可以执行的顺序，返回 [(任务名, 是否异步执行)]。
+
+    任务按拓扑层次分组，同一层的任务互不依赖。CrewAI 会并行执行连续的异步任务，
+    直到遇到下一个同步任务才等待它们完成，所以只有当下一层只有一个任务、
+    可以作为汇合点时，本层才标记为异步；其他情况退化为顺序执行。
+    """
+    remaining = dict(dependencies)
+    done: set = set()
+    waves: List[List[str]] = []
+    while remaining:
+        wave = [name for name, deps in remaining.items() if set(deps) <= done]
+        if not wave:
+            raise ValueError(f"任务依赖存在环或引用了不存在的任务: {sorted(remaining)}")
+        waves.append(wave)
+        done.update(wave)
+        for name in wave:
+            del remaining[name]
+
+    schedule: List[Tuple[str, bool]] = []
+    for index, wave in enumerate(waves):
+        concurrent = len(wave) > 1 and index + 1 < len(waves) and len(waves[index + 1]) == 1
+        schedule.extend((name, concurrent) for name in wave)
+    return schedule
+
+
+class ContextTask(Task):
+    """
+    在调用方上下文中异步执行的任务。
+
+    CrewAI 用普通线程执行异步任务，线程里看不到调用方用 ContextVar 绑定的取消令牌和用量统计器
+    （见 cancellation.py、usage.py）。这里复制启动任务时的上下文，在新线程中执行任务。
+    CrewAI 的异步执行也不处理任务抛出的异常，Future 永远不会完成，等待它的 kickoff 会一直阻塞；
+    这里把异常（包括取消）设置到 Future 上，由 kickoff 在调用方线程中重新抛出。
+    任务执行期间绑定任务名，用量统计据此归属不带任务信息的 LLM 调用。
+    """
+
+    def _execute_core(self, agent, context, tools):
+        with use_task(self.name):
+            return super()._execute_core(agent, context, tools)
+
+    def execute_async(self, agent=None, context=None, tools=None) -> Future:
+        future: Future = Future()
+        threading.Thread(
+            daemon=True,
+            target=contextvars.copy_context().run,
+            args=(self._execute_task_async, agent, context, tools, future),
+        ).start()
+        return future
+
+    def _execute_task_async(self, agent, context, tools, future: Future) -> None:
+        try:
+            result = self._execute_core(agent, context, tools)
+        except BaseException as exc:  # noqa: BLE001 - 取消信号是 BaseException，也必须交给 Future
+            future.set_exception(exc)
+        else:
+            future.set_result(result)
+
+
 class LatestAiDevelopment:
     def data_compliance_agent(self) -> Agent:
         return Agent(
@@ -14,6 +117,7 @@ class LatestAiDevelopment:
                 "使用格式必须为：\n"
                 'qrent_rag_search_tool(query="你的问题")\n'
                 "工具只接受一个参数 query，请勿使用 description、metadata、input、text 或其他字段。"
+                + BATCH_TOOL_HINT
             ),
             backstory=(
                 "你是一位经验丰富的数据质量审计专家，精通澳洲租房市场的各项规则和限制。"
@@ -29,7 +133,9 @@ class LatestAiDevelopment:
                 "分析: 这个预算不建议找studio，如果要求独立卫生间，可以考虑2b2b或3b2b的主卧。"
             ],
             verbose=True,
-            tools=[rag_tool]
+            tools=[rag_tool, rag_batch_tool],
+            # 大模型后端和补全缓存见 llm_backend.py、llm_cache.py
+            llm=agent_llm()
         )
 
 
@@ -44,6 +150,7 @@ class LatestAiDevelopment:
                 "工具调用方式如下（必须严格遵守参数名 query）：\n"
                 'qrent_rag_search_tool(query="你想查询的问题")\n'
                 "工具只接受一个参数 query，不要使用 description、metadata、input、text、content 或任何其他字段。"
+                + BATCH_TOOL_HINT
             ),
             backstory=(
                 "你是一位专业的澳洲租房顾问，精通悉尼及周边区域的租房市场情况，包括不同区域的租金水平、"
@@ -62,7 +169,9 @@ class LatestAiDevelopment:
                 "建议: UNSW 学生常住于 Randwick、Kingsford、Kensington，通勤方便、房源类型丰富，适合首次租房者。"
             ],
             verbose=True,
-            tools=[rag_tool]
+            tools=[rag_tool, rag_batch_tool],
+            # 大模型后端和补全缓存见 llm_backend.py、llm_cache.py
+            llm=agent_llm()
         )
 
 
@@ -78,6 +187,7 @@ class LatestAiDevelopment:
                 "工具调用格式如下（必须严格遵守参数名 query）：\n"
                 'qrent_rag_search_tool(query="你要查询的内容")\n'
                 "工具只接受 query 一个参数，不要使用 description、metadata、input、text 或其他字段。"
+                + BATCH_TOOL_HINT
             ),
             backstory=(
                 "你是一位资深的澳洲房产分析师，熟悉悉尼租房市场、不同区域的租金水平、房型性价比、"
@@ -97,34 +207,127 @@ class LatestAiDevelopment:
                 "注意事项: 分租需注意是否乱收家具押金、双押金、或不签合同的风险。",
             ],
             verbose=True,
-            tools=[rag_tool]
+            tools=[rag_tool, rag_batch_tool],
+            # 大模型后端和补全缓存见 llm_backend.py、llm_cache.py
+            llm=agent_llm()
         )
 
 
-    def data_compliance_task(self) -> Task:
-        return Task(
-            description="分析{renting_requirements}文件中的用户租房需求，结合澳洲租房市场实际情况和知识库中的信息，识别不合理或不符合市场规律的需求项。",
+    def data_compliance_task(self, agent: Optional[Agent] = None) -> Task:
+        return ContextTask(
+            name="data_compliance_task",
+            description=(
+                "分析{renting_requirements}文件中的用户租房需求，结合澳洲租房市场实际情况和知识库中的信息，识别不合理或不符合市场规律的需求项。"
+                + COMPLIANCE_FINDINGS_HINT
+            ),
             expected_output="一份详细的不符合项列表，每个项目包含：不符合的具体内容、基于澳洲租房市场实际情况的专业分析。",
-            agent=self.data_compliance_agent()
+            agent=agent or self.data_compliance_agent()
         )
 
-    def inquiry_task(self) -> Task:
-        return Task(
+    def inquiry_task(self, agent: Optional[Agent] = None) -> Task:
+        return ContextTask(
+            name="inquiry_task",
             description="根据澳洲租房市场实际情况和知识库中的信息，引导用户修改{renting_requirements}中的需求，使其更加合理可行。",
             expected_output="一个符合{renting_requirements}格式的JSON文件，其中包含经过优化的用户需求，更符合澳洲租房市场的实际情况。",
-            agent=self.inquiry_agent()
+            agent=agent or self.inquiry_agent()
         )
 
-    def reporting_task(self) -> Task:
-        return Task(
-            description="基于{renting_requirements}文件和知识库中的信息，生成一份全面的租房分析报告。",
+    def reporting_task(self, agent: Optional[Agent] = None) -> Task:
+        return ContextTask(
+            name="reporting_task",
+            description=(
+                "基于{renting_requirements}文件和知识库中的信息，生成一份全面的租房分析报告。"
+                "\n需求规则预检结果：\n{compliance_findings}"
+            ),
             expected_output="一份结构化的中文markdown报告，包含以下部分：\n1. 需求分析 - 用户预算和偏好评估\n2. 市场概况 - 澳洲租房市场实际情况\n3. 区域推荐 - 基于用户需求的区域建议\n4. 房型建议 - 性价比分析和房型推荐\n5. 合同指南 - 租期、押金等注意事项\n6. 风险提示 - 租房过程中需要注意的问题\n报告应格式清晰，内容专业，并且完全使用中文。",
-            agent=self.reporting_agent()
+            agent=agent or self.reporting_agent()
         )
-    def crew(self) -> Crew:
+    def crew(self, mode: str = PROCESS_SEQUENTIAL, skip_tasks: Tuple[str, ...] = ()) -> Crew:
+        """skip_tasks 中的任务（及只由它们使用的智能体）不加入团队，由调用方给出这些任务的输出"""
+        names = [name for name in TASK_AGENTS if name not in skip_tasks]
+        # 每个智能体只创建一次，任务直接引用同一个智能体
+        agents: Dict[str, Agent] = {}
+        for name in names:
+            if TASK_AGENTS[name] not in agents:
+                agents[TASK_AGENTS[name]] = getattr(self, TASK_AGENTS[name])()
+        tasks = [getattr(self, name)(agents[TASK_AGENTS[name]]) for name in names]
+        if mode == PROCESS_DAG:
+            tasks = self._dag_tasks(tasks)
+        elif mode != PROCESS_SEQUENTIAL:
+            raise ValueError(f"未知的执行模式: {mode}")
         return Crew(
-            agents=[self.data_compliance_agent(), self.inquiry_agent(), self.reporting_agent()],
-            tasks=[self.data_compliance_task(), self.inquiry_task(), self.reporting_task()],
+            agents=list(agents.values()),
+            tasks=tasks,
             process=Process.sequential,
             verbose=True
-        )
\ No newline at end of file
+        )
+
+    def _dag_tasks(self, tasks: List[Task]) -> List[Task]:
+        """按 TASK_CONTEXT 设置任务上下文和异步标记，并按可执行的顺序排列；被跳过的任务不作为依赖"""
+        by_name = {task.name: task for task in tasks}
+        dependencies = {name: [dep for dep in deps if dep in by_name]
+                        for name, deps in TASK_CONTEXT.items() if name in by_name}
+        ordered = []
+        for name, concurrent in dag_schedule(dependencies):
+            task = by_name[name]
+            task.context = [by_name[dep] for dep in dependencies[name]]
+            task.async_execution = concurrent
+            ordered.append(task)
+        return ordered
+
+
+class CrewBlueprint:
+    """
+    构建一次、之后只读的团队模板。
+
+    创建 Agent 时要初始化 LLM 客户端和工具，开销较大；模板在进程内只构建一次，
+    每次分析通过 instantiate() 复制出一个独立的 Crew（智能体、任务和执行状态都是新的，
+    LLM 客户端和工具实例共享），模板本身不会被执行或修改。
+    """
+
+    def __init__(self, factory=LatestAiDevelopment, mode: str = PROCESS_SEQUENTIAL,
+                 skip_tasks: Tuple[str, ...] = ()):
+        started = time.perf_counter()
+        self.mode = mode
+        self.skip_tasks = tuple(skip_tasks)
+        self._template = factory().crew(mode, self.skip_tasks)
+        self.build_seconds = time.perf_counter() - started
+
+    def instantiate(self, **overrides) -> Crew:
+        """复制出一个独立的 Crew；overrides（如 task_callback、step_callback）只设置在副本上"""
+        crew = self._template.copy()
+        for field, value in overrides.items():
+            setattr(crew, field, value)
+        return crew
+
+
+_blueprints: Dict[str, CrewBlueprint] = {}
+_blueprint_lock = threading.Lock()
+
+
+def blueprint_key(mode: str, skip_tasks: Tuple[str, ...] = ()) -> str:
+    """模板的缓存键：执行模式，跳过任务的变体加上被跳过的任务名"""
+    return mode + "".join(f"-{task}" for task in sorted(skip_tasks))
+
+
+def get_crew_blueprint(mode: str = PROCESS_SEQUENTIAL, skip_tasks: Tuple[str, ...] = ()) -> CrewBlueprint:
+    """返回进程级的团队模板（每种执行模式和跳过的任务组合一个），首次调用时构建"""
+    key = blueprint_key(mode, skip_tasks)
+    blueprint = _blueprints.get(key)
+    if blueprint is None:
+        with _blueprint_lock:
+            blueprint = _blueprints.get(key)
+            if blueprint is None:
+                blueprint = _blueprints[key] = CrewBlueprint(mode=mode, skip_tasks=tuple(sorted(skip_tasks)))
+    return blueprint
+
+
+def reset_crew_blueprint() -> None:
+    """丢弃缓存的模板（修改了智能体配置或环境变量后调用）"""
+    with _blueprint_lock:
+        _blueprints.clear()
+
+
+def built_blueprint_modes() -> List[str]:
+    """已经构建好的模板（见 blueprint_key）"""
+    return list(_blueprints)
@@ -0,0 +1,387 @@
+"""
+离线压测用的假大模型。
+
+压测 ``SurveyView`` → ``run_crewai_analysis`` → 三个智能体的完整链路时，不应该消耗真实的 token，
+也不应该受模型服务商的限流和延迟波动影响。这里提供两种替身：
+
+- 进程内的 ``FakeLLM``（``QRENT_LLM_BACKEND=fake``）：直接替换智能体的 LLM；
+- 本地的 OpenAI 兼容服务（``python -m latest_ai_development.fake_llm``，``QRENT_LLM_BACKEND=fake-server``）：
+  智能体仍然走 CrewAI/LiteLLM 的真实 HTTP 调用路径，支持流式输出（SSE）。
+
+两者共用 ``FakeResponder``：按配置先返回若干次固定的工具调用（ReAct 文本格式，
+或请求带 ``tools`` 时返回原生的 ``tool_calls``），之后返回固定长度的最终答案。
+延迟由首 token 延迟分布和每秒 token 数决定。
+
+环境变量：
+- ``QRENT_FAKE_LLM_LATENCY``：首 token 延迟分布，如 ``fixed:0.5``、``uniform:0.2:0.6``（默认）、
+  ``normal:0.8:0.2``、``lognormal:0.8:0.5``（中位数、sigma），单位秒
+- ``QRENT_FAKE_LLM_TOKENS_PER_SECOND``：输出速度，默认 0（不模拟逐 token 输出的耗时）
+- ``QRENT_FAKE_LLM_TOOL_CALLS``：每个任务先调用几次工具，默认 1
+- ``QRENT_FAKE_LLM_ANSWER_TOKENS``：最终答案的长度（估算 token），默认 300
+- ``QRENT_FAKE_LLM_SEED``：随机种子，设置后延迟序列可复现
+- ``QRENT_FAKE_LLM_URL``：``fake-server`` 后端连接的地址，默认 ``http://127.0.0.1:8765/v1``
+- ``QRENT_FAKE_LLM_STREAM``：``fake-server`` 后端是否使用流式输出，默认 0
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from latest_ai_development.cancellation import check_cancelled
+from latest_ai_development.tools.retrieval import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+FAKE_MODEL_NAME = "qrent-fake"
+DEFAULT_FAKE_LLM_URL = "http://127.0.0.1:8765/v1"
+
+# 工具调用时依次使用的查询
+CANNED_QUERIES = (
+    "悉尼不同区域租金行情",
+    "押金（bond）的法律规定",
+    "看房和申请需要准备的材料",
+)
+DEFAULT_TOOL = "qrent_rag_search_tool"
+BATCH_TOOL = "qrent_rag_batch_search_tool"
+
+ANSWER_PARAGRAPH = (
+    "根据用户的预算、通勤时间和房型偏好，建议优先考虑交通便利、学生常住的区域，"
+    "签约前确认租金是否包含 bills，押金按规定交由 NSW Fair Trading 保管。"
+)
+
+# 模拟等待时，每隔这么久检查一次取消令牌
+_SLEEP_SLICE = 0.1
+
+
+@dataclass(frozen=True)
+class LatencyModel:
+    """首 token 延迟分布"""
+    kind: str = "uniform"
+    a: float = 0.2
+    b: float = 0.6
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        """``0.5`` / ``fixed:0.5`` / ``uniform:low:high`` / ``normal:mean:std`` / ``lognormal:median:sigma``"""
+        parts = [part.strip() for part in spec.strip().split(":")]
+        if len(parts) == 1:
+            return cls("fixed", float(parts[0]), 0.0)
+        kind, values = parts[0].lower(), [float(value) for value in parts[1:]]
+        if kind == "fixed" and len(values) == 1:
+            return cls(kind, values[0], 0.0)
+        if kind in ("uniform", "normal", "lognormal") and len(values) == 2:
+            return cls(kind, values[0], values[1])
+        raise ValueError(f"无法解析延迟分布: {spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            value = self.a
+        elif self.kind == "uniform":
+            value = rng.uniform(self.a, self.b)
+        elif self.kind == "normal":
+            value = rng.gauss(self.a, self.b)
+        else:
+            value = self.a * rng.lognormvariate(0.0, self.b)
+        return max(0.0, value)
+
+
+@dataclass
+class FakeCompletion:
+    text: str
+    tool_calls: List[Dict[str, Any]] = field(default_factory=list)
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+def _content(message: Any) -> str:
+    if isinstance(message, dict):
+        content = message.get("content") or ""
+        return content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+    return str(message)
+
+
+class FakeResponder:
+    """根据对话内容生成固定的工具调用或最终答案，并模拟延迟"""
+
+    def __init__(self, latency: Optional[LatencyModel] = None, tokens_per_second: float = 0.0,
+                 tool_calls: int = 1, answer_tokens: int = 300, seed: Optional[int] = None):
+        self.latency = latency or LatencyModel()
+        self.tokens_per_second = max(0.0, tokens_per_second)
+        self.tool_calls = max(0, tool_calls)
+        self.answer_tokens = max(1, answer_tokens)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "FakeResponder":
+        seed = os.environ.get("QRENT_FAKE_LLM_SEED")
+        return cls(
+            latency=LatencyModel.parse(os.environ.get("QRENT_FAKE_LLM_LATENCY", "uniform:0.2:0.6")),
+            tokens_per_second=float(os.environ.get("QRENT_FAKE_LLM_TOKENS_PER_SECOND", "0")),
+            tool_calls=int(os.environ.get("QRENT_FAKE_LLM_TOOL_CALLS", "1")),
+            answer_tokens=int(os.environ.get("QRENT_FAKE_LLM_ANSWER_TOKENS", "300")),
+            seed=int(seed) if seed else None,
+        )
+
+    def first_token_delay(self) -> float:
+        with self._lock:
+            return self.latency.sample(self._rng)
+
+    def token_delay(self, text: str) -> float:
+        return estimate_tokens(text) / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _answer(self) -> str:
+        paragraphs = []
+        while estimate_tokens("\n\n".join(paragraphs)) < self.answer_tokens:
+            paragraphs.append(ANSWER_PARAGRAPH)
+        return "## 分析结果\n\n" + "\n\n".join(paragraphs)
+
+    def complete(self, messages: Union[str, List[Any]], tools: Optional[List[Dict[str, Any]]] = None) -> FakeCompletion:
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        prompt = "\n".join(_content(message) for message in messages)
+        completion = FakeCompletion(text="", prompt_tokens=estimate_tokens(prompt))
+
+        if tools:
+            # 原生函数调用：已经返回过的工具结果数就是已完成的调用次数
+            done = sum(1 for message in messages if isinstance(message, dict) and message.get("role") == "tool")
+            names = [tool.get("function", {}).get("name") for tool in tools]
+            if done < self.tool_calls and names:
+                name = DEFAULT_TOOL if DEFAULT_TOOL in names else names[0]
+                completion.tool_calls.append({
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                    "type": "function",
+                    "function": {"name": name, "arguments": json.dumps(
+                        {"query": CANNED_QUERIES[done % len(CANNED_QUERIES)]}, ensure_ascii=False)},
+                })
+                completion.completion_tokens = estimate_tokens(json.dumps(completion.tool_calls))
+                return completion
+        else:
+            # ReAct 文本格式：CrewAI 把工具结果以 "Observation:" 追加到对话中（系统提示里的格式说明不算）
+            done = sum(_content(message).count("Observation:") for message in messages
+                       if not (isinstance(message, dict) and message.get("role") == "system"))
+            if done < self.tool_calls and "Action Input" in prompt:
+                tool = BATCH_TOOL if BATCH_TOOL in prompt and DEFAULT_TOOL not in prompt else DEFAULT_TOOL
+                query = CANNED_QUERIES[done % len(CANNED_QUERIES)]
+                arguments = {"queries": [query]} if tool == BATCH_TOOL else {"query": query}
+                completion.text = (
+                    "Thought: 需要先查询知识库中的相关信息\n"
+                    f"Action: {tool}\n"
+                    f"Action Input: {json.dumps(arguments, ensure_ascii=False)}"
+                )
+                completion.completion_tokens = estimate_tokens(completion.text)
+                return completion
+
+        completion.text = f"Thought: 我已经有足够的信息给出最终答案\nFinal Answer: {self._answer()}"
+        completion.completion_tokens = estimate_tokens(completion.text)
+        return completion
+
+    def stream(self, text: str, chunk_tokens: int = 8) -> Iterator[str]:
+        """把文本切成小块逐个返回，按每秒 token 数等待"""
+        step = max(1, chunk_tokens)
+        for start in range(0, len(text), step):
+            piece = text[start:start + step]
+            wait(self.token_delay(piece))
+            yield piece
+
+
+def wait(seconds: float) -> None:
+    """分段等待，期间分析被取消时立即抛出 AnalysisCancelled"""
+    deadline = time.monotonic() + seconds
+    while True:
+        check_cancelled()
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, _SLEEP_SLICE))
+
+
+@lru_cache(maxsize=None)
+def _fake_llm_class():
+    from crewai.llms.base_llm import BaseLLM
+
+    class FakeLLM(BaseLLM):
+        """进程内的假大模型，不发起任何网络请求"""
+
+        def __init__(self, responder: FakeResponder):
+            self.responder = responder
+            super().__init__(model=FAKE_MODEL_NAME, temperature=0.0)
+
+        def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs):
+            completion = self.responder.complete(messages, tools)
+            wait(self.responder.first_token_delay())
+            if completion.tool_calls and available_functions:
+                call = completion.tool_calls[0]["function"]
+                function = available_functions.get(call["name"])
+                if function is not None:
+                    return function(**json.loads(call["arguments"]))
+            wait(self.responder.token_delay(completion.text))
+            return completion.text
+
+        def supports_function_calling(self) -> bool:
+            return False
+
+        def supports_stop_words(self) -> bool:
+            return True
+
+        def get_context_window_size(self) -> int:
+            return 32768
+
+    return FakeLLM
+
+
+def fake_llm(responder: Optional[FakeResponder] = None):
+    return _fake_llm_class()(responder or FakeResponder.from_env())
+
+
+def fake_server_llm():
+    """连接本地假模型服务的 CrewAI LLM（走 LiteLLM 的 OpenAI 兼容调用路径）"""
+    from crewai import LLM
+
+    return LLM(
+        model=f"openai/{FAKE_MODEL_NAME}",
+        base_url=os.environ.get("QRENT_FAKE_LLM_URL", DEFAULT_FAKE_LLM_URL),
+        api_key="fake",
+        stream=os.environ.get("QRENT_FAKE_LLM_STREAM", "0").lower() in ("1", "true", "yes"),
+    )
+
+
+class _FakeLLMHandler(BaseHTTPRequestHandler):
+    """OpenAI 兼容的 /v1/chat/completions 和 /v1/models"""
+
+    server: "FakeLLMServer"
+
+    def log_message(self, format, *args):  # noqa: A002
+        logger.debug(format % args)
+
+    def _send_json(self, payload: Dict[str, Any], status: int = 200) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json({"object": "list", "data": [{"id": FAKE_MODEL_NAME, "object": "model"}]})
+        else:
+            self._send_json({"error": {"message": "not found"}}, status=404)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json({"error": {"message": "not found"}}, status=404)
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        except ValueError:
+            self._send_json({"error": {"message": "invalid json"}}, status=400)
+            return
+        responder = self.server.responder
+        completion = responder.complete(request.get("messages") or [], request.get("tools"))
+        self.server.count(completion)
+        time.sleep(responder.first_token_delay())
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = request.get("model") or FAKE_MODEL_NAME
+        usage = {
+            "prompt_tokens": completion.prompt_tokens,
+            "completion_tokens": completion.completion_tokens,
+            "total_tokens": completion.prompt_tokens + completion.completion_tokens,
+        }
+        finish_reason = "tool_calls" if completion.tool_calls else "stop"
+        if not request.get("stream"):
+            time.sleep(responder.token_delay(completion.text))
+            message: Dict[str, Any] = {"role": "assistant", "content": completion.text or None}
+            if completion.tool_calls:
+                message["tool_calls"] = completion.tool_calls
+            self._send_json({
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        def send(delta: Dict[str, Any], finish: Optional[str] = None, **extra) -> None:
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish}], **extra}
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        send({"role": "assistant", "content": ""})
+        if completion.tool_calls:
+            send({"tool_calls": [dict(call, index=position) for position, call in enumerate(completion.tool_calls)]})
+        for piece in responder.stream(completion.text):
+            send({"content": piece})
+        send({}, finish_reason, usage=usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    """每个请求一个线程，可以同时服务上百个并发分析"""
+
+    daemon_threads = True
+    request_queue_size = 512
+
+    def __init__(self, address=("127.0.0.1", 8765), responder: Optional[FakeResponder] = None):
+        self.responder = responder or FakeResponder.from_env()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"requests": 0, "tool_calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        super().__init__(address, _FakeLLMHandler)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count(self, completion: FakeCompletion) -> None:
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["tool_calls"] += len(completion.tool_calls)
+            self.stats["prompt_tokens"] += completion.prompt_tokens
+            self.stats["completion_tokens"] += completion.completion_tokens
+
+    def start(self) -> threading.Thread:
+        """在后台线程中运行（压测命令在同一进程内启动服务时使用）"""
+        thread = threading.Thread(target=self.serve_forever, name="fake-llm-server", daemon=True)
+        thread.start()
+        return thread
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="启动 OpenAI 兼容的假大模型服务，用于离线压测")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    server = FakeLLMServer((args.host, args.port))
+    logger.info(f"假大模型服务已启动: {server.url}（QRENT_LLM_BACKEND=fake-server QRENT_FAKE_LLM_URL={server.url}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info(f"已停止，统计: {server.stats}")
+
+
+if __name__ == "__main__":
+    main()
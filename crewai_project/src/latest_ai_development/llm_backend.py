@@ -0,0 +1,52 @@
+"""
+智能体使用哪个大模型。
+
+``QRENT_LLM_BACKEND``：
+- ``default``（默认）：CrewAI 默认的 LLM，由 MODEL / OPENAI_API_KEY 等环境变量决定；
+- ``fake``：进程内的假大模型，不访问网络（见 ``fake_llm.py``）；
+- ``fake-server``：连接本地的 OpenAI 兼容假模型服务（``QRENT_FAKE_LLM_URL``）。
+
+``QRENT_LLM_CACHE`` 开启时，无论哪个后端都再包一层补全缓存（见 ``llm_cache.py``），
+最外层统计每次调用的 token 数和耗时（见 ``usage.py``）。
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Optional
+
+from latest_ai_development.llm_cache import CompletionCache, cached_llm, completion_cache
+from latest_ai_development.usage import metered_llm
+
+LLM_BACKEND_DEFAULT = "default"
+LLM_BACKEND_FAKE = "fake"
+LLM_BACKEND_FAKE_SERVER = "fake-server"
+
+
+def llm_backend() -> str:
+    return os.environ.get("QRENT_LLM_BACKEND", LLM_BACKEND_DEFAULT).strip().lower() or LLM_BACKEND_DEFAULT
+
+
+def agent_llm(cache: Optional[CompletionCache] = None):
+    """创建智能体的 LLM：选定的后端，按需包一层补全缓存，最外层统计 token 和耗时"""
+    cache = cache or completion_cache
+    backend = llm_backend()
+    if backend == LLM_BACKEND_FAKE:
+        from latest_ai_development.fake_llm import fake_llm
+
+        inner = fake_llm()
+    elif backend == LLM_BACKEND_FAKE_SERVER:
+        from latest_ai_development.fake_llm import fake_server_llm
+
+        inner = fake_server_llm()
+    elif backend == LLM_BACKEND_DEFAULT:
+        from crewai.utilities.llm_utils import create_llm
+
+        # 与 Agent(llm=None) 相同，由 MODEL / OPENAI_API_KEY 等环境变量决定
+        inner = create_llm(None)
+    else:
+        raise ValueError(f"未知的 LLM 后端: {backend}")
+    if cache.enabled:
+        inner = cached_llm(inner, cache)
+    # 没有绑定用量统计器时（例如 main.py 直接运行）只是多一层函数调用
+    return metered_llm(inner)
@@ -0,0 +1,202 @@
+"""
+大模型调用的缓存、录制和回放。
+
+每次 ``crew.kickoff`` 都要调用多次大模型；同样的输入再跑一遍（``main.py replay`` / ``test``、
+回归测试、性能测试）也要付出同样的费用和等待时间。``CachedLLM`` 包装智能体使用的 LLM，
+按"模型 + 消息 + 参数"缓存补全结果，结果保存在磁盘上（每条一个 JSON 文件，可以直接查看或拷贝）。
+
+模式（``QRENT_LLM_CACHE``）：
+- ``off``（默认）：不包装，智能体直接使用 LLM（见 ``llm_backend.py``）；
+- ``cache``：命中时直接返回，未命中时调用大模型并保存；
+- ``record``：总是调用大模型，保存（覆盖）每一次结果，用于录制一次完整的运行；
+- ``replay``：只使用已录制的结果，不访问网络；没有录制的调用抛出 ``ReplayMissError``。
+
+每次调用大模型前都会检查当前分析的取消令牌，已取消或超时的分析不再发起新的请求。
+
+环境变量：
+- ``QRENT_LLM_CACHE``：见上
+- ``QRENT_LLM_CACHE_DIR``：缓存目录，默认 ``crewai_project/.cache/llm``
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from latest_ai_development.cancellation import check_cancelled
+
+logger = logging.getLogger(__name__)
+
+# crewai_project/.cache/llm
+DEFAULT_LLM_CACHE_DIR = Path(__file__).resolve().parents[2] / ".cache" / "llm"
+
+LLM_CACHE_OFF = "off"
+LLM_CACHE_READ_WRITE = "cache"
+LLM_CACHE_RECORD = "record"
+LLM_CACHE_REPLAY = "replay"
+LLM_CACHE_MODES = (LLM_CACHE_OFF, LLM_CACHE_READ_WRITE, LLM_CACHE_RECORD, LLM_CACHE_REPLAY)
+
+
+class ReplayMissError(RuntimeError):
+    """回放模式下遇到没有录制过的调用"""
+
+
+def completion_key(model: str, messages: Union[str, List[Dict[str, Any]]], params: Dict[str, Any]) -> str:
+    """模型、消息和参数的规范化 JSON 的哈希；停止词顺序不影响结果"""
+    params = dict(params)
+    if params.get("stop"):
+        params["stop"] = sorted(params["stop"])
+    payload = json.dumps({"model": model, "messages": messages, "params": params},
+                         ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """磁盘上的补全缓存，写入时先写临时文件再改名"""
+
+    def __init__(self, directory: Path, mode: str = LLM_CACHE_READ_WRITE):
+        if mode not in LLM_CACHE_MODES:
+            raise ValueError(f"未知的 LLM 缓存模式: {mode}")
+        self.directory = Path(directory)
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "recorded": 0}
+
+    @classmethod
+    def from_env(cls) -> "CompletionCache":
+        mode = os.environ.get("QRENT_LLM_CACHE", LLM_CACHE_OFF).strip().lower()
+        if mode not in LLM_CACHE_MODES:
+            logger.warning(f"未知的 LLM 缓存模式 {mode}，不使用缓存")
+            mode = LLM_CACHE_OFF
+        directory = os.environ.get("QRENT_LLM_CACHE_DIR", str(DEFAULT_LLM_CACHE_DIR))
+        return cls(Path(directory), mode=mode)
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != LLM_CACHE_OFF
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            response = json.loads(self._path(key).read_text(encoding="utf-8"))["response"]
+        except (FileNotFoundError, ValueError, KeyError):
+            self._count("misses")
+            return None
+        self._count("hits")
+        return response
+
+    def set(self, key: str, response: str, model: str, messages: Any) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        record = {"model": model, "recorded_at": time.time(), "messages": messages, "response": response}
+        tmp.write_text(json.dumps(record, ensure_ascii=False, default=str), encoding="utf-8")
+        os.replace(tmp, path)
+        self._count("recorded")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        counters.update(mode=self.mode, directory=str(self.directory))
+        return counters
+
+
+completion_cache = CompletionCache.from_env()
+
+
+# 当前线程最近一次 CachedLLM 调用是否命中缓存（供用量统计区分不消耗 token 的调用）
+_last_call = threading.local()
+
+
+def last_call_cached() -> bool:
+    return getattr(_last_call, "cached", False)
+
+
+@lru_cache(maxsize=None)
+def wrapped_llm_class():
+    """包装另一个 CrewAI LLM 的基类：模型信息、停止词和能力查询都转给被包装的 LLM"""
+    from crewai.llms.base_llm import BaseLLM
+
+    class WrappedLLM(BaseLLM):
+        def __init__(self, inner):
+            self.inner = inner
+            super().__init__(model=inner.model, temperature=getattr(inner, "temperature", None),
+                             stop=getattr(inner, "stop", None))
+
+        # 智能体执行器会直接修改 llm.stop，需要同步到被包装的 LLM
+        @property
+        def stop(self):
+            return self.inner.stop
+
+        @stop.setter
+        def stop(self, value):
+            self.inner.stop = value
+
+        def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs):
+            return self.inner.call(messages, tools=tools, callbacks=callbacks,
+                                   available_functions=available_functions, **kwargs)
+
+        def supports_function_calling(self) -> bool:
+            return self.inner.supports_function_calling()
+
+        def supports_stop_words(self) -> bool:
+            return self.inner.supports_stop_words()
+
+        def get_context_window_size(self) -> int:
+            return self.inner.get_context_window_size()
+
+    return WrappedLLM
+
+
+@lru_cache(maxsize=None)
+def _cached_llm_class():
+    class CachedLLM(wrapped_llm_class()):
+        """按缓存模式返回录制的结果或调用被包装的 LLM"""
+
+        def __init__(self, inner, cache: CompletionCache):
+            self.cache = cache
+            super().__init__(inner)
+
+        def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs):
+            check_cancelled()
+            _last_call.cached = False
+            key = completion_key(self.model, messages, {
+                "temperature": getattr(self.inner, "temperature", None),
+                "stop": self.inner.stop,
+                "tools": tools,
+            })
+            if self.cache.mode in (LLM_CACHE_READ_WRITE, LLM_CACHE_REPLAY):
+                cached = self.cache.get(key)
+                if cached is not None:
+                    _last_call.cached = True
+                    return cached
+                if self.cache.mode == LLM_CACHE_REPLAY:
+                    raise ReplayMissError(f"回放模式下没有找到录制的大模型响应（{self.model}, key={key[:12]}）")
+            response = super().call(messages, tools=tools, callbacks=callbacks,
+                                    available_functions=available_functions, **kwargs)
+            if isinstance(response, str):
+                try:
+                    self.cache.set(key, response, self.model, messages)
+                except OSError as e:
+                    logger.warning(f"写入 LLM 缓存失败: {str(e)}")
+            return response
+
+    return CachedLLM
+
+
+def cached_llm(inner, cache: Optional[CompletionCache] = None):
+    """用补全缓存包装一个 CrewAI LLM"""
+    return _cached_llm_class()(inner, cache or completion_cache)
@@ -0,0 +1,95 @@
+"""
+问卷数据在提示词中的紧凑表示。
+
+``survey/utils.build_data_json`` 保存的文件里，``meta`` 同时保留了前端原始数据和转换后的数据，
+和规范化的 ``survey`` 部分内容重复；整个文件插入 ``{renting_requirements}`` 后，
+同样的需求在每个智能体目标和任务描述里都会以三种形式各出现一次。
+
+``compact_requirements()`` 只输出规范化的 ``survey`` 字段：使用短键名，去掉空值，
+JSON 不带缩进和多余空格。完整的数据文件仍然保存在磁盘上，用于排查问题。
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, Tuple
+
+# (分组, 字段) -> 短键名；分组本身也换成短名称
+GROUP_KEYS: Dict[str, str] = {
+    "budget": "budget_pw",
+    "property": "property",
+    "lifestyle": "life",
+}
+
+FIELD_KEYS: Dict[Tuple[str, str], str] = {
+    ("budget", "weekly_min"): "min",
+    ("budget", "weekly_max"): "max",
+    ("budget", "weekly_total"): "mid",
+    ("budget", "bills_included"): "bills_incl",
+    ("property", "type"): "type",
+    ("property", "furnished"): "furnished",
+    ("property", "co_rent"): "share",
+    ("property", "accept_overpriced"): "ok_overpriced",
+    ("property", "accept_small"): "ok_small",
+    ("lifestyle", "commute"): "commute_min",
+    ("lifestyle", "move_in"): "move_in",
+    ("lifestyle", "lease_months"): "lease_m",
+    ("lifestyle", "university"): "uni",
+    ("lifestyle", "flexibility"): "flex",
+}
+
+# 旧版接口（ai/utils.build_data_json）保存的文件中与需求无关的字段
+ENVELOPE_KEYS = ("meta", "timestamp", "analysis_type")
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == "" or value == [] or value == {}
+
+
+def _prune(value: Any) -> Any:
+    """递归去掉空值（None、空字符串、空列表和空字典）"""
+    if isinstance(value, dict):
+        pruned = {k: _prune(v) for k, v in value.items()}
+        return {k: v for k, v in pruned.items() if not _is_empty(v)}
+    if isinstance(value, (list, tuple)):
+        pruned = [_prune(item) for item in value]
+        return [item for item in pruned if not _is_empty(item)]
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def _shorten_survey(survey: Dict[str, Any]) -> Dict[str, Any]:
+    """把规范化的问卷换成短键名；表里没有的分组和字段保留原名，不丢信息"""
+    compact: Dict[str, Any] = {}
+    for group, fields in survey.items():
+        if not isinstance(fields, dict):
+            compact[group] = fields
+            continue
+        compact[GROUP_KEYS.get(group, group)] = {
+            FIELD_KEYS.get((group, field), field): value for field, value in fields.items()
+        }
+    return compact
+
+
+def compact_survey(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    提示词中使用的需求数据（字典）。
+
+    有 ``survey`` 部分时只保留它并换成短键名；旧版接口保存的
+    ``{"renting_requirements": {...}}`` 取其中的需求；其他结构去掉 ``meta`` 等外层字段。
+    """
+    if not isinstance(payload, dict):
+        return payload
+    survey = payload.get("survey")
+    if isinstance(survey, dict):
+        return _prune(_shorten_survey(survey))
+    requirements = payload.get("renting_requirements")
+    if isinstance(requirements, dict):
+        return _prune(requirements)
+    return _prune({k: v for k, v in payload.items() if k not in ENVELOPE_KEYS})
+
+
+def compact_requirements(payload: Dict[str, Any]) -> str:
+    """插入 ``{renting_requirements}`` 的紧凑 JSON 文本"""
+    return json.dumps(compact_survey(payload), ensure_ascii=False, separators=(",", ":"), default=str)
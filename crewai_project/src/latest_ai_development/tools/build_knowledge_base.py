@@ -1,40 +1,21 @@
-import os
-import shutil
+import sys
+import logging
 import dotenv
-from llama_index.core import SimpleDirectoryReader, VectorStoreIndex
-from llama_index.core.settings import Settings
-from llama_index.embeddings.dashscope import DashScopeEmbedding
-from llama_index.readers.dashscope.base import DashScopeParse
-from llama_index.readers.dashscope.utils import ResultType
 
-dotenv.load_dotenv()
-
-# 使用llamaindex和dashscope构建知识库
-API_KEY = os.getenv("BAILIAN_API_KEY")
-Settings.embed_model = DashScopeEmbedding(
-    model_name="text-embedding-v2",
-    api_key=API_KEY
-)
+from latest_ai_development.tools.kb_builder import KnowledgeBaseBuilder
 
-parse = DashScopeParse(result_type=ResultType.DASHSCOPE_DOCMIND, api_key=API_KEY)
-documents = SimpleDirectoryReader(
-    "crewai_project/knowledge",
-    file_extractor={".pdf": parse, ".md": parse}
-).load_data()
+dotenv.load_dotenv()
+logging.basicConfig(level=logging.INFO)
 
-# 创建知识库目录
-PERSIST_DIR = "crewai_project/Qrent_knowledge_base"
-if os.path.exists(PERSIST_DIR):
-    shutil.rmtree(PERSIST_DIR)
-os.makedirs(PERSIST_DIR, exist_ok=True)
+# 使用llamaindex和dashscope增量构建知识库：只重新解析变化的文件、只向量化新的片段
+# 传入 --full 时不复用上一版，全部重新构建；--topic <主题> 只重建指定主题（可以重复）
+args = sys.argv[1:]
+topics = [args[i + 1] for i, arg in enumerate(args[:-1]) if arg == "--topic"]
+report = KnowledgeBaseBuilder().build(force="--full" in args, topics=topics or None)
 
-# 创建索引
-index = VectorStoreIndex.from_documents(
-    documents,
-    embed_model=Settings.embed_model,
-    show_progress=True
+print(
+    f"✅ 完成！片段数: {report.chunks_total}（新向量化 {report.chunks_embedded}，复用 {report.chunks_reused}），"
+    f"新增文件 {len(report.files_added)}，修改 {len(report.files_changed)}，"
+    f"未变 {len(report.files_unchanged)}，删除 {len(report.files_deleted)}，"
+    f"保留 {len(report.files_skipped)}，用时 {report.seconds}s"
 )
-
-# 保存索引
-index.storage_context.persist(PERSIST_DIR)
-print(f"✅ 完成！文档数: {len(index.docstore.docs)}")
\ No newline at end of file
@@ -1,33 +1,26 @@
 from crewai.tools import BaseTool
-from typing import Type
+from typing import List, Type
 from pydantic import BaseModel, Field
-from llama_index.core import StorageContext, load_index_from_storage
-from llama_index.core.settings import Settings
-from llama_index.embeddings.dashscope import DashScopeEmbedding
-import os
 import dotenv
-from pathlib import Path
 
-# ========== 1. 加载 RAG 组件 ==========
-dotenv.load_dotenv()
+from latest_ai_development.cancellation import current_token
+from latest_ai_development.tools.query_cache import rag_query_cache
+from latest_ai_development.tools.rag_index import rag_index
+from latest_ai_development.tools.retrieval import MODE_RETRIEVE, RetrievalConfig, format_chunks, format_grouped
+from latest_ai_development.usage import track_tool
 
-API_KEY = os.getenv("BAILIAN_API_KEY")
-Settings.embed_model = DashScopeEmbedding(
-    model_name="text-embedding-v2",
-    api_key=API_KEY
-)
+dotenv.load_dotenv()
 
-# 使用绝对路径来定位知识库，避免路径问题
-# 获取当前文件的绝对路径
-current_file = Path(__file__).resolve()
-# 导航到crewai_project目录下的Qrent_knowledge_base
-project_root = current_file.parents[3]  # ../../.. 导航到crewai_project目录
-PERSIST_DIR = str(project_root / "Qrent_knowledge_base")
+# 知识库索引在第一次检索时才加载（或由 rag_index.warm_up() 提前加载），
+# 导入本模块不再需要读取索引文件和创建向量模型客户端
+# 知识库重建后清除旧版本的检索缓存
+rag_index.on_version_change(rag_query_cache.invalidate)
 
-storage_context = StorageContext.from_defaults(persist_dir=PERSIST_DIR)
-index = load_index_from_storage(storage_context)
+# 检索模式（检索后总结 / 只返回片段）、片段数、格式和 token 预算，见 retrieval.py
+retrieval_config = RetrievalConfig.from_env()
 
-query_engine = index.as_query_engine(similarity_top_k=3)
+# 批量检索一次最多接受的查询数
+MAX_BATCH_QUERIES = 8
 
 
 class QrentRAGToolInput(BaseModel):
@@ -45,8 +38,73 @@ class QrentRAGTool(BaseTool):
         """
         执行 RAG 检索，返回相关内容
         """
+        # 分析已取消或超时时不再检索，智能体的下一步会被取消检查终止
+        token = current_token()
+        if token is not None and token.cancelled:
+            return "分析已取消，停止检索 qrent_knowledge_base。"
+        with track_tool(self.name) as call:
+            call.output = self._search(query, call)
+            return call.output
+
+    def _search(self, query: str, call) -> str:
+        try:
+            # 不同检索模式的输出不同，缓存按知识库版本和检索配置区分
+            kb_version = f"{rag_index.version}:{retrieval_config.signature}"
+            cached = rag_query_cache.get(query, kb_version)
+            if cached is not None:
+                call.cache_hit = True
+                return cached
+            if retrieval_config.mode == MODE_RETRIEVE:
+                chunks = rag_index.retrieve(query, retrieval_config.top_k)
+                answer = format_chunks(chunks, retrieval_config.format, retrieval_config.token_budget)
+            else:
+                answer = str(rag_index.query_engine.query(query))
+            rag_query_cache.set(query, kb_version, answer)
+            return answer
+        except Exception as e:
+            call.error = str(e)
+            return f"Error searching qrent_knowledge_base: {str(e)}"
+
+class QrentRAGBatchToolInput(BaseModel):
+    queries: List[str] = Field(..., description=f"要查询 qrent_knowledge_base 的多个文字查询，最多 {MAX_BATCH_QUERIES} 个")
+
+class QrentRAGBatchTool(BaseTool):
+    name: str = "qrent_rag_batch_search_tool"
+    description: str = (
+        "一次检索 qrent_knowledge_base 中的多个问题，按问题分组返回相关片段。"
+        "多个问题检索到的相同片段只返回一次。需要查询多个相关问题时比逐个调用 qrent_rag_search_tool 更快。"
+    )
+    args_schema: Type[BaseModel] = QrentRAGBatchToolInput
+
+    def _run(self, queries: List[str]) -> str:
+        """
+        批量检索：查询一次请求向量化、一次矩阵运算检索，结果去重后按查询分组。
+        无论检索模式如何都只返回片段，不调用大模型总结。
+        """
+        token = current_token()
+        if token is not None and token.cancelled:
+            return "分析已取消，停止检索 qrent_knowledge_base。"
+        # 去掉空查询和重复查询，保持原顺序
+        queries = list(dict.fromkeys(query.strip() for query in queries if query and query.strip()))
+        if not queries:
+            return "请至少提供一个查询。"
+        queries = queries[:MAX_BATCH_QUERIES]
+        with track_tool(self.name) as call:
+            call.output = self._search(queries, call)
+            return call.output
+
+    def _search(self, queries: List[str], call) -> str:
         try:
-            response = query_engine.query(query)
-            return str(response)
+            kb_version = f"{rag_index.version}:batch-{retrieval_config.top_k}-{retrieval_config.format}-{retrieval_config.token_budget}"
+            cache_key = " | ".join(queries)
+            cached = rag_query_cache.get(cache_key, kb_version)
+            if cached is not None:
+                call.cache_hit = True
+                return cached
+            results = rag_index.retrieve_many(queries, retrieval_config.top_k)
+            answer = format_grouped(queries, results, retrieval_config.format, retrieval_config.token_budget)
+            rag_query_cache.set(cache_key, kb_version, answer)
+            return answer
         except Exception as e:
-            return f"Error searching qrent_knowledge_base: {str(e)}"
\ No newline at end of file
+            call.error = str(e)
+            return f"Error searching qrent_knowledge_base: {str(e)}"
@@ -0,0 +1,198 @@
+"""
+可替换的向量模型和批量向量化流水线。
+
+``VectorStoreIndex.from_documents`` 逐个请求 DashScope，构建知识库很慢，而且没有网络时
+无法构建或测试索引。这里把向量模型抽象为 ``BaseEmbedder``：
+
+- ``DashScopeEmbedder``：线上使用的 DashScope text-embedding-v2；
+- ``HashingEmbedder``：本地的特征哈希向量，不需要网络，结果完全确定，用于离线构建和 CI。
+
+``EmbeddingPipeline`` 把文本按批发送，限制同时进行的请求数，失败时按指数退避重试，
+返回的向量与输入顺序一致。
+
+环境变量：
+- ``QRENT_EMBEDDER``：``dashscope``（默认）或 ``hashing``
+- ``QRENT_HASHING_DIM``：哈希向量维度，默认 512
+- ``QRENT_EMBED_BATCH_SIZE``：每批文本数，默认 25（DashScope 单次请求的上限）
+- ``QRENT_EMBED_CONCURRENCY``：同时进行的请求数，默认 4
+- ``QRENT_EMBED_MAX_RETRIES``：每批最多重试次数，默认 3
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import math
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
+
+from latest_ai_development.tools.retrieval import tokenize
+
+logger = logging.getLogger(__name__)
+
+EMBEDDER_DASHSCOPE = "dashscope"
+EMBEDDER_HASHING = "hashing"
+
+
+class BaseEmbedder:
+    """向量模型接口；name 会写入知识库 manifest，变化时已有向量不能复用"""
+
+    name: str = "base"
+
+    def embed_documents(self, texts: Sequence[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def embed_queries(self, texts: Sequence[str]) -> List[List[float]]:
+        """一次请求向量化多个查询"""
+        return self.embed_documents(texts)
+
+    def to_llama_index(self):
+        """返回 LlamaIndex 可以使用的向量模型（加载索引、检索后总结时使用）"""
+        from llama_index.core.embeddings import BaseEmbedding
+
+        embedder = self
+
+        class _EmbedderAdapter(BaseEmbedding):
+            def _get_query_embedding(self, query: str) -> List[float]:
+                return embedder.embed_query(query)
+
+            async def _aget_query_embedding(self, query: str) -> List[float]:
+                return embedder.embed_query(query)
+
+            def _get_text_embedding(self, text: str) -> List[float]:
+                return embedder.embed_documents([text])[0]
+
+            def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+                return embedder.embed_documents(texts)
+
+        return _EmbedderAdapter(model_name=self.name)
+
+
+class DashScopeEmbedder(BaseEmbedder):
+    def __init__(self, model_name: str = "text-embedding-v2", api_key: Optional[str] = None):
+        self.name = model_name
+        self._api_key = api_key
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            from llama_index.embeddings.dashscope import DashScopeEmbedding
+
+            self._model = DashScopeEmbedding(
+                model_name=self.name,
+                api_key=self._api_key or os.getenv("BAILIAN_API_KEY")
+            )
+        return self._model
+
+    def embed_documents(self, texts: Sequence[str]) -> List[List[float]]:
+        return self.model.get_text_embedding_batch(list(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.model.get_query_embedding(text)
+
+    def embed_queries(self, texts: Sequence[str]) -> List[List[float]]:
+        # LlamaIndex 的批量接口按文档类型向量化，查询需要直接调用 DashScope SDK
+        import dashscope
+
+        response = dashscope.TextEmbedding.call(
+            model=self.name,
+            input=list(texts),
+            text_type="query",
+            api_key=self._api_key or os.getenv("BAILIAN_API_KEY"),
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"DashScope 向量化失败: {response.code} {response.message}")
+        items = sorted(response.output["embeddings"], key=lambda item: item["text_index"])
+        return [item["embedding"] for item in items]
+
+    def to_llama_index(self):
+        return self.model
+
+
+class HashingEmbedder(BaseEmbedder):
+    """
+    确定性的特征哈希向量：每个词（中文两字词、英文单词）哈希到一个维度并带正负号，
+    最后归一化。语义效果不如真实模型，但词汇重合的文本相似度高，足够离线构建和测试使用。
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _vector(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        for token in tokenize(text):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(x * x for x in vector))
+        return [x / norm for x in vector] if norm else vector
+
+    def embed_documents(self, texts: Sequence[str]) -> List[List[float]]:
+        return [self._vector(text) for text in texts]
+
+
+class EmbeddingPipeline:
+    """分批、并发、带重试地调用向量模型"""
+
+    def __init__(self, embedder: BaseEmbedder, batch_size: int = 25, concurrency: int = 4,
+                 max_retries: int = 3, backoff: float = 1.0):
+        self.embedder = embedder
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max(0, max_retries)
+        self.backoff = backoff
+
+    @classmethod
+    def from_env(cls, embedder: Optional[BaseEmbedder] = None) -> "EmbeddingPipeline":
+        return cls(
+            embedder or get_embedder(),
+            batch_size=int(os.environ.get("QRENT_EMBED_BATCH_SIZE", "25")),
+            concurrency=int(os.environ.get("QRENT_EMBED_CONCURRENCY", "4")),
+            max_retries=int(os.environ.get("QRENT_EMBED_MAX_RETRIES", "3")),
+        )
+
+    def _embed_batch(self, batch: Sequence[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                vectors = self.embedder.embed_documents(batch)
+                if len(vectors) != len(batch):
+                    raise ValueError(f"向量模型返回了 {len(vectors)} 个向量，期望 {len(batch)} 个")
+                return vectors
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+                logger.warning(f"向量化失败（第 {attempt + 1} 次），{delay:.1f}s 后重试: {str(e)}")
+                time.sleep(delay)
+        raise AssertionError("unreachable")
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        texts = list(texts)
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1 or self.concurrency == 1:
+            results = [self._embed_batch(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches)),
+                                    thread_name_prefix="embed") as executor:
+                results = list(executor.map(self._embed_batch, batches))
+        return [vector for batch in results for vector in batch]
+
+    __call__ = embed
+
+
+def get_embedder(kind: Optional[str] = None) -> BaseEmbedder:
+    """按名称（默认读取 QRENT_EMBEDDER）创建向量模型"""
+    kind = (kind or os.environ.get("QRENT_EMBEDDER", EMBEDDER_DASHSCOPE)).strip().lower()
+    if kind == EMBEDDER_HASHING:
+        return HashingEmbedder(dim=int(os.environ.get("QRENT_HASHING_DIM", "512")))
+    if kind != EMBEDDER_DASHSCOPE:
+        raise ValueError(f"未知的向量模型: {kind}")
+    return DashScopeEmbedder()
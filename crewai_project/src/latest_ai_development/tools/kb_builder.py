@@ -0,0 +1,290 @@
+"""
+增量构建 Qrent 知识库。
+
+以前每次构建都删除整个知识库目录，重新解析、重新向量化 ``knowledge/`` 下的所有文档，
+只改了一个 markdown 文件也要把几百页的 PDF 攻略重新处理一遍。现在知识库目录中保存一份
+``manifest.json``，记录每个文件的内容哈希和它切出的片段哈希：
+
+- 文件哈希没变：不解析，直接复用上一版的片段和向量；
+- 文件变了或新增：重新解析、切分，只有上一版中不存在的片段才调用向量模型；
+- 文件被删除：在 manifest 的 ``tombstones`` 中记录，片段从知识库中移除。
+
+片段按主题排序写入，并生成主题分片信息（见 ``sharding.py``）和 BM25 倒排索引（见 ``lexical.py``）；``build(topics=[...])``
+只重建指定的主题。
+
+新版本先完整写入临时目录（NumPy 向量存储、LlamaIndex 存储和 manifest），
+最后再替换正在使用的知识库目录，检索方不会读到一半写好的知识库。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from latest_ai_development.tools.embeddings import BaseEmbedder, EmbeddingPipeline, get_embedder
+from latest_ai_development.tools.lexical import write_lexical_index
+from latest_ai_development.tools.parsing import DocumentParser, sha256_file
+from latest_ai_development.tools.rag_index import DEFAULT_PERSIST_DIR
+from latest_ai_development.tools.sharding import TOPIC_ORDER, topic_for_file, write_shards
+from latest_ai_development.tools.vector_store import NumpyVectorStore, write_vector_store
+
+logger = logging.getLogger(__name__)
+
+# crewai_project/knowledge
+DEFAULT_KNOWLEDGE_DIR = Path(__file__).resolve().parents[3] / "knowledge"
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+SUPPORTED_SUFFIXES = (".pdf", ".md")
+
+# parse(path) -> 文档文本列表
+Parser = Callable[[Path], List[str]]
+
+
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def split_texts(texts: Sequence[str]) -> List[str]:
+    """按 LlamaIndex 默认的 SentenceSplitter 切分（与 VectorStoreIndex.from_documents 一致）"""
+    from llama_index.core import Document
+    from llama_index.core.node_parser import SentenceSplitter
+
+    nodes = SentenceSplitter().get_nodes_from_documents([Document(text=text) for text in texts])
+    return [node.get_content() for node in nodes]
+
+
+def persist_llama_index(directory: Path, chunks: Sequence[Dict[str, Any]], vectors) -> None:
+    """用已有的向量构建 LlamaIndex 的 VectorStoreIndex 并保存（检索后总结模式使用）"""
+    from llama_index.core import StorageContext, VectorStoreIndex
+    from llama_index.core.embeddings import MockEmbedding
+    from llama_index.core.schema import TextNode
+
+    nodes = [
+        TextNode(id_=chunk["id"], text=chunk["text"], embedding=[float(x) for x in vector],
+                 metadata={"file_name": chunk["source"]})
+        for chunk, vector in zip(chunks, vectors)
+    ]
+    # 所有节点都已经带有向量，这里的向量模型不会被调用，只是避免 LlamaIndex 去创建默认模型
+    dim = len(nodes[0].embedding) if nodes else 1
+    index = VectorStoreIndex(nodes, storage_context=StorageContext.from_defaults(),
+                             embed_model=MockEmbedding(embed_dim=dim))
+    index.storage_context.persist(str(directory))
+
+
+@dataclass
+class BuildReport:
+    files_added: List[str] = field(default_factory=list)
+    files_changed: List[str] = field(default_factory=list)
+    files_unchanged: List[str] = field(default_factory=list)
+    files_deleted: List[str] = field(default_factory=list)
+    files_skipped: List[str] = field(default_factory=list)
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    chunks_reused: int = 0
+    parse_stats: Dict[str, int] = field(default_factory=dict)
+    shards: Dict[str, int] = field(default_factory=dict)
+    seconds: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class KnowledgeBaseBuilder:
+    """增量构建知识库：只解析变化的文件，只向量化新的片段"""
+
+    def __init__(self, knowledge_dir: Path = DEFAULT_KNOWLEDGE_DIR, persist_dir: Path = DEFAULT_PERSIST_DIR,
+                 parse: Optional[Parser] = None, split: Callable[[Sequence[str]], List[str]] = split_texts,
+                 embedder: Optional[BaseEmbedder] = None, write_llama_index: bool = True):
+        self.knowledge_dir = Path(knowledge_dir)
+        self.persist_dir = Path(persist_dir)
+        # 默认 markdown 直接读取，PDF 经 DocMind 解析并缓存结果（见 parsing.py）
+        self.parse = parse or DocumentParser.from_env()
+        self.split = split
+        # 默认使用 QRENT_EMBEDDER 指定的向量模型，分批并发请求（见 embeddings.py）
+        self.embedder = embedder or get_embedder()
+        self.pipeline = EmbeddingPipeline.from_env(self.embedder)
+        self.embed_model_name = self.embedder.name
+        self.write_llama_index = write_llama_index
+
+    def scan(self) -> Dict[str, Path]:
+        """知识库源文件，键是相对 knowledge_dir 的路径"""
+        return {
+            path.relative_to(self.knowledge_dir).as_posix(): path
+            for path in sorted(self.knowledge_dir.rglob("*"))
+            if path.is_file() and path.suffix.lower() in SUPPORTED_SUFFIXES
+        }
+
+    def load_manifest(self) -> Dict[str, Any]:
+        path = self.persist_dir / MANIFEST_FILE
+        try:
+            manifest = json.loads(path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return {"files": {}, "tombstones": {}}
+        if manifest.get("version") != MANIFEST_VERSION or manifest.get("embed_model") != self.embed_model_name:
+            # 格式或向量模型变了，上一版的向量不能复用
+            return {"files": {}, "tombstones": manifest.get("tombstones", {})}
+        return manifest
+
+    def _previous_chunks(self, manifest: Dict[str, Any]) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, Any]]:
+        """上一版知识库中每个文件的片段，以及片段哈希到向量的映射"""
+        by_file: Dict[str, List[Dict[str, Any]]] = {}
+        vectors: Dict[str, Any] = {}
+        if not manifest.get("files"):
+            return by_file, vectors
+        try:
+            store = NumpyVectorStore.open(self.persist_dir)
+        except Exception as e:
+            logger.warning(f"无法读取上一版向量存储，将全部重新向量化: {str(e)}")
+            return by_file, vectors
+        if store is None:
+            return by_file, vectors
+        for position in range(len(store)):
+            chunk = store.chunk(position)
+            if "hash" not in chunk or "file" not in chunk:
+                continue
+            by_file.setdefault(chunk["file"], []).append(chunk)
+            vectors.setdefault(chunk["hash"], store.vectors[position])
+        return by_file, vectors
+
+    def build(self, force: bool = False, topics: Optional[Sequence[str]] = None) -> BuildReport:
+        """
+        构建知识库；force=True 时不复用上一版，重新解析和向量化。
+
+        ``topics`` 指定只重建哪些主题（见 sharding.TOPICS），其他主题的文件原样保留上一版的片段和向量。
+        """
+        started = time.perf_counter()
+        report = BuildReport()
+        selected = set(topics) if topics else None
+        if selected is not None and selected - set(TOPIC_ORDER):
+            raise ValueError(f"未知的主题: {sorted(selected - set(TOPIC_ORDER))}")
+        sources = self.scan()
+        manifest = self.load_manifest()
+        previous_chunks, previous_vectors = self._previous_chunks(manifest)
+        previous_files = manifest.get("files", {})
+
+        # 1. 确定每个文件的片段：没变的文件直接复用，变化的文件重新解析和切分。
+        #    文件按主题排序，同一主题的片段在向量存储中是连续的一段
+        file_chunks: Dict[str, List[str]] = {}
+        file_hashes: Dict[str, str] = {}
+        file_parsers: Dict[str, Optional[str]] = {}
+        rebuilt: set = set()
+        settings_for = getattr(self.parse, "settings_for", None)
+        ordered = sorted(set(sources) | set(previous_files), key=lambda rel: (TOPIC_ORDER[topic_for_file(rel)], rel))
+        for rel in ordered:
+            previous = previous_files.get(rel)
+            if selected is not None and topic_for_file(rel) not in selected:
+                if previous and rel in previous_chunks:
+                    file_chunks[rel] = [chunk["text"] for chunk in previous_chunks[rel]]
+                    file_hashes[rel] = previous.get("hash")
+                    file_parsers[rel] = previous.get("parser")
+                    report.files_skipped.append(rel)
+                continue
+            if rel not in sources:
+                continue
+            path = sources[rel]
+            file_hash = sha256_file(path)
+            file_hashes[rel] = file_hash
+            # 解析方式变了（例如 markdown 改为直接读取），片段也会不同，不能复用
+            file_parsers[rel] = settings_for(path) if settings_for else None
+            if (not force and previous and previous.get("hash") == file_hash
+                    and previous.get("parser") == file_parsers[rel] and rel in previous_chunks):
+                file_chunks[rel] = [chunk["text"] for chunk in previous_chunks[rel]]
+                report.files_unchanged.append(rel)
+                continue
+            (report.files_changed if previous else report.files_added).append(rel)
+            logger.info(f"解析 {rel}")
+            file_chunks[rel] = self.split(self.parse(path))
+            rebuilt.add(rel)
+        report.files_deleted = sorted(rel for rel in previous_files if rel not in file_chunks and rel not in sources)
+
+        # 2. 只向量化上一版中没有的片段
+        missing: Dict[str, str] = {}
+        for rel, texts in file_chunks.items():
+            for text in texts:
+                chunk_hash = sha256_text(text)
+                if chunk_hash not in previous_vectors or (force and rel in rebuilt):
+                    missing.setdefault(chunk_hash, text)
+        new_vectors = dict(zip(missing, self.pipeline.embed(list(missing.values())))) if missing else {}
+        report.chunks_embedded = len(new_vectors)
+
+        # 3. 按文件顺序组装片段和向量
+        chunks: List[Dict[str, Any]] = []
+        vectors: List[Any] = []
+        files_manifest: Dict[str, Any] = {}
+        for rel, texts in file_chunks.items():
+            hashes = []
+            for position, text in enumerate(texts):
+                chunk_hash = sha256_text(text)
+                hashes.append(chunk_hash)
+                chunks.append({
+                    "id": f"{chunk_hash[:16]}-{len(chunks)}",
+                    "hash": chunk_hash,
+                    "file": rel,
+                    "topic": topic_for_file(rel),
+                    "source": Path(rel).name,
+                    "text": text,
+                })
+                vectors.append(new_vectors[chunk_hash] if chunk_hash in new_vectors else previous_vectors[chunk_hash])
+            files_manifest[rel] = {"hash": file_hashes[rel], "parser": file_parsers[rel], "chunks": hashes}
+        report.chunks_total = len(chunks)
+        report.chunks_reused = sum(1 for chunk in chunks if chunk["hash"] not in new_vectors)
+
+        tombstones = dict(manifest.get("tombstones", {}))
+        now = datetime.now().isoformat()
+        for rel in report.files_deleted:
+            tombstones[rel] = {"hash": previous_files[rel].get("hash"), "deleted_at": now}
+        for rel in sources:
+            tombstones.pop(rel, None)
+
+        new_manifest = {
+            "version": MANIFEST_VERSION,
+            "embed_model": self.embed_model_name,
+            "built_at": now,
+            "files": files_manifest,
+            "tombstones": tombstones,
+        }
+
+        # 4. 写入临时目录，完成后替换正在使用的知识库
+        staging = self.persist_dir.with_name(self.persist_dir.name + ".building")
+        if staging.exists():
+            shutil.rmtree(staging)
+        staging.mkdir(parents=True)
+        try:
+            write_vector_store(staging, vectors, chunks)
+            write_lexical_index(staging, [chunk["text"] for chunk in chunks])
+            report.shards = {
+                name: shard["end"] - shard["start"]
+                for name, shard in write_shards(staging, chunks, vectors)["shards"].items()
+            }
+            if self.write_llama_index:
+                persist_llama_index(staging, chunks, vectors)
+            (staging / MANIFEST_FILE).write_text(
+                json.dumps(new_manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+            swap_directory(staging, self.persist_dir)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        report.parse_stats = dict(getattr(self.parse, "stats", {}))
+        report.seconds = round(time.perf_counter() - started, 3)
+        logger.info(f"知识库构建完成: {report.to_dict()}")
+        return report
+
+
+def swap_directory(staging: Path, target: Path) -> None:
+    """用 staging 替换 target：两次 rename，中间没有写入，旧目录最后删除"""
+    previous = target.with_name(target.name + ".previous")
+    if previous.exists():
+        shutil.rmtree(previous)
+    if target.exists():
+        os.replace(target, previous)
+    os.replace(staging, target)
+    shutil.rmtree(previous, ignore_errors=True)
@@ -0,0 +1,157 @@
+"""
+知识库片段的 BM25 倒排索引。
+
+智能体的检索词里经常有精确的词，比如"押金""bond""lease break"或 Zetland、Waterloo 等区名。
+对这类查询做向量检索要先远程调用一次向量模型，而本地倒排索引就能给出很好的结果。
+
+构建知识库时对每个片段分词（中文相邻两字、英文单词，见 ``retrieval.tokenize``），
+生成 ``lexical_index.json``。检索时：
+
+- 高置信度的词匹配（排名第一的片段覆盖了查询中绝大部分有意义的词）直接返回，不调用向量模型；
+- 否则和向量检索结果按排名融合（Reciprocal Rank Fusion）；
+- 向量模型调用失败（例如没有网络）时，退回只用词匹配结果。
+
+环境变量：
+- ``QRENT_RAG_LEXICAL``：``hybrid``（默认，快速路径 + 融合）、``fast``（只用快速路径，不融合）或 ``off``
+- ``QRENT_RAG_LEXICAL_MIN_COVERAGE``：快速路径要求的查询词覆盖率（按 IDF 加权），默认 0.8
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from latest_ai_development.tools.retrieval import RetrievedChunk, tokenize
+
+LEXICAL_FILE = "lexical_index.json"
+
+LEXICAL_HYBRID = "hybrid"
+LEXICAL_FAST = "fast"
+LEXICAL_OFF = "off"
+
+# RRF 融合常数
+RRF_K = 60
+# 查询中至少这么大比例的词出现在知识库中，才可能走快速路径
+MIN_VOCAB_RATIO = 0.5
+
+
+@dataclass
+class LexicalResult:
+    rows: List[int]
+    scores: List[float]
+    # 排名第一的片段覆盖的查询词比例（按 IDF 加权）
+    coverage: float
+    vocab_ratio: float
+
+
+def write_lexical_index(directory: Path, texts: Sequence[str], k1: float = 1.5, b: float = 0.75) -> None:
+    """为片段文本生成倒排索引；行号与向量存储一致"""
+    postings: Dict[str, List[List[int]]] = defaultdict(list)
+    lengths = []
+    for row, text in enumerate(texts):
+        counts = Counter(tokenize(text))
+        lengths.append(sum(counts.values()))
+        for term, tf in counts.items():
+            postings[term].append([row, tf])
+    payload = {"k1": k1, "b": b, "doc_lengths": lengths, "postings": postings}
+    path = Path(directory) / LEXICAL_FILE
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(payload, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+class LexicalIndex:
+    """只读的 BM25 索引"""
+
+    def __init__(self, postings: Dict[str, List[List[int]]], doc_lengths: List[int],
+                 k1: float = 1.5, b: float = 0.75, mode: str = LEXICAL_HYBRID, min_coverage: float = 0.8):
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.mode = mode
+        self.min_coverage = min_coverage
+        count = len(doc_lengths)
+        self.avgdl = (sum(doc_lengths) / count) if count else 0.0
+        self.idf = {
+            term: math.log(1 + (count - len(rows) + 0.5) / (len(rows) + 0.5))
+            for term, rows in postings.items()
+        }
+        self._lock = threading.Lock()
+        self._counters = {"fast_path": 0, "hybrid": 0, "offline": 0}
+
+    @classmethod
+    def open(cls, directory: Path) -> Optional["LexicalIndex"]:
+        """知识库中没有倒排索引或已关闭时返回 None"""
+        mode = os.environ.get("QRENT_RAG_LEXICAL", LEXICAL_HYBRID).strip().lower()
+        path = Path(directory) / LEXICAL_FILE
+        if mode == LEXICAL_OFF or not path.exists():
+            return None
+        payload = json.loads(path.read_text(encoding="utf-8"))
+        return cls(payload["postings"], payload["doc_lengths"], payload.get("k1", 1.5), payload.get("b", 0.75),
+                   mode=mode, min_coverage=float(os.environ.get("QRENT_RAG_LEXICAL_MIN_COVERAGE", "0.8")))
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def search(self, query: str, k: int) -> LexicalResult:
+        terms = set(tokenize(query))
+        known = [term for term in terms if term in self.postings]
+        scores: Dict[int, float] = defaultdict(float)
+        matched_idf: Dict[int, float] = defaultdict(float)
+        for term in known:
+            idf = self.idf[term]
+            for row, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[row] / self.avgdl) if self.avgdl else self.k1
+                scores[row] += idf * tf * (self.k1 + 1) / (tf + norm)
+                matched_idf[row] += idf
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        total_idf = sum(self.idf[term] for term in known)
+        coverage = matched_idf[ranked[0][0]] / total_idf if ranked and total_idf else 0.0
+        return LexicalResult(
+            rows=[row for row, _ in ranked],
+            scores=[score for _, score in ranked],
+            coverage=coverage,
+            vocab_ratio=len(known) / len(terms) if terms else 0.0,
+        )
+
+    def confident(self, result: LexicalResult) -> bool:
+        """排名第一的片段覆盖了足够多的查询词时，不需要再做向量检索"""
+        return bool(result.rows) and result.vocab_ratio >= MIN_VOCAB_RATIO and result.coverage >= self.min_coverage
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            counters = dict(self._counters)
+        counters.update(mode=self.mode, terms=len(self.postings), chunks=len(self.doc_lengths))
+        return counters
+
+
+def lexical_chunks(store, result: LexicalResult) -> List[RetrievedChunk]:
+    """把词匹配结果转成片段；相关度按第一名归一化到 0-1"""
+    top = result.scores[0] if result.scores else 1.0
+    chunks = []
+    for row, score in zip(result.rows, result.scores):
+        chunk = store.chunk(row)
+        chunks.append(RetrievedChunk(text=chunk.get("text", ""), score=score / top if top else 0.0,
+                                     source=chunk.get("source"), chunk_id=chunk.get("id")))
+    return chunks
+
+
+def fuse(vector_results: List[RetrievedChunk], lexical_results: List[RetrievedChunk], k: int) -> List[RetrievedChunk]:
+    """按排名融合两路结果（RRF），相关度归一化到 0-1"""
+    fused: Dict[str, Tuple[float, RetrievedChunk]] = {}
+    for results in (vector_results, lexical_results):
+        for rank, chunk in enumerate(results):
+            key = chunk.chunk_id or chunk.text
+            score, existing = fused.get(key, (0.0, chunk))
+            fused[key] = (score + 1.0 / (RRF_K + rank + 1), existing)
+    best = 2.0 / (RRF_K + 1)
+    ranked = sorted(fused.values(), key=lambda item: item[0], reverse=True)[:k]
+    return [replace(chunk, score=round(score / best, 4)) for score, chunk in ranked]
@@ -0,0 +1,134 @@
+"""
+知识库源文件的解析和解析结果缓存。
+
+DashScopeParse（DocMind）是构建知识库最慢的一步：文件要上传、排队、等待解析完成。
+解析结果按"解析器设置 + 文件内容哈希"缓存在磁盘上，内容没变的文件不会再次提交解析，
+即使用 ``--full`` 全量重建或更换了向量模型也一样。
+
+``.md`` 文件本身就是纯文本，默认直接读取，不经过 DocMind；
+设置 ``QRENT_MD_PARSER=docmind`` 可以恢复原来的行为。
+
+环境变量：
+- ``QRENT_PARSE_CACHE_DIR``：解析缓存目录，默认 ``crewai_project/.cache/parsed``，设为空字符串时关闭缓存
+- ``QRENT_MD_PARSER``：``plain``（默认）或 ``docmind``
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# crewai_project/.cache/parsed
+DEFAULT_PARSE_CACHE_DIR = Path(__file__).resolve().parents[3] / ".cache" / "parsed"
+
+# 解析器设置，作为缓存键的一部分；修改解析方式时改版本号，旧缓存自动失效
+PARSER_DOCMIND = "dashscope-docmind-v1"
+PARSER_PLAIN = "plain-text-v1"
+
+
+def sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def docmind_parse(path: Path) -> List[str]:
+    """使用 DashScopeParse（DocMind）解析文档，返回每个文档的文本"""
+    from llama_index.core import SimpleDirectoryReader
+    from llama_index.readers.dashscope.base import DashScopeParse
+    from llama_index.readers.dashscope.utils import ResultType
+
+    parser = DashScopeParse(result_type=ResultType.DASHSCOPE_DOCMIND, api_key=os.getenv("BAILIAN_API_KEY"))
+    documents = SimpleDirectoryReader(
+        input_files=[str(path)],
+        file_extractor={".pdf": parser, ".md": parser}
+    ).load_data()
+    return [document.get_content() for document in documents]
+
+
+def read_text_file(path: Path) -> List[str]:
+    """纯文本文件（markdown）直接读取"""
+    return [Path(path).read_text(encoding="utf-8-sig")]
+
+
+class ParseCache:
+    """每个解析结果一个 JSON 文件，写入时先写临时文件再改名"""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[List[str]]:
+        try:
+            return json.loads(self._path(key).read_text(encoding="utf-8"))["texts"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def set(self, key: str, texts: List[str]) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps({"texts": texts}, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+
+
+class DocumentParser:
+    """按文件类型选择解析方式，DocMind 的解析结果走缓存"""
+
+    def __init__(self, cache: Optional[ParseCache] = None, markdown_fast_path: bool = True,
+                 docmind=docmind_parse):
+        self.cache = cache
+        self.markdown_fast_path = markdown_fast_path
+        self.docmind = docmind
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"plain_text": 0, "cache_hits": 0, "parsed": 0}
+
+    @classmethod
+    def from_env(cls) -> "DocumentParser":
+        cache_dir = os.environ.get("QRENT_PARSE_CACHE_DIR", str(DEFAULT_PARSE_CACHE_DIR))
+        md_parser = os.environ.get("QRENT_MD_PARSER", "plain").strip().lower()
+        return cls(
+            cache=ParseCache(Path(cache_dir)) if cache_dir else None,
+            markdown_fast_path=md_parser != "docmind",
+        )
+
+    def settings_for(self, path: Path) -> str:
+        if self.markdown_fast_path and Path(path).suffix.lower() == ".md":
+            return PARSER_PLAIN
+        return PARSER_DOCMIND
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def __call__(self, path: Path) -> List[str]:
+        settings = self.settings_for(path)
+        if settings == PARSER_PLAIN:
+            self._count("plain_text")
+            return read_text_file(path)
+
+        key = hashlib.sha256(f"{settings}\n{sha256_file(path)}".encode("utf-8")).hexdigest()
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._count("cache_hits")
+                return cached
+        texts = self.docmind(path)
+        self._count("parsed")
+        if self.cache is not None:
+            try:
+                self.cache.set(key, texts)
+            except OSError as e:
+                logger.warning(f"写入解析缓存失败: {str(e)}")
+        return texts
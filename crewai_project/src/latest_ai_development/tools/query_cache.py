@@ -0,0 +1,214 @@
+"""
+qrent_rag_search_tool 的查询结果缓存。
+
+三个智能体会反复用几乎相同的问题检索知识库（例如"悉尼不同区域租金行情"），
+每次检索都要调用一次向量模型和一次大模型总结。这里在 ``QrentRAGTool._run`` 前面加两级缓存：
+
+- 进程内 LRU：命中时不需要任何 IO；
+- 磁盘上的 SQLite：进程重启、多个 worker 之间共享。
+
+缓存键是规范化后的查询文本加知识库版本号（``rag_index.version``），
+知识库重建后旧条目不会再被命中，并在检测到版本变化时被清除。
+
+环境变量：
+- ``QRENT_RAG_CACHE``：设为 0 关闭缓存
+- ``QRENT_RAG_CACHE_PATH``：SQLite 文件路径，设为空字符串时只使用内存缓存
+- ``QRENT_RAG_CACHE_TTL``：条目有效期（秒），默认 86400
+- ``QRENT_RAG_CACHE_SIZE``：内存 LRU 的条目数，默认 256
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# crewai_project/.cache/rag_query_cache.sqlite3
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parents[3] / ".cache" / "rag_query_cache.sqlite3"
+DEFAULT_TTL_SECONDS = 86400.0
+DEFAULT_MEMORY_SIZE = 256
+
+_WHITESPACE = re.compile(r"\s+")
+# 结尾的标点（问号、句号等）不影响检索结果
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.,;:。？！，；：、]+$")
+
+
+def normalize_query(query: str) -> str:
+    """全角转半角、英文小写、合并空白、去掉结尾标点"""
+    text = unicodedata.normalize("NFKC", query or "").lower()
+    text = _WHITESPACE.sub(" ", text).strip()
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+
+def cache_key(query: str, kb_version: str) -> str:
+    payload = f"{kb_version}\n{normalize_query(query)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _SQLiteStore:
+    """磁盘缓存，每次操作使用独立连接，多线程、多进程都可以安全访问"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rag_query_cache ("
+                "key TEXT PRIMARY KEY, kb_version TEXT NOT NULL, query TEXT NOT NULL, "
+                "answer TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self.path), timeout=5.0)
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT answer, created_at FROM rag_query_cache WHERE key = ?", (key,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, key: str, kb_version: str, query: str, answer: str, created_at: float) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO rag_query_cache (key, kb_version, query, answer, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, kb_version, query, answer, created_at),
+            )
+
+    def prune(self, kb_version: str, oldest: float) -> int:
+        """删除其他知识库版本和已过期的条目；版本号可以带 ":检索配置" 后缀"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM rag_query_cache "
+                "WHERE (kb_version != ? AND kb_version NOT LIKE ?) OR created_at < ?",
+                (kb_version, f"{kb_version}:%", oldest),
+            )
+            return cursor.rowcount
+
+
+class RagQueryCache:
+    """两级（内存 LRU + SQLite）查询缓存"""
+
+    def __init__(self, path: Optional[Path] = DEFAULT_CACHE_PATH,
+                 ttl: float = DEFAULT_TTL_SECONDS, memory_size: int = DEFAULT_MEMORY_SIZE,
+                 enabled: bool = True):
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.enabled = enabled
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "errors": 0}
+        self._store: Optional[_SQLiteStore] = None
+        if enabled and path:
+            try:
+                self._store = _SQLiteStore(path)
+            except Exception as e:
+                logger.warning(f"无法打开检索缓存 {path}，只使用内存缓存: {str(e)}")
+
+    @classmethod
+    def from_env(cls) -> "RagQueryCache":
+        enabled = os.environ.get("QRENT_RAG_CACHE", "1").lower() not in ("0", "false", "no")
+        path = os.environ.get("QRENT_RAG_CACHE_PATH", str(DEFAULT_CACHE_PATH))
+        return cls(
+            path=Path(path) if path else None,
+            ttl=float(os.environ.get("QRENT_RAG_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+            memory_size=int(os.environ.get("QRENT_RAG_CACHE_SIZE", DEFAULT_MEMORY_SIZE)),
+            enabled=enabled,
+        )
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _fresh(self, created_at: float) -> bool:
+        return self.ttl <= 0 or time.time() - created_at < self.ttl
+
+    def _remember(self, key: str, answer: str, created_at: float) -> None:
+        with self._lock:
+            self._memory[key] = (answer, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get(self, query: str, kb_version: str) -> Optional[str]:
+        """返回缓存的检索结果，未命中或已过期时返回 None"""
+        if not self.enabled:
+            return None
+        key = cache_key(query, kb_version)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self._fresh(entry[1]):
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return entry[0]
+                del self._memory[key]
+        if self._store is not None:
+            try:
+                entry = self._store.get(key)
+            except Exception as e:
+                self._count("errors")
+                logger.warning(f"读取检索缓存失败: {str(e)}")
+                entry = None
+            if entry is not None and self._fresh(entry[1]):
+                self._remember(key, *entry)
+                self._count("disk_hits")
+                return entry[0]
+        self._count("misses")
+        return None
+
+    def set(self, query: str, kb_version: str, answer: str) -> None:
+        if not self.enabled:
+            return
+        key = cache_key(query, kb_version)
+        created_at = time.time()
+        self._remember(key, answer, created_at)
+        self._count("stores")
+        if self._store is not None:
+            try:
+                self._store.set(key, kb_version, normalize_query(query), answer, created_at)
+            except Exception as e:
+                self._count("errors")
+                logger.warning(f"写入检索缓存失败: {str(e)}")
+
+    def invalidate(self, kb_version: str) -> None:
+        """知识库版本变化后清空内存缓存，并删除磁盘上旧版本和过期的条目"""
+        with self._lock:
+            self._memory.clear()
+        if self._store is not None:
+            oldest = time.time() - self.ttl if self.ttl > 0 else 0.0
+            try:
+                removed = self._store.prune(kb_version, oldest)
+                logger.info(f"知识库版本变为 {kb_version}，删除了 {removed} 条检索缓存")
+            except Exception as e:
+                self._count("errors")
+                logger.warning(f"清理检索缓存失败: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._memory)
+        hits = counters["memory_hits"] + counters["disk_hits"]
+        lookups = hits + counters["misses"]
+        counters.update(
+            enabled=self.enabled,
+            memory_entries=size,
+            disk=str(self._store.path) if self._store is not None else None,
+            hit_rate=round(hits / lookups, 4) if lookups else None,
+        )
+        return counters
+
+
+rag_query_cache = RagQueryCache.from_env()
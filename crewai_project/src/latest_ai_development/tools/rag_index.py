@@ -0,0 +1,329 @@
+"""
+Qrent 知识库索引服务。
+
+以前 ``custom_tool.py`` 在导入时就加载 LlamaIndex 存储、创建向量模型客户端和查询引擎，
+Django 加载 URL 时会间接导入它，于是每个 manage.py 命令和每个 worker 启动都要付出
+完整的索引加载时间。现在索引在第一次使用时才加载（线程安全，只加载一次），
+也可以通过 ``warm_up()`` 提前加载，``status()`` 返回当前是否就绪。
+
+知识库目录中有 NumPy 向量存储（见 ``vector_store.py``）时，只检索（``retrieve()``）
+不需要加载 LlamaIndex 索引：打开内存映射的向量文件，再计算一次查询向量即可；
+有主题分片信息时只检索路由到的主题（见 ``sharding.py``），
+词匹配足够可靠时连向量模型也不调用（见 ``lexical.py``）。
+
+``version`` 是知识库目录中索引文件的指纹（文件名、大小、修改时间），知识库重建后会变化；
+检测到变化时已加载的索引会被丢弃，下次使用时重新加载，依赖版本号的查询缓存也随之失效。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from latest_ai_development.tools.lexical import LEXICAL_HYBRID, fuse, lexical_chunks
+from latest_ai_development.tools.retrieval import RetrievedChunk, chunk_from_node
+
+logger = logging.getLogger(__name__)
+
+STATE_COLD = "cold"
+STATE_LOADING = "loading"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+
+# crewai_project/Qrent_knowledge_base
+DEFAULT_PERSIST_DIR = Path(__file__).resolve().parents[3] / "Qrent_knowledge_base"
+
+# 两次检查知识库指纹之间的最短间隔（秒）
+VERSION_CHECK_SECONDS = 5.0
+
+
+def kb_fingerprint(persist_dir: Path) -> str:
+    """根据知识库目录中文件的名称、大小和修改时间计算版本号；目录不存在时返回 "missing"（此时没有可加载的索引）"""
+    try:
+        entries = sorted(
+            (entry.name, entry.stat().st_size, entry.stat().st_mtime_ns)
+            for entry in Path(persist_dir).iterdir() if entry.is_file()
+        )
+    except FileNotFoundError:
+        return "missing"
+    digest = hashlib.sha1(repr(entries).encode("utf-8")).hexdigest()
+    return digest[:16]
+
+
+class RagIndexService:
+    """延迟加载的知识库索引和查询引擎"""
+
+    def __init__(self, persist_dir: Path, similarity_top_k: int = 3):
+        self.persist_dir = Path(persist_dir)
+        self.similarity_top_k = similarity_top_k
+        self.state = STATE_COLD
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self._index = None
+        self._query_engine = None
+        self._embedder = None
+        self._embed_model = None
+        self._vector_store = None
+        self._router = None
+        self._lexical = None
+        self._vector_store_checked = False
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+        self._version_checked = 0.0
+        self._loaded_version: Optional[str] = None
+        self._listeners: List[Callable[[str], None]] = []
+
+    @property
+    def ready(self) -> bool:
+        return self.state == STATE_READY
+
+    def _load(self) -> None:
+        # llama_index 的导入本身也较慢，放到真正加载时再导入
+        from llama_index.core import StorageContext, load_index_from_storage
+        from llama_index.core.settings import Settings
+
+        Settings.embed_model = self.embed_model
+        storage_context = StorageContext.from_defaults(persist_dir=str(self.persist_dir))
+        self._index = load_index_from_storage(storage_context)
+        self._query_engine = self._index.as_query_engine(similarity_top_k=self.similarity_top_k)
+
+    @property
+    def embedder(self):
+        """QRENT_EMBEDDER 指定的向量模型，必须与构建知识库时使用的一致"""
+        if self._embedder is None:
+            from latest_ai_development.tools.embeddings import get_embedder
+
+            self._embedder = get_embedder()
+        return self._embedder
+
+    @property
+    def embed_model(self):
+        """LlamaIndex 使用的向量模型，第一次使用时创建"""
+        if self._embed_model is None:
+            self._embed_model = self.embedder.to_llama_index()
+        return self._embed_model
+
+    @property
+    def vector_store(self):
+        return self.open_vector_store()
+
+    def open_vector_store(self):
+        """打开知识库目录中的 NumPy 向量存储；不存在或文件不完整时返回 None"""
+        if not self._vector_store_checked:
+            from latest_ai_development.tools.lexical import LexicalIndex
+            from latest_ai_development.tools.sharding import ShardRouter
+            from latest_ai_development.tools.vector_store import NumpyVectorStore
+
+            with self._lock:
+                if not self._vector_store_checked:
+                    try:
+                        self._vector_store = NumpyVectorStore.open(self.persist_dir)
+                        built_with = self._manifest_embed_model()
+                        if self._vector_store is not None and built_with not in (None, self.embedder.name):
+                            logger.warning(f"知识库使用 {built_with} 构建，与当前向量模型 {self.embedder.name} 不一致，"
+                                           f"不使用向量存储")
+                            self._vector_store = None
+                    except Exception as e:
+                        logger.warning(f"无法打开向量存储，改用 LlamaIndex 索引检索: {str(e)}")
+                        self._vector_store = None
+                    if self._vector_store is not None:
+                        try:
+                            self._router = ShardRouter.open(self.persist_dir)
+                        except Exception as e:
+                            logger.warning(f"无法读取主题分片信息，检索全部片段: {str(e)}")
+                            self._router = None
+                        try:
+                            self._lexical = LexicalIndex.open(self.persist_dir)
+                        except Exception as e:
+                            logger.warning(f"无法读取倒排索引，只使用向量检索: {str(e)}")
+                            self._lexical = None
+                    self._vector_store_checked = True
+        return self._vector_store
+
+    def _manifest_embed_model(self) -> Optional[str]:
+        try:
+            manifest = json.loads((self.persist_dir / "manifest.json").read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+        return manifest.get("embed_model")
+
+    def ensure_loaded(self) -> None:
+        """确保索引已加载；并发调用只会加载一次，加载失败时下次调用会重试"""
+        if self.state == STATE_READY:
+            return
+        with self._lock:
+            if self.state == STATE_READY:
+                return
+            self.state = STATE_LOADING
+            started = time.perf_counter()
+            try:
+                self._loaded_version = kb_fingerprint(self.persist_dir)
+                self._load()
+            except Exception as e:
+                self.state = STATE_FAILED
+                self.error = str(e)
+                logger.error(f"加载知识库索引失败: {str(e)}")
+                raise
+            self.load_seconds = time.perf_counter() - started
+            self.error = None
+            self.state = STATE_READY
+            logger.info(f"知识库索引加载完成，用时 {self.load_seconds:.2f}s")
+
+    @property
+    def version(self) -> str:
+        """当前知识库版本；最多每 VERSION_CHECK_SECONDS 秒重新计算一次，变化时丢弃已加载的索引"""
+        now = time.monotonic()
+        if self._version is not None and now - self._version_checked < VERSION_CHECK_SECONDS:
+            return self._version
+        current = kb_fingerprint(self.persist_dir)
+        self._version_checked = now
+        previous, self._version = self._version, current
+        if previous is not None and current != previous:
+            logger.info(f"知识库已更新（{previous} -> {current}），重新加载索引")
+            self.reset()
+            for listener in list(self._listeners):
+                try:
+                    listener(current)
+                except Exception as e:
+                    logger.warning(f"知识库版本变化通知失败: {str(e)}")
+        return current
+
+    def on_version_change(self, listener: Callable[[str], None]) -> None:
+        """注册知识库版本变化时的回调，参数是新的版本号"""
+        self._listeners.append(listener)
+
+    @property
+    def index(self):
+        self.ensure_loaded()
+        return self._index
+
+    @property
+    def query_engine(self):
+        self.ensure_loaded()
+        return self._query_engine
+
+    def retrieve(self, query: str, top_k: Optional[int] = None) -> List[RetrievedChunk]:
+        """只做检索（不调用大模型总结），按相关度返回前 top_k 个片段"""
+        k = top_k or self.similarity_top_k
+        store = self.vector_store
+        if store is not None:
+            lexical = self._lexical
+            lexical_result = lexical.search(query, k) if lexical is not None else None
+            if lexical_result is not None and lexical.confident(lexical_result):
+                # 词匹配已经足够可靠，不调用向量模型
+                lexical.count("fast_path")
+                return lexical_chunks(store, lexical_result)
+            try:
+                query_vector = self.embedder.embed_query(query)
+            except Exception as e:
+                if not lexical_result or not lexical_result.rows:
+                    raise
+                logger.warning(f"向量模型调用失败，只使用词匹配结果: {str(e)}")
+                lexical.count("offline")
+                return lexical_chunks(store, lexical_result)
+            if self._router is not None:
+                results = self._router.search(store, query, query_vector, k)
+            else:
+                results = store.search(query_vector, k)
+            if lexical_result is not None and lexical_result.rows and lexical.mode == LEXICAL_HYBRID:
+                lexical.count("hybrid")
+                return fuse(results, lexical_chunks(store, lexical_result), k)
+            return results
+        retriever = self.index.as_retriever(similarity_top_k=top_k or self.similarity_top_k)
+        return [chunk_from_node(node) for node in retriever.retrieve(query)]
+
+    def retrieve_many(self, queries: Sequence[str], top_k: Optional[int] = None) -> List[List[RetrievedChunk]]:
+        """
+        多个查询一起检索，结果与 queries 顺序一致。词匹配快速路径之外的查询一次请求向量化，
+        再用一次矩阵乘法对全部片段计算相似度（不按主题路由：一次扫描全部行比多次扫描分片更快）。
+        """
+        k = top_k or self.similarity_top_k
+        store = self.vector_store
+        if store is None:
+            return [self.retrieve(query, k) for query in queries]
+
+        lexical = self._lexical
+        results: List[Optional[List[RetrievedChunk]]] = [None] * len(queries)
+        lexical_results: Dict[int, Any] = {}
+        pending: List[int] = []
+        for position, query in enumerate(queries):
+            lexical_result = lexical.search(query, k) if lexical is not None else None
+            if lexical_result is not None and lexical.confident(lexical_result):
+                lexical.count("fast_path")
+                results[position] = lexical_chunks(store, lexical_result)
+            else:
+                lexical_results[position] = lexical_result
+                pending.append(position)
+        if not pending:
+            return results
+
+        try:
+            query_vectors = self.embedder.embed_queries([queries[position] for position in pending])
+        except Exception as e:
+            if any(not lexical_results[position] or not lexical_results[position].rows for position in pending):
+                raise
+            logger.warning(f"向量模型调用失败，只使用词匹配结果: {str(e)}")
+            for position in pending:
+                lexical.count("offline")
+                results[position] = lexical_chunks(store, lexical_results[position])
+            return results
+
+        for position, vector_results in zip(pending, store.search_many(query_vectors, k)):
+            lexical_result = lexical_results[position]
+            if lexical_result is not None and lexical_result.rows and lexical.mode == LEXICAL_HYBRID:
+                lexical.count("hybrid")
+                vector_results = fuse(vector_results, lexical_chunks(store, lexical_result), k)
+            results[position] = vector_results
+        return results
+
+    def warm_up(self, background: bool = False) -> Optional[threading.Thread]:
+        """提前加载索引；background=True 时在后台线程中加载并返回该线程"""
+        if not background:
+            self.open_vector_store()
+            self.ensure_loaded()
+            return None
+
+        def run():
+            try:
+                self.open_vector_store()
+                self.ensure_loaded()
+            except Exception:
+                pass
+
+        thread = threading.Thread(target=run, name="rag-index-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def reset(self) -> None:
+        """丢弃已加载的索引，下次使用时重新加载（知识库重建后调用）"""
+        with self._lock:
+            # 不关闭旧的内存映射，正在检索的线程可能还在使用，由垃圾回收释放
+            self._vector_store = None
+            self._router = None
+            self._lexical = None
+            self._vector_store_checked = False
+            self._index = None
+            self._query_engine = None
+            self._loaded_version = None
+            self.state = STATE_COLD
+            self.load_seconds = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "version": self._loaded_version,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "error": self.error,
+            "vector_store": self._vector_store.stats() if self._vector_store is not None else None,
+            "shards": self._router.stats() if self._router is not None else None,
+            "lexical": self._lexical.stats() if self._lexical is not None else None,
+        }
+
+
+rag_index = RagIndexService(DEFAULT_PERSIST_DIR)
@@ -0,0 +1,202 @@
+"""
+知识库检索结果的表示和格式化。
+
+默认情况下 qrent_rag_search_tool 通过查询引擎检索后再调用一次大模型总结答案；
+而调用工具的智能体本身就是大模型，会自己阅读检索到的片段。
+``QRENT_RAG_MODE=retrieve`` 时工具只做检索，直接返回前 k 个片段（带相关度和来源文件），
+每次工具调用少一次大模型请求。
+
+环境变量：
+- ``QRENT_RAG_MODE``：``synthesize``（默认，检索后由大模型总结）或 ``retrieve``（只返回片段）
+- ``QRENT_RAG_TOP_K``：返回的片段数，默认 3
+- ``QRENT_RAG_FORMAT``：``full``（默认）或 ``compact``（每个片段一行，合并空白）
+- ``QRENT_RAG_TOKEN_BUDGET``：返回内容的 token 上限（估算值），默认 800，0 表示不限制
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence
+
+MODE_SYNTHESIZE = "synthesize"
+MODE_RETRIEVE = "retrieve"
+
+FORMAT_FULL = "full"
+FORMAT_COMPACT = "compact"
+
+# 预算剩余不足这么多 token 时不再截断放入下一个片段
+MIN_CHUNK_TOKENS = 32
+
+_CJK = re.compile(r"[　-〿㐀-䶿一-鿿＀-￯]")
+_WHITESPACE = re.compile(r"\s+")
+# 连续的汉字，或者连续的英文字母/数字
+_TOKEN = re.compile(r"[㐀-䶿一-鿿]+|[a-z0-9]+")
+
+
+@dataclass
+class RetrievedChunk:
+    """一个检索到的知识库片段"""
+    text: str
+    score: Optional[float]
+    source: Optional[str]
+    chunk_id: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class RetrievalConfig:
+    mode: str = MODE_SYNTHESIZE
+    top_k: int = 3
+    format: str = FORMAT_FULL
+    token_budget: int = 800
+
+    @classmethod
+    def from_env(cls) -> "RetrievalConfig":
+        mode = os.environ.get("QRENT_RAG_MODE", MODE_SYNTHESIZE).strip().lower()
+        fmt = os.environ.get("QRENT_RAG_FORMAT", FORMAT_FULL).strip().lower()
+        return cls(
+            mode=mode if mode in (MODE_SYNTHESIZE, MODE_RETRIEVE) else MODE_SYNTHESIZE,
+            top_k=max(1, int(os.environ.get("QRENT_RAG_TOP_K", "3"))),
+            format=fmt if fmt in (FORMAT_FULL, FORMAT_COMPACT) else FORMAT_FULL,
+            token_budget=max(0, int(os.environ.get("QRENT_RAG_TOKEN_BUDGET", "800"))),
+        )
+
+    @property
+    def signature(self) -> str:
+        """影响工具输出的配置，作为查询缓存版本号的一部分"""
+        if self.mode == MODE_SYNTHESIZE:
+            return MODE_SYNTHESIZE
+        return f"{self.mode}-{self.top_k}-{self.format}-{self.token_budget}"
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：每个中文字符约 1 个 token，其他字符约 4 个一个 token"""
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def tokenize(text: str) -> List[str]:
+    """中文按相邻两个字切分（单个字保留），英文和数字按词切分并转小写"""
+    tokens: List[str] = []
+    for match in _TOKEN.finditer(text.lower()):
+        word = match.group()
+        if word[0].isascii():
+            tokens.append(word)
+        elif len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """截断文本使其估算 token 数不超过 max_tokens"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) + 1 <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low].rstrip() + "…"
+
+
+def chunk_from_node(node_with_score) -> RetrievedChunk:
+    """把 LlamaIndex 的 NodeWithScore 转成 RetrievedChunk"""
+    node = node_with_score.node
+    metadata = getattr(node, "metadata", None) or {}
+    source = metadata.get("file_name") or metadata.get("file_path")
+    if source:
+        source = os.path.basename(str(source))
+    return RetrievedChunk(text=node.get_content(), score=node_with_score.score, source=source,
+                          chunk_id=getattr(node, "node_id", None))
+
+
+def _header(position: int, chunk: RetrievedChunk) -> str:
+    parts = [chunk.source or "未知来源"]
+    if chunk.score is not None:
+        parts.append(f"相关度 {chunk.score:.2f}")
+    return f"[{position}] " + " | ".join(parts)
+
+
+def _block(position: int, chunk: RetrievedChunk, compact: bool, budget: Optional[int]) -> Optional[str]:
+    """格式化一个片段；budget 为剩余 token 数（None 表示不限制），放不下时返回 None"""
+    header = _header(position, chunk)
+    if compact:
+        header, body = header + ": ", _WHITESPACE.sub(" ", chunk.text).strip()
+    else:
+        header, body = header + "\n", chunk.text.strip()
+    if budget is not None:
+        remaining = budget - estimate_tokens(header)
+        if remaining < min(MIN_CHUNK_TOKENS, estimate_tokens(body)):
+            return None
+        body = _truncate(body, remaining)
+    return header + body
+
+
+def format_chunks(chunks: Iterable[RetrievedChunk], fmt: str = FORMAT_FULL,
+                  token_budget: int = 0) -> str:
+    """把片段格式化为工具输出；超过 token 预算的部分被截断或省略"""
+    chunks = list(chunks)
+    if not chunks:
+        return "qrent_knowledge_base 中没有找到相关内容。"
+
+    compact = fmt == FORMAT_COMPACT
+    separator = "\n" if compact else "\n\n"
+    blocks: List[str] = []
+    used = 0
+    for position, chunk in enumerate(chunks, start=1):
+        block = _block(position, chunk, compact, token_budget - used if token_budget else None)
+        if block is None:
+            break
+        used += estimate_tokens(block)
+        blocks.append(block)
+
+    omitted = len(chunks) - len(blocks)
+    if omitted:
+        blocks.append(f"（另有 {omitted} 条结果因长度限制省略）")
+    return separator.join(blocks)
+
+
+def format_grouped(queries: Sequence[str], results: Sequence[Sequence[RetrievedChunk]],
+                   fmt: str = FORMAT_FULL, token_budget: int = 0) -> str:
+    """
+    多个查询的结果按查询分组输出。片段全局编号，多个查询检索到的同一片段只输出一次，
+    之后的查询只引用编号；token 预算平均分给每个查询。
+    """
+    compact = fmt == FORMAT_COMPACT
+    separator = "\n" if compact else "\n\n"
+    group_budget = token_budget // len(queries) if token_budget and queries else 0
+    seen: Dict[str, int] = {}
+    sections: List[str] = []
+    for number, (query, chunks) in enumerate(zip(queries, results), start=1):
+        blocks: List[str] = []
+        references: List[int] = []
+        used = 0
+        omitted = 0
+        for chunk in chunks:
+            key = chunk.chunk_id or chunk.text
+            if key in seen:
+                references.append(seen[key])
+                continue
+            position = len(seen) + 1
+            block = _block(position, chunk, compact, group_budget - used if group_budget else None)
+            if block is None:
+                omitted += 1
+                continue
+            seen[key] = position
+            used += estimate_tokens(block)
+            blocks.append(block)
+
+        if references:
+            blocks.append("与前面查询相同的片段：" + "、".join(f"[{position}]" for position in references))
+        if not blocks:
+            blocks.append("qrent_knowledge_base 中没有找到相关内容。")
+        if omitted:
+            blocks.append(f"（另有 {omitted} 条结果因长度限制省略）")
+        sections.append(separator.join([f"## 查询 {number}：{query}"] + blocks))
+    return "\n\n".join(sections)
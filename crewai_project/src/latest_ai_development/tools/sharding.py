@@ -0,0 +1,230 @@
+"""
+按主题分片的知识库检索。
+
+知识库文档本来就按主题组织（租金与预算、租约与法律、看房与申请、入住与居住期、
+租房前期、常识资料），但所有片段都放在一个索引里，每次查询都要扫描全部向量。
+
+构建时片段按主题排序写入向量存储，每个主题占连续的一段行，``shards.json`` 记录每个主题的
+行范围和来源文件，``shard_centroids.npy`` 记录每个主题的中心向量。检索时先路由：
+
+- 关键词路由：查询中出现主题关键词（如"押金""bond"属于租约与法律）时只查这些主题；
+  英文关键词按整词匹配（"rent" 不会命中 "current"、"parent"）；
+- 中心向量路由：没有命中关键词时，选与查询向量最接近的主题；
+- 路由到部分主题时总是同时检索常识资料：其中的全流程攻略覆盖所有主题；
+- 路由结果不足 k 条或最高相关度低于阈值时，回退到检索全部主题。
+
+分片只是同一个内存映射矩阵上的行范围，不复制数据；每个主题可以单独重建
+（``build_knowledge_base.py --topic rent_budget``）。
+
+环境变量：
+- ``QRENT_RAG_ROUTER``：``hybrid``（默认，先关键词后中心向量）、``keyword``、``centroid`` 或 ``off``
+- ``QRENT_RAG_ROUTER_MIN_SCORE``：路由结果的最低相关度，低于它时回退到全部主题，默认 0.3
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from latest_ai_development.tools.retrieval import RetrievedChunk, tokenize
+
+logger = logging.getLogger(__name__)
+
+SHARDS_FILE = "shards.json"
+CENTROIDS_FILE = "shard_centroids.npy"
+
+ROUTER_HYBRID = "hybrid"
+ROUTER_KEYWORD = "keyword"
+ROUTER_CENTROID = "centroid"
+ROUTER_OFF = "off"
+
+# 中心向量路由时，与最接近的主题相差不超过这么多的主题也一起检索
+CENTROID_MARGIN = 0.05
+CENTROID_MAX_TOPICS = 2
+
+
+@dataclass(frozen=True)
+class Topic:
+    name: str
+    label: str
+    # 文件名中包含这些词时归入该主题
+    file_keywords: Tuple[str, ...]
+    # 查询中包含这些词（小写）时路由到该主题
+    query_keywords: Tuple[str, ...]
+
+
+GENERAL_TOPIC = "general"
+
+TOPICS: Tuple[Topic, ...] = (
+    Topic("rent_budget", "租金与预算", ("租金与预算",), (
+        "租金", "预算", "价格", "房租", "行情", "性价比", "pw", "每周", "rent", "budget", "price",
+        "zetland", "waterloo", "kensington", "kingsford", "randwick", "mascot", "redfern", "city",
+    )),
+    Topic("lease_law", "租约与法律", ("租约与法律",), (
+        "租约", "合同", "法律", "押金", "bond", "lease", "违约", "解约", "提前退租", "break", "纠纷",
+        "房东", "权利", "条款", "fair trading", "tribunal", "ncat",
+    )),
+    Topic("viewing_application", "看房与申请", ("看房与申请",), (
+        "看房", "申请", "inspection", "application", "材料", "递交", "推荐信", "流水", "资料", "offer",
+    )),
+    Topic("move_in", "入住与居住期", ("入住与居住期",), (
+        "入住", "居住", "维修", "水电", "账单", "网络", "condition report", "退房", "清洁", "邻居", "保险",
+    )),
+    Topic("pre_rental", "租房前期：信息与渠道", ("租房前期",), (
+        "渠道", "平台", "中介", "学生公寓", "realestate", "domain", "flatmates", "找房", "前期", "时间线",
+    )),
+    Topic(GENERAL_TOPIC, "常识资料", ("常识资料",), (
+        "常识", "注意事项", "攻略", "流程",
+    )),
+)
+TOPIC_ORDER = {topic.name: position for position, topic in enumerate(TOPICS)}
+
+
+def topic_for_file(rel: str) -> str:
+    """根据文件名判断主题；无法判断的文件（如全流程攻略 PDF）归入常识资料"""
+    name = Path(rel).name
+    for topic in TOPICS:
+        if any(keyword in name for keyword in topic.file_keywords):
+            return topic.name
+    return GENERAL_TOPIC
+
+
+def _words(text: str) -> List[str]:
+    """查询中的英文词；数字开头的词去掉数字（"600pw" -> "pw"）"""
+    words = []
+    for token in tokenize(text):
+        if token[0].isascii():
+            words.append(token.lstrip("0123456789") or token)
+    return words
+
+
+def _has_keyword(text: str, words: List[str], keyword: str) -> bool:
+    """中文关键词按子串匹配；英文关键词（可以是多个词）按整词匹配"""
+    if not keyword.isascii():
+        return keyword in text
+    parts = keyword.split()
+    return any(words[i:i + len(parts)] == parts for i in range(len(words) - len(parts) + 1))
+
+
+def keyword_topics(query: str) -> List[str]:
+    """查询中命中关键词的主题，按命中数从多到少"""
+    text = query.lower()
+    words = _words(text)
+    hits = []
+    for topic in TOPICS:
+        count = sum(1 for keyword in topic.query_keywords if _has_keyword(text, words, keyword))
+        if count:
+            hits.append((count, -TOPIC_ORDER[topic.name], topic.name))
+    return [name for _, _, name in sorted(hits, reverse=True)]
+
+
+def write_shards(directory: Path, chunks: Sequence[Dict[str, Any]], vectors: Sequence[Sequence[float]]) -> Dict[str, Any]:
+    """
+    根据片段的 ``topic`` 写入分片信息。调用方需要保证同一主题的片段是连续的
+    （与写入向量存储的顺序一致）。
+    """
+    directory = Path(directory)
+    shards: Dict[str, Dict[str, Any]] = {}
+    for row, chunk in enumerate(chunks):
+        shard = shards.setdefault(chunk["topic"], {"start": row, "end": row, "files": []})
+        if shard["end"] != row:
+            raise ValueError(f"主题 {chunk['topic']} 的片段不连续")
+        shard["end"] = row + 1
+        if chunk.get("file") and chunk["file"] not in shard["files"]:
+            shard["files"].append(chunk["file"])
+
+    names = list(shards)
+    matrix = np.asarray(vectors, dtype=np.float32)
+    centroids = []
+    for name in names:
+        centroid = matrix[shards[name]["start"]:shards[name]["end"]].mean(axis=0)
+        norm = np.linalg.norm(centroid)
+        centroids.append(centroid / norm if norm else centroid)
+    with open(directory / CENTROIDS_FILE, "wb") as f:
+        np.save(f, np.asarray(centroids, dtype=np.float32).reshape(len(names), -1))
+    info = {"topics": names, "shards": shards}
+    (directory / SHARDS_FILE).write_text(json.dumps(info, ensure_ascii=False, indent=2), encoding="utf-8")
+    return info
+
+
+class ShardRouter:
+    """在向量存储的主题分片上路由和检索"""
+
+    def __init__(self, directory: Path, router: str = ROUTER_HYBRID, min_score: float = 0.3):
+        info = json.loads((Path(directory) / SHARDS_FILE).read_text(encoding="utf-8"))
+        self.topics: List[str] = info["topics"]
+        self.shards: Dict[str, Dict[str, Any]] = info["shards"]
+        self.centroids = np.load(Path(directory) / CENTROIDS_FILE)
+        self.router = router
+        self.min_score = min_score
+        self._lock = threading.Lock()
+        self._counters = {"keyword": 0, "centroid": 0, "all": 0, "fallback": 0}
+
+    @classmethod
+    def open(cls, directory: Path) -> Optional["ShardRouter"]:
+        """知识库没有分片信息或路由关闭时返回 None"""
+        router = os.environ.get("QRENT_RAG_ROUTER", ROUTER_HYBRID).strip().lower()
+        if router == ROUTER_OFF or not (Path(directory) / SHARDS_FILE).exists():
+            return None
+        return cls(directory, router=router,
+                   min_score=float(os.environ.get("QRENT_RAG_ROUTER_MIN_SCORE", "0.3")))
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _with_general(self, topics: List[str]) -> List[str]:
+        """跨主题的常识资料（全流程攻略等）总是参与检索"""
+        if GENERAL_TOPIC in self.shards and GENERAL_TOPIC not in topics:
+            return topics + [GENERAL_TOPIC]
+        return topics
+
+    def route(self, query: str, query_vector: Optional[Sequence[float]] = None) -> Tuple[str, List[str]]:
+        """返回 (路由方式, 主题列表)；路由方式为 all 时检索全部主题"""
+        if self.router in (ROUTER_HYBRID, ROUTER_KEYWORD):
+            topics = [name for name in keyword_topics(query) if name in self.shards]
+            if topics:
+                return ROUTER_KEYWORD, self._with_general(topics)
+        if self.router in (ROUTER_HYBRID, ROUTER_CENTROID) and query_vector is not None and len(self.topics) > 1:
+            query = np.asarray(query_vector, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            scores = self.centroids @ (query / norm if norm else query)
+            order = np.argsort(-scores)[:CENTROID_MAX_TOPICS]
+            best = scores[order[0]]
+            topics = [self.topics[i] for i in order if scores[i] >= best - CENTROID_MARGIN]
+            return ROUTER_CENTROID, self._with_general(topics)
+        return "all", list(self.topics)
+
+    def search(self, store, query: str, query_vector: Sequence[float], k: int) -> List[RetrievedChunk]:
+        """只检索路由到的主题，结果不足或相关度过低时回退到全部主题"""
+        how, topics = self.route(query, query_vector)
+        if how != "all":
+            results = self._search_topics(store, topics, query_vector, k)
+            if len(results) >= min(k, len(store)) and results and results[0].score >= self.min_score:
+                self._count(how)
+                return results
+            self._count("fallback")
+        else:
+            self._count("all")
+        return store.search(query_vector, k)
+
+    def _search_topics(self, store, topics: List[str], query_vector, k: int) -> List[RetrievedChunk]:
+        results: List[RetrievedChunk] = []
+        for name in topics:
+            shard = self.shards[name]
+            results.extend(store.search(query_vector, k, shard["start"], shard["end"]))
+        results.sort(key=lambda chunk: chunk.score, reverse=True)
+        return results[:k]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        counters["shards"] = {name: shard["end"] - shard["start"] for name, shard in self.shards.items()}
+        return counters
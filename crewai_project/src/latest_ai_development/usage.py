@@ -0,0 +1,257 @@
+"""
+一次分析的 token 和耗时统计。
+
+调用方为每次分析创建一个 ``UsageRecorder``，用 ``use_recorder()`` 绑定到当前上下文
+（与取消令牌相同的方式）。记录来自两处：
+
+- ``MeteredLLM`` 包装智能体的 LLM，记录每次调用所属的智能体和任务、
+  提示词和输出的 token 数、耗时以及是否命中补全缓存；
+- 知识库检索工具通过 ``track_tool()`` 记录每次工具调用的耗时、输出 token 数和是否命中检索缓存。
+
+工具调用不知道自己属于哪个智能体，按同一线程中最近一次 LLM 调用归属
+（CrewAI 在同一个线程里先调用 LLM、再执行它选择的工具）。DAG 模式下异步任务在单独的线程中执行，
+``crew.ContextTask`` 把调用方的上下文（包括统计器）复制到这些线程，并用 ``use_task()`` 绑定任务名。
+
+token 数用 ``retrieval.estimate_tokens`` 估算：模型服务商返回的用量累计在共享的 LLM 实例上，
+并发分析时无法区分属于哪一次分析。
+"""
+
+from __future__ import annotations
+
+import contextlib
+import threading
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional
+
+from latest_ai_development.cancellation import check_cancelled
+from latest_ai_development.llm_cache import last_call_cached, wrapped_llm_class
+from latest_ai_development.tools.retrieval import estimate_tokens
+
+UNKNOWN = "unknown"
+
+_current_recorder: ContextVar[Optional["UsageRecorder"]] = ContextVar("qrent_usage_recorder", default=None)
+# 正在执行的任务名，由 crew.ContextTask 在任务执行期间绑定
+_current_task: ContextVar[Optional[str]] = ContextVar("qrent_usage_task", default=None)
+
+
+def _message_tokens(messages: Any) -> int:
+    if isinstance(messages, str):
+        return estimate_tokens(messages)
+    total = 0
+    for message in messages or []:
+        content = message.get("content") if isinstance(message, dict) else message
+        total += estimate_tokens(content if isinstance(content, str) else str(content or ""))
+    return total
+
+
+def _add(bucket: Dict[str, Any], **values: Any) -> None:
+    for key, value in values.items():
+        bucket[key] = bucket.get(key, 0) + value
+
+
+class UsageRecorder:
+    """
+    收集一次分析中的 LLM 调用和工具调用。
+
+    ``agent_names`` 把任务名映射到智能体名（如 ``data_compliance_task`` → ``data_compliance_agent``）；
+    ``current_task`` 在 CrewAI 没有传入任务信息时返回正在执行的任务名。
+    """
+
+    def __init__(self, agent_names: Optional[Dict[str, str]] = None, current_task=None):
+        self.agent_names = dict(agent_names or {})
+        self.current_task = current_task
+        self.started = time.perf_counter()
+        self.llm_calls: List[Dict[str, Any]] = []
+        self.tool_calls: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _offset(self, at: float) -> float:
+        return round(at - self.started, 4)
+
+    def _resolve(self, task: Optional[str], agent: Optional[str]):
+        task = task or _current_task.get()
+        if not task and self.current_task is not None:
+            try:
+                task = self.current_task()
+            except Exception:
+                task = None
+        task = task or UNKNOWN
+        return task, self.agent_names.get(task) or agent or UNKNOWN
+
+    def record_llm_call(self, started: float, finished: float, prompt_tokens: int, completion_tokens: int,
+                        model: Optional[str] = None, task: Optional[str] = None, agent: Optional[str] = None,
+                        cached: bool = False, error: Optional[str] = None) -> None:
+        task, agent = self._resolve(task, agent)
+        self._local.task, self._local.agent = task, agent
+        with self._lock:
+            self.llm_calls.append({
+                "agent": agent, "task": task, "model": model,
+                "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "seconds": round(finished - started, 4), "start": self._offset(started),
+                "end": self._offset(finished), "cached": cached, "error": error,
+            })
+
+    def record_tool_call(self, tool: str, started: float, finished: float, output_tokens: int = 0,
+                         cache_hit: bool = False, error: Optional[str] = None) -> None:
+        task = getattr(self._local, "task", None)
+        task, agent = self._resolve(task, getattr(self._local, "agent", None))
+        with self._lock:
+            self.tool_calls.append({
+                "tool": tool, "agent": agent, "task": task, "output_tokens": output_tokens,
+                "seconds": round(finished - started, 4), "start": self._offset(started),
+                "end": self._offset(finished), "cache_hit": cache_hit, "error": error,
+            })
+
+    def summary(self) -> Dict[str, Any]:
+        """按智能体、任务、工具汇总，并附上每次调用的明细"""
+        with self._lock:
+            llm_calls = [dict(call) for call in self.llm_calls]
+            tool_calls = [dict(call) for call in self.tool_calls]
+
+        totals: Dict[str, Any] = {}
+        agents: Dict[str, Dict[str, Any]] = {}
+        tasks: Dict[str, Dict[str, Any]] = {}
+        tools: Dict[str, Dict[str, Any]] = {}
+        spans: Dict[str, List[float]] = {}
+        for call in llm_calls:
+            values = dict(llm_calls=1, prompt_tokens=call["prompt_tokens"],
+                          completion_tokens=call["completion_tokens"], llm_seconds=call["seconds"],
+                          cached_llm_calls=int(call["cached"]))
+            for bucket in (totals, agents.setdefault(call["agent"], {}), tasks.setdefault(call["task"], {})):
+                _add(bucket, **values)
+            tasks[call["task"]]["agent"] = call["agent"]
+            spans.setdefault(call["task"], []).extend((call["start"], call["end"]))
+        for call in tool_calls:
+            values = dict(tool_calls=1, tool_seconds=call["seconds"], tool_output_tokens=call["output_tokens"])
+            for bucket in (totals, agents.setdefault(call["agent"], {}), tasks.setdefault(call["task"], {})):
+                _add(bucket, **values)
+            tasks[call["task"]].setdefault("agent", call["agent"])
+            _add(tools.setdefault(call["tool"], {}), calls=1, seconds=call["seconds"],
+                 output_tokens=call["output_tokens"], cache_hits=int(call["cache_hit"]),
+                 errors=int(bool(call["error"])))
+            spans.setdefault(call["task"], []).extend((call["start"], call["end"]))
+        # 任务耗时：第一次调用开始到最后一次调用结束
+        for name, points in spans.items():
+            tasks[name]["wall_seconds"] = round(max(points) - min(points), 4)
+        for bucket in [totals, *agents.values(), *tasks.values(), *tools.values()]:
+            for key, value in bucket.items():
+                if isinstance(value, float):
+                    bucket[key] = round(value, 4)
+
+        totals["wall_seconds"] = round(time.perf_counter() - self.started, 4)
+        return {
+            "tokens_estimated": True,
+            "totals": totals,
+            "agents": agents,
+            "tasks": tasks,
+            "tools": tools,
+            "llm_calls": llm_calls,
+            "tool_calls": tool_calls,
+        }
+
+
+def current_recorder() -> Optional[UsageRecorder]:
+    return _current_recorder.get()
+
+
+@contextlib.contextmanager
+def use_recorder(recorder: Optional[UsageRecorder]) -> Iterator[Optional[UsageRecorder]]:
+    """在 with 块内把统计器绑定到当前上下文"""
+    reset = _current_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current_recorder.reset(reset)
+
+
+@contextlib.contextmanager
+def use_task(name: Optional[str]) -> Iterator[None]:
+    """
+    在 with 块内把任务名绑定到当前上下文。
+
+    CrewAI 的部分 LLM 调用（超出最大迭代次数后的收尾、上下文过长时的摘要、输出格式转换）
+    不传入任务信息，DAG 模式下多个任务同时执行时也无法按进度推断，用这里绑定的任务名归属。
+    """
+    reset = _current_task.set(name)
+    try:
+        yield
+    finally:
+        _current_task.reset(reset)
+
+
+class ToolCall:
+    """``track_tool()`` 产生的记录，工具在返回前填写输出、是否命中缓存和（转成文本返回的）错误"""
+
+    def __init__(self):
+        self.output = ""
+        self.cache_hit = False
+        self.error: Optional[str] = None
+
+
+@contextlib.contextmanager
+def track_tool(name: str) -> Iterator[ToolCall]:
+    """记录一次工具调用；没有绑定统计器时只是一个空操作"""
+    call = ToolCall()
+    recorder = _current_recorder.get()
+    started = time.perf_counter()
+    error = None
+    try:
+        yield call
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        if recorder is not None:
+            recorder.record_tool_call(name, started, time.perf_counter(), estimate_tokens(call.output or ""),
+                                      call.cache_hit, error or call.error)
+
+
+def _name(obj: Any, *attributes: str) -> Optional[str]:
+    for attribute in attributes:
+        value = getattr(obj, attribute, None)
+        if isinstance(value, str) and value:
+            return value
+    return None
+
+
+@lru_cache(maxsize=None)
+def _metered_llm_class():
+    class MeteredLLM(wrapped_llm_class()):
+        """记录每次调用的 token 数和耗时，归属到 CrewAI 传入的任务和智能体"""
+
+        def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs):
+            # 关闭补全缓存时没有 CachedLLM 检查取消，这里在发出请求前检查
+            check_cancelled()
+            recorder = _current_recorder.get()
+            if recorder is None:
+                return super().call(messages, tools=tools, callbacks=callbacks,
+                                    available_functions=available_functions, **kwargs)
+            started = time.perf_counter()
+            response, error = None, None
+            try:
+                response = super().call(messages, tools=tools, callbacks=callbacks,
+                                        available_functions=available_functions, **kwargs)
+                return response
+            except Exception as e:
+                error = str(e)
+                raise
+            finally:
+                recorder.record_llm_call(
+                    started, time.perf_counter(),
+                    prompt_tokens=_message_tokens(messages),
+                    completion_tokens=estimate_tokens(response) if isinstance(response, str) else 0,
+                    model=self.model,
+                    task=_name(kwargs.get("from_task"), "name"),
+                    agent=_name(kwargs.get("from_agent"), "role"),
+                    cached=last_call_cached(),
+                    error=error,
+                )
+
+    return MeteredLLM
+
+
+def metered_llm(inner):
+    return _metered_llm_class()(inner)
@@ -4,6 +4,7 @@ import InvitationCodeValidator from "./InvitationCodeValidator";
 import ChatbotInterface from "./ChatBotInterface";
 import AnalysisPanel from "./components/AnalysisPanel";
 import axios from "axios";
+import { subscribeAnalysis } from "./utils/analysisStream";
 
 export default function App() {
   const [loading, setLoading] = useState(false);
@@ -12,6 +13,9 @@ export default function App() {
   const [remainingUses, setRemainingUses] = useState(0);
   const [analysisResult, setAnalysisResult] = useState(null);
   const [submissionInfo, setSubmissionInfo] = useState(null);
+  // 分析进度只在这里订阅一次，最新的进度条目和连接错误传给聊天界面展示
+  const [analysisProgress, setAnalysisProgress] = useState(null);
+  const [streamError, setStreamError] = useState(null);
 
   const handleInvitationValid = (code, remaining) => {
     setInvitationCode(code);
@@ -33,6 +37,8 @@ export default function App() {
     setLoading(true);
     setAnalysisResult(null);
     setSubmissionInfo(null);
+    setAnalysisProgress(null);
+    setStreamError(null);
 
     try {
       const reportResponse = await axios.post(
@@ -70,66 +76,50 @@ export default function App() {
         if (response.data.ok && response.data.analysis_id) {
           const analysisId = response.data.analysis_id;
           
-          // 在后台继续处理结果查询，而不是阻塞前端
-          setTimeout(async () => {
-            try {
-              // 定期检查结果是否准备好
-              const resultCheckInterval = setInterval(async () => {
-                try {
-                  const resultResponse = await axios.get(
-                    `http://127.0.0.1:8000/survey/result/${analysisId}/`,
-                    {
-                      headers: { "Content-Type": "application/json" },
-                      withCredentials: true,
-                      timeout: 10000,
-                    }
-                  );
-                  
-                  if (resultResponse.data.ok) {
-                    // 正确处理嵌套的analysis对象
-                    const responseData = resultResponse.data;
-                    setAnalysisResult(responseData);
-                    setSubmissionInfo({
-                      filename: responseData.filename || (responseData.analysis && responseData.analysis.filename),
-                      path: responseData.path || (responseData.analysis && responseData.analysis.path),
-                      url: responseData.url || (responseData.analysis && responseData.analysis.url),
-                      remainingUses: reportResponse.data.remaining_uses,
-                    });
-                    clearInterval(resultCheckInterval);
-                    setLoading(false);
-                  } else if (resultResponse.data.error || (resultResponse.data.analysis && resultResponse.data.analysis.error)) {
-                    setAnalysisResult({ 
-                      ok: false, 
-                      error: resultResponse.data.error || 
-                             (resultResponse.data.analysis && resultResponse.data.analysis.error) 
-                    });
-                    clearInterval(resultCheckInterval);
-                    setLoading(false);
-                  }
-                } catch (resultError) {
-                  // 忽略单个请求错误，继续检查
-                  console.warn("检查结果时出错，将继续尝试", resultError);
-                }
-              }, 5000); // 每5秒检查一次
-              
-              // 设置最大检查时间（30分钟）
-              setTimeout(() => {
-                clearInterval(resultCheckInterval);
-                // 使用函数式更新确保获取最新状态
-                setLoading(prevLoading => {
-                  if (prevLoading) {
-                    setAnalysisResult({ ok: false, error: "AI分析超时，请稍后手动查询结果" });
-                  }
-                  return false;
+          // 通过事件流接收进度和最终结果，分析结束的瞬间即可拿到，不再定时轮询
+          let timeoutId = null;
+          const unsubscribe = subscribeAnalysis(analysisId, {
+            onProgress: (entry) => {
+              setAnalysisProgress(entry);
+            },
+            onResult: (responseData) => {
+              clearTimeout(timeoutId);
+              if (responseData.ok) {
+                // 正确处理嵌套的analysis对象
+                setAnalysisResult(responseData);
+                setSubmissionInfo({
+                  filename: response.data.filename,
+                  path: response.data.path,
+                  url: responseData.url || (responseData.analysis && responseData.analysis.url),
+                  remainingUses: reportResponse.data.remaining_uses,
                 });
-              }, 1800000);
-            } catch (backgroundError) {
-              console.error("后台处理结果时出错", backgroundError);
+              } else {
+                setAnalysisResult({
+                  ok: false,
+                  error: responseData.error ||
+                         (responseData.analysis && responseData.analysis.error)
+                });
+              }
               setLoading(false);
-            }
-          }, 1000);
+            },
+            onError: (error) => {
+              console.warn("分析进度连接中断", error);
+              setStreamError(error);
+            },
+          });
+
+          // 设置最大等待时间（30分钟）
+          timeoutId = setTimeout(() => {
+            unsubscribe();
+            // 使用函数式更新确保获取最新状态
+            setLoading(prevLoading => {
+              if (prevLoading) {
+                setAnalysisResult({ ok: false, error: "AI分析超时，请稍后手动查询结果" });
+              }
+              return false;
+            });
+          }, 1800000);
           
-          // 返回analysisId，让前端可以开始轮询进度
           return analysisId;
         } else {
           throw new Error(response.data.error || "无法获取分析ID");
@@ -227,6 +217,8 @@ export default function App() {
             <ChatbotInterface
               onSubmit={handleSubmit}
               analysisResult={analysisResult}
+              analysisProgress={analysisProgress}
+              streamError={streamError}
             />
             <AnalysisPanel
               result={analysisResult}
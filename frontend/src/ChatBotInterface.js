@@ -7,7 +7,7 @@ import TypingIndicator from './components/TypingIndicator';
 import ChatInput from './components/ChatInput';
 import './chatBot.css';
 
-export default function ChatbotInterface({ onSubmit, analysisResult }) {
+export default function ChatbotInterface({ onSubmit, analysisResult, analysisProgress, streamError }) {
     const [conversations] = useState([
         { id: 1, title: '租房需求咨询 - 2024/11/01', active: true },
       ]);
@@ -20,6 +20,7 @@ export default function ChatbotInterface({ onSubmit, analysisResult }) {
   const [formData, setFormData] = useState({});
   const messagesEndRef = useRef(null);
   const analysisResultRef = useRef(null);
+  const progressMessageIdRef = useRef(null);
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
   };
@@ -158,66 +159,15 @@ export default function ChatbotInterface({ onSubmit, analysisResult }) {
         
         // 添加进度显示消息
         const progressMessageId = Date.now();
+        progressMessageIdRef.current = progressMessageId;
         addBotMessage('AI分析正在进行中...', null, null, progressMessageId);
         
-        // 发送请求并跟踪进度
+        // 发送请求；进度由父组件订阅后通过 analysisProgress 传入
         if (onSubmit) {
-          // 提交数据并获取analysisId
           onSubmit(formData)
-            .then(analysisId => {
-              // 定期查询进度
-              const progressInterval = setInterval(() => {
-                // 查询进度的API调用
-                fetch(`/survey/progress/${analysisId}/`)
-                  .then(response => response.json())
-                  .then(data => {
-                    if (data && data.stage) {
-                      // 更新进度消息 - 使用content属性
-                      updateProgressMessage(progressMessageId, `AI分析正在进行中...\n当前阶段：${data.stage}\n进度：${data.percentage || 0}%`);
-                      
-                      // 检查是否完成
-                      if (data.completed) {
-                        clearInterval(progressInterval);
-                        // 获取最终结果
-                        fetch(`/survey/result/${analysisId}/`)
-                          .then(response => response.json())
-                          .then(result => {
-                            if (result && result.ok) {
-                              // 使用content属性传递消息内容
-                              addBotMessage(`AI分析完成：\n${result.summary || '分析完成，请查看右侧报告。'}`);
-                            } else {
-                              // 使用content属性传递消息内容
-                              addBotMessage(`AI分析失败：${result.error || '未知错误'}`);
-                            }
-                          })
-                          .catch(error => {
-                            // 使用content属性传递消息内容
-                            addBotMessage(`获取分析结果失败：${error.message}`);
-                            clearInterval(progressInterval);
-                          });
-                      }
-                    }
-                  })
-                  .catch(error => {
-                    console.error('获取进度失败:', error);
-                    // 只在发生严重错误时停止轮询
-                    if (error.message.includes('Network')) {
-                      clearInterval(progressInterval);
-                      // 使用content属性传递消息内容
-                      addBotMessage('网络错误：无法获取分析进度，请稍后重试。');
-                    }
-                  });
-              }, 2000); // 每2秒查询一次进度
-              
-              // 防止无限轮询的安全措施（最多查询30分钟）
-              setTimeout(() => {
-                clearInterval(progressInterval);
-                // 如果分析仍在进行中，提供手动查询选项
-                addBotMessage('分析时间较长，您可以稍后再次发起查询。');
-              }, 1800000);
-            })
             .catch(error => {
               console.error('提交失败:', error);
+              progressMessageIdRef.current = null;
               // 使用content属性更新消息内容
               updateProgressMessage(progressMessageId, `提交失败：${error.message}\n请稍后重试。`);
             });
@@ -256,10 +206,27 @@ export default function ChatbotInterface({ onSubmit, analysisResult }) {
     addBotMessage(firstQ.botMessage, firstQ.options, 'university');
   };
 
+  // 每收到一条进度立即更新进度消息
+  useEffect(() => {
+    if (!analysisProgress || !progressMessageIdRef.current) return;
+    const percentage = Math.round((analysisProgress.progress || 0) * 100);
+    updateProgressMessage(progressMessageIdRef.current, `AI分析正在进行中...\n当前阶段：${analysisProgress.message || analysisProgress.stage}\n进度：${percentage}%`);
+  }, [analysisProgress]);
+
+  useEffect(() => {
+    if (!streamError) return;
+    console.error('获取进度失败:', streamError);
+    addBotMessage('网络错误：无法获取分析进度，请稍后重试。');
+  }, [streamError]);
+
   useEffect(() => {
     if (!analysisResult) return;
     if (analysisResultRef.current === analysisResult) return;
     analysisResultRef.current = analysisResult;
+    if (progressMessageIdRef.current) {
+      updateProgressMessage(progressMessageIdRef.current, 'AI分析已结束');
+      progressMessageIdRef.current = null;
+    }
 
     if (analysisResult.ok) {
       const summaryText = analysisResult.summary
@@ -0,0 +1,75 @@
+// 订阅后端的分析进度事件流（Server-Sent Events）
+// 后端每产生一条进度就立即推送，分析结束时推送最终结果；
+// 浏览器不支持 EventSource 时退回到定时轮询进度/结果接口。
+
+export const API_BASE = 'http://127.0.0.1:8000';
+
+const POLL_INTERVAL_MS = 2000;
+
+function pollAnalysis(analysisId, { onProgress, onResult, onError }) {
+  let stopped = false;
+  let lastCount = 0;
+
+  const tick = async () => {
+    if (stopped) return;
+    try {
+      const progressRes = await fetch(`${API_BASE}/progress/${analysisId}/`);
+      const progress = await progressRes.json();
+      const details = progress.details || [];
+      details.slice(lastCount).forEach((entry) => onProgress && onProgress(entry));
+      lastCount = details.length;
+
+      if (!progress.in_progress) {
+        const resultRes = await fetch(`${API_BASE}/result/${analysisId}/`);
+        const result = await resultRes.json();
+        if (result.analysis && result.analysis.status !== 'processing') {
+          stopped = true;
+          onResult && onResult(result);
+          return;
+        }
+      }
+    } catch (error) {
+      onError && onError(error);
+    }
+    setTimeout(tick, POLL_INTERVAL_MS);
+  };
+
+  tick();
+  return () => {
+    stopped = true;
+  };
+}
+
+/**
+ * 订阅分析进度，返回取消订阅的函数。
+ * onProgress(entry) 收到每条进度；onResult(result) 收到最终结果（与结果接口的响应体相同）。
+ */
+export function subscribeAnalysis(analysisId, handlers) {
+  if (typeof window === 'undefined' || !window.EventSource) {
+    return pollAnalysis(analysisId, handlers);
+  }
+
+  const { onProgress, onResult, onError } = handlers;
+  const source = new EventSource(`${API_BASE}/stream/${analysisId}/`);
+  let finished = false;
+
+  source.addEventListener('progress', (event) => {
+    onProgress && onProgress(JSON.parse(event.data));
+  });
+  source.addEventListener('result', (event) => {
+    finished = true;
+    source.close();
+    onResult && onResult(JSON.parse(event.data));
+  });
+  // EventSource 断线后会带着 Last-Event-ID 自动重连，这里只上报错误
+  source.onerror = (error) => {
+    if (!finished && source.readyState === EventSource.CLOSED) {
+      onError && onError(error);
+    }
+  };
+
+  return () => {
+    finished = true;
+    source.close();
+  };
+}